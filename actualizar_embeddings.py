@@ -1,57 +1,126 @@
 import os
+import time
 import numpy as np
-import pytesseract
-from pdf2image import convert_from_path
-from transformers import BertTokenizer, BertModel
-import torch
+from almacen_embeddings import AlmacenEmbeddings, rutas_almacen
+from indice_ann import IndiceIVF, ruta_indice_ann
+from cuantizacion_embeddings import AlmacenCuantizado, ruta_cuantizada
+from cache_consultas import incrementar_generacion
+from cache_texto import obtener_texto
+from modelos import DOCUMENTOS, obtener_modelo, registrar_modelo_almacen
+from metricas import medido
 
 # Ruta del archivo binario con los embeddings
 OUTPUT_PATH = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\embeddings_avanzado_test.npy'
 
-# Inicializar el modelo y tokenizador BETO
-tokenizador = BertTokenizer.from_pretrained('dccuchile/bert-base-spanish-wwm-uncased')
-modelo = BertModel.from_pretrained('dccuchile/bert-base-spanish-wwm-uncased')
-modelo.eval()
+# Pasajes: ventanas de tokens con solapamiento (510 + [CLS] y [SEP] = 512) codificadas en lotes
+VENTANA_TOKENS = 510
+SOLAPE_TOKENS = 128
+LOTE_PASAJES = 16
 
-# Función para cargar embeddings existentes
+# Función para cargar el almacén de embeddings (migra el diccionario pickle histórico si existe)
 def cargar_embeddings(output_path):
-    if os.path.exists(output_path):
-        return np.load(output_path, allow_pickle=True).item()
-    return {}
+    if not os.path.exists(rutas_almacen(output_path)[1]) and os.path.exists(output_path):
+        return AlmacenEmbeddings.desde_diccionario(output_path, np.load(output_path, allow_pickle=True).item())
+    return AlmacenEmbeddings(output_path)
 
-# Función para guardar embeddings actualizados
-def guardar_embeddings(output_path, embeddings_dict):
-    np.save(output_path, embeddings_dict)
+# Función para obtener la ruta del almacén de embeddings por pasaje
+def ruta_pasajes(output_path):
+    return os.path.splitext(output_path)[0] + '_pasajes.npy'
 
-# Función para extraer texto de un PDF
+# Función para extraer texto de un PDF (cache compartido con el índice invertido)
 def pdf_to_text(pdf_path):
-    images = convert_from_path(pdf_path, dpi=100)
-    text = ''
-    for image in images:
-        text += pytesseract.image_to_string(image)
+    text, tiempos = obtener_texto(pdf_path)
+    paginas_ocr = [tiempo for tiempo in tiempos if tiempo["metodo"] == "ocr"]
+    segundos_ocr = sum(tiempo["rasterizado_segundos"] + tiempo["ocr_segundos"] for tiempo in paginas_ocr)
+    print(f"[INFO] {len(tiempos)} páginas extraídas ({len(paginas_ocr)} con OCR, {segundos_ocr:.2f} s de OCR)")
     return text
 
 # Función para obtener embeddings de texto
 def obtener_embeddings(texto, modelo, tokenizador):
+    import torch  # Solo al codificar: importar este módulo no carga torch
     inputs = tokenizador(texto, return_tensors='pt', truncation=True, padding=True)
     with torch.no_grad():
         outputs = modelo(**inputs)
     return outputs.last_hidden_state.mean(dim=1).numpy()
 
+# Función para dividir un texto en ventanas de tokens solapadas
+def dividir_en_pasajes(texto, tokenizador, ventana=VENTANA_TOKENS, solape=SOLAPE_TOKENS):
+    ids = tokenizador(texto, add_special_tokens=False, verbose=False)['input_ids']
+    paso = ventana - solape
+    return [ids[inicio:inicio + ventana] for inicio in range(0, max(1, len(ids) - solape), paso)]
+
+# Función para codificar pasajes en lotes agrupados por longitud (menos relleno por lote)
+@medido('inferencia_pasajes')
+def codificar_pasajes(pasajes, modelo, tokenizador, lote=LOTE_PASAJES):
+    import torch
+    embeddings = np.zeros((len(pasajes), modelo.config.hidden_size), dtype=np.float32)
+    orden = sorted(range(len(pasajes)), key=lambda i: len(pasajes[i]))
+    for inicio in range(0, len(orden), lote):
+        indices = orden[inicio:inicio + lote]
+        secuencias = [[tokenizador.cls_token_id] + pasajes[i] + [tokenizador.sep_token_id] for i in indices]
+        largo = max(len(secuencia) for secuencia in secuencias)
+        input_ids = torch.tensor([secuencia + [tokenizador.pad_token_id] * (largo - len(secuencia)) for secuencia in secuencias])
+        mascara = torch.tensor([[1] * len(secuencia) + [0] * (largo - len(secuencia)) for secuencia in secuencias])
+        with torch.no_grad():
+            outputs = modelo(input_ids=input_ids, attention_mask=mascara)
+        mascara = mascara.unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        promedio = (outputs.last_hidden_state * mascara).sum(dim=1) / mascara.sum(dim=1)
+        embeddings[indices] = promedio.numpy()
+    return embeddings
+
+# Función para calcular los embeddings de un texto: (embeddings por pasaje, embedding del documento)
+def calcular_embeddings(text):
+    # Codificar el documento completo por pasajes; el embedding del documento es su promedio
+    tokenizador, modelo = obtener_modelo(DOCUMENTOS)  # BETO, cargado en el primer uso
+    inicio = time.perf_counter()
+    pasajes = dividir_en_pasajes(text, tokenizador)
+    embeddings_pasajes = codificar_pasajes(pasajes, modelo, tokenizador)
+    duracion = time.perf_counter() - inicio
+    print(f"[INFO] {len(pasajes)} pasajes codificados en {duracion:.2f} s ({len(pasajes) / duracion:.2f} pasajes/s)")
+    return embeddings_pasajes, embeddings_pasajes.mean(axis=0)
+
+# Función para guardar en un solo lote los embeddings de varios documentos.
+# Es idempotente por documento: los que ya están en un almacén no se vuelven a agregar a ese
+# almacén, así que reintentar un lote que falló a medias no duplica pasajes
+def guardar_embeddings(output_path, filenames, embeddings_pasajes, embeddings_documentos):
+    registrar_modelo_almacen(output_path)
+    almacen = cargar_embeddings(output_path)
+    pasajes = AlmacenEmbeddings(ruta_pasajes(output_path))
+    # Validar todo el lote antes de escribir en cualquiera de los dos almacenes
+    embeddings_pasajes = [np.asarray(embeddings, dtype=np.float32).reshape(-1, pasajes.dimension) for embeddings in embeddings_pasajes]
+    embeddings_documentos = [np.asarray(embedding, dtype=np.float32).reshape(almacen.dimension) for embedding in embeddings_documentos]
+    nuevos_pasajes = [(filename, embeddings) for filename, embeddings in zip(filenames, embeddings_pasajes) if filename not in pasajes]
+    if nuevos_pasajes:
+        pasajes.agregar_lote(
+            [filename for filename, embeddings in nuevos_pasajes for _ in range(len(embeddings))],
+            np.vstack([embeddings for _, embeddings in nuevos_pasajes])
+        )
+    nuevos_documentos = [(filename, embedding) for filename, embedding in zip(filenames, embeddings_documentos) if filename not in almacen]
+    if nuevos_documentos:
+        almacen.agregar_lote([filename for filename, _ in nuevos_documentos], np.vstack([embedding for _, embedding in nuevos_documentos]))
+    # Insertar en los índices aproximados y en las matrices cuantizadas (de documentos y de pasajes)
+    # si fueron construidos; solo este escritor los persiste, los lectores los sincronizan en memoria
+    for almacen_ann, ruta in ((almacen, output_path), (pasajes, ruta_pasajes(output_path))):
+        if os.path.exists(ruta_indice_ann(ruta)):
+            IndiceIVF.cargar(almacen_ann, ruta_indice_ann(ruta)).guardar()
+        for tipo in ('int8', 'float16'):
+            if os.path.exists(ruta_cuantizada(ruta, tipo)):
+                AlmacenCuantizado(almacen_ann, ruta_cuantizada(ruta, tipo), tipo).guardar()
+    incrementar_generacion(almacen.ruta_matriz)
+
 # Función principal para actualizar embeddings
 def actualizar_embeddings(pdf_path, filename, output_path):
-    embeddings_dict = cargar_embeddings(output_path)
+    almacen = cargar_embeddings(output_path)
     
-    if filename in embeddings_dict:
+    if filename in almacen:
         print(f"El embedding para {filename} ya existe. No se realizará ninguna actualización.")
         return
     
     text = pdf_to_text(pdf_path)
     
     if text.strip():
-        embedding = obtener_embeddings(text, modelo, tokenizador)
-        embeddings_dict[filename] = embedding
-        guardar_embeddings(output_path, embeddings_dict)
+        embeddings_pasajes, embedding_documento = calcular_embeddings(text)
+        guardar_embeddings(output_path, [filename], [embeddings_pasajes], [embedding_documento])
         print(f"Embeddings actualizados y guardados para {filename}")
     else:
-        print(f"Advertencia: No se pudo extraer texto del archivo {filename}")
\ No newline at end of file
+        print(f"Advertencia: No se pudo extraer texto del archivo {filename}")
@@ -1,69 +1,226 @@
+import atexit
 import json
 import os
-from nltk.corpus import stopwords
-from config_db import collection  # Importar colección desde config_db
+import re
+import time
+from collections import Counter
+from threading import Lock
+from config_db import obtener_almacen  # Almacenamiento de postings configurado en config_db
+from analizador import PALABRAS_VACIAS, analizar
+from cache_consultas import incrementar_generacion
+from segmento_indice import SegmentoIndice, escribir_segmento, existe_segmento, fusionar_segmento, ruta_segmento, ruta_vigente
+from matriz_tfidf import extender_tfidf
+from metadatos_documentos import obtener_metadatos
+from metricas import medir
 
 # Ruta del archivo JSON del índice invertido
 JSON_PATH = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\indice_invertido_con_stopwords_normalizados_avanzado_test.json'
-stop_words = set(stopwords.words('spanish'))
+stop_words = PALABRAS_VACIAS
 
-# Función para cargar el índice invertido desde un archivo JSON
+# Umbrales de vaciado del escritor del índice
+MAX_DOCUMENTOS_BUFFER = 200
+MAX_SEGUNDOS_BUFFER = 60
+
+# Guardar las posiciones de los términos (consultas de frase y NEAR/k)
+INDICE_POSICIONAL = True
+
+# Función para cargar el índice invertido desde el segmento binario (o el JSON histórico)
 def cargar_indice(json_path):
     #print(f"[DEBUG] Cargando índice desde {json_path}")
+    if existe_segmento(ruta_segmento(json_path)):
+        with SegmentoIndice(ruta_segmento(json_path)) as segmento:
+            return segmento.como_diccionario()
     if os.path.exists(json_path):
         with open(json_path, 'r', encoding='utf-8') as file:
             return json.load(file)
     #print("[DEBUG] No se encontró un índice existente. Creando uno nuevo.")
     return {}
 
-# Función para guardar el índice invertido en un archivo JSON
+# Función para guardar el índice invertido como segmento binario junto a la ruta del JSON
 def guardar_indice(json_path, indice_invertido):
-    #print(f"[DEBUG] Guardando índice en {json_path}")
-    with open(json_path, 'w', encoding='utf-8') as file:
-        json.dump(indice_invertido, file, ensure_ascii=False, indent=4)
+    #print(f"[DEBUG] Guardando índice en {ruta_segmento(json_path)}")
+    escribir_segmento(ruta_segmento(json_path), indice_invertido)
+
+# Función para extraer los términos de un texto con el analizador compartido con las consultas
+def extraer_palabras(texto):
+    return analizar(texto)
 
-# Función para extraer información de norma y año
+# Función para extraer información de norma y año (None, None si el nombre no sigue el formato de los decretos)
 def extract_norma_number_and_year(filename):
-    #print(f"[DEBUG] Extrayendo norma y año de {filename}")
-    parts = filename.split('_')
-    norma_number = parts[2]
-    year = parts[-1].split('.')[0]
-    #print(f"[DEBUG] Norma: {norma_number}, Año: {year}")
-    return norma_number, year
-
-# Función para actualizar el índice invertido
+    match = re.search(r'Decreto_Nº_(\d+)_del_(\d{4})', filename)
+    if match:
+        return match.group(1), match.group(2)
+    return None, None
+
+class EscritorIndice:
+    """
+    Escritor incremental del índice invertido.
+    Acumula documentos en memoria y los vacía como un solo lote cuando se alcanza el umbral
+    de tamaño o de tiempo: una fusión del segmento, una escritura atómica del archivo y un
+    único lote de escrituras en el almacenamiento de postings por vaciado.
+    """
+
+    def __init__(self, json_path: str, max_documentos: int = MAX_DOCUMENTOS_BUFFER, max_segundos: float = MAX_SEGUNDOS_BUFFER,
+                 posicional: bool = INDICE_POSICIONAL):
+        self.json_path = json_path
+        self.posicional = posicional
+        self.ruta = ruta_segmento(json_path)
+        self.max_documentos = max_documentos
+        self.max_segundos = max_segundos
+        self._buffer = []
+        self._pendientes = set()
+        self._indexados = None
+        self._sin_almacenar = []
+        self.descartados = []
+        self._ultimo_vaciado = time.time()
+        self._lock = Lock()
+
+    def _documentos_indexados(self):
+        """Conjunto de documentos ya presentes en el segmento (se carga una sola vez)."""
+        if self._indexados is None:
+            if not existe_segmento(self.ruta) and os.path.exists(self.json_path):
+                # Migrar el índice JSON histórico al segmento binario
+                escribir_segmento(self.ruta, cargar_indice(self.json_path))
+            if existe_segmento(self.ruta):
+                with SegmentoIndice(self.ruta) as segmento:
+                    self._indexados = set(segmento.nombres_documentos())
+            else:
+                self._indexados = set()
+        return self._indexados
+
+    def agregar(self, filename, words):
+        """
+        Agregar un documento al buffer. Retorna False si el documento ya estaba indexado.
+        `words` son los términos del analizador (extraer_palabras), igual que en la construcción
+        completa. Un documento inválido se rechaza con ValueError antes de entrar al buffer.
+        """
+        if not isinstance(filename, str) or not filename.strip():
+            raise ValueError(f"Nombre de documento inválido: {filename!r}")
+        if any(not isinstance(item, str) for item in words):
+            raise ValueError(f"Los términos de {filename} deben ser cadenas")
+        with self._lock:
+            if filename in self._documentos_indexados() or filename in self._pendientes:
+                return False
+            # Ya vienen sin palabras vacías y reducidos a su raíz: no se vuelven a filtrar, y la longitud
+            # del documento (para BM25 y el tf) es la cantidad de términos indexados, como en la construcción completa
+            terminos = list(words)
+            posiciones = {}
+            if self.posicional:
+                for posicion, item in enumerate(terminos):
+                    posiciones.setdefault(item, []).append(posicion)
+            norma_number, year = extract_norma_number_and_year(filename)
+            metadatos = {"documento": filename, "numero_norma": norma_number, "fecha": year, "estado": "activo"}
+            self._buffer.append((filename, metadatos, Counter(terminos), len(terminos), posiciones))
+            self._pendientes.add(filename)
+            if len(self._buffer) >= self.max_documentos or time.time() - self._ultimo_vaciado >= self.max_segundos:
+                self._vaciar()
+            return True
+
+    def vaciar(self):
+        """Escribir los documentos pendientes en el segmento y en MongoDB."""
+        with self._lock:
+            self._vaciar()
+
+    def _documentos_en_segmento(self):
+        """
+        Cantidad de documentos del segmento en disco. Si no coincide con el conjunto en memoria
+        (p. ej. un vaciado anterior escribió el segmento y falló después), el conjunto se vuelve a leer.
+        """
+        indexados = self._documentos_indexados()
+        if not existe_segmento(self.ruta):
+            return 0
+        with SegmentoIndice(self.ruta) as segmento:
+            if segmento.n_documentos != len(indexados):
+                indexados.clear()
+                indexados.update(segmento.nombres_documentos())
+            return segmento.n_documentos
+
+    def _escribir_almacenes(self):
+        """
+        Escribir en el almacenamiento de postings y en la tabla de metadatos los lotes ya
+        confirmados en el segmento. Si falla, el lote queda pendiente para el próximo vaciado
+        (las dos escrituras son idempotentes).
+        """
+        while self._sin_almacenar:
+            metadatos, postings = self._sin_almacenar[0]
+            try:
+                obtener_almacen().agregar(metadatos, postings)
+                with medir('escritura_metadatos'):
+                    obtener_metadatos(self.json_path).agregar_lote(metadatos)
+            except Exception as e:
+                print(f"[ERROR] No se pudieron guardar {len(metadatos)} documentos en el almacenamiento; se reintentará en el próximo vaciado: {e}")
+                return
+            self._sin_almacenar.pop(0)
+
+    def _vaciar(self):
+        self._ultimo_vaciado = time.time()
+        self._escribir_almacenes()
+        if not self._buffer:
+            return
+
+        # Los doc_id siguen a los del segmento en disco, y los documentos que ya están en él no se vuelven a agregar
+        primer_id = self._documentos_en_segmento()
+        indexados = self._documentos_indexados()
+        lote = []
+        documentos_nuevos = []
+        postings_nuevos = {}
+        posiciones_nuevas = {} if self.posicional else None
+        metadatos_almacen = []
+        postings_almacen = {}
+        for filename, metadatos, frecuencias, total, posiciones in self._buffer:
+            if filename in indexados:
+                continue
+            try:
+                doc_id = primer_id + len(lote)
+                postings_documento = [(item, cantidad / total) for item, cantidad in frecuencias.items()]
+                posiciones_documento = [posiciones[item] for item in frecuencias] if posiciones_nuevas is not None else None
+            except Exception as e:
+                # Un documento que no se puede preparar se descarta solo; el resto del lote sigue
+                print(f"[ERROR] Documento descartado del índice: {filename}: {e}")
+                self.descartados.append({"documento": filename, "error": str(e), "instante": time.time()})
+                continue
+            lote.append(filename)
+            documentos_nuevos.append((metadatos, total))
+            metadatos_almacen.append(metadatos)
+            for j, (item, tf) in enumerate(postings_documento):
+                postings_nuevos.setdefault(item, []).append((doc_id, tf))
+                if posiciones_documento is not None:
+                    posiciones_nuevas.setdefault(item, []).append(posiciones_documento[j])
+                postings_almacen.setdefault(item, []).append((filename, tf))
+
+        if lote:
+            anterior = ruta_vigente(self.ruta)
+            with medir('escritura_segmento'):
+                fusionar_segmento(self.ruta, documentos_nuevos, postings_nuevos, posiciones_nuevas)
+
+        # Con el segmento escrito el lote queda confirmado, aunque fallen los almacenamientos secundarios
+        indexados.update(lote)
+        self._buffer = []
+        self._pendientes.clear()
+        if lote:
+            incrementar_generacion(self.ruta)
+            print(f"[INFO] Índice invertido actualizado con {len(lote)} documentos")
+            # La matriz TF-IDF solo recibe las filas del lote (no se reconstruye el corpus por vaciado)
+            try:
+                extender_tfidf(self.ruta, anterior, postings_nuevos)
+            except Exception as e:
+                print(f"[ERROR] No se pudo actualizar la matriz TF-IDF; las consultas la reconstruirán en segundo plano: {e}")
+            self._sin_almacenar.append((metadatos_almacen, postings_almacen))
+            self._escribir_almacenes()
+
+
+_escritores = {}
+_escritores_lock = Lock()
+
+# Función para obtener el escritor compartido de un índice
+def obtener_escritor(json_path):
+    with _escritores_lock:
+        if json_path not in _escritores:
+            escritor = EscritorIndice(json_path)
+            atexit.register(escritor.vaciar)
+            _escritores[json_path] = escritor
+        return _escritores[json_path]
+
+# Función para actualizar el índice invertido (el documento queda en el buffer del escritor)
 def actualizar_indice_invertido(filename, words, json_path):
-    #print(f"[DEBUG] Entrando en actualizar_indice_invertido para {filename}")
-    #print(f"[DEBUG] Tipo de 'collection' al entrar: {type(collection)}")
-    indice_invertido = cargar_indice(json_path)
-    #print(f"[DEBUG] Índice cargado. Total de términos: {len(indice_invertido)}")
-
-    for item in words:
-        if item not in stop_words and item.strip():
-            #print(f"[DEBUG] Procesando término: {item}")
-            if item not in indice_invertido:
-                #print(f"[DEBUG] Añadiendo nuevo término al índice: {item}")
-                indice_invertido[item] = []
-            
-            if not any(doc.get('documento') == filename for doc in indice_invertido[item]):
-                norma_number, year = extract_norma_number_and_year(filename)
-                doc_entry = {
-                    "documento": filename,
-                    "numero_norma": norma_number,
-                    "tf": words.count(item) / len(words),
-                    "fecha": year,
-                    "estado": "activo"
-                }
-                indice_invertido[item].append(doc_entry)
-                #print(f"[DEBUG] Documento añadido al índice para término: {item}")
-
-                # Actualizar MongoDB
-                collection.update_one(
-                    {"word": item},
-                    {"$addToSet": {"documents": doc_entry}},
-                    upsert=True
-                )
-                #print(f"[DEBUG] MongoDB actualizado para término: {item}")
-    
-    guardar_indice(json_path, indice_invertido)
-   # print(f"[DEBUG] Índice invertido actualizado para {filename}")
+    return obtener_escritor(json_path).agregar(filename, words)
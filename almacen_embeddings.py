@@ -0,0 +1,257 @@
+import os
+import re
+import struct
+import numpy as np
+
+# Almacén de embeddings como matriz contigua float32 (N, DIMENSION) de filas normalizadas,
+# guardada en formato .npy para poder abrirla con np.load(mmap_mode='r'), y un archivo de
+# texto paralelo con el id de documento de cada fila.
+# La matriz vive en un archivo con capacidad reservada (`<base>_matriz_<capacidad>.npy`, la
+# cabecera declara la capacidad) y las filas válidas son las que tienen id. Agregar filas las
+# escribe en el espacio reservado sin cambiar el tamaño del archivo, así que funciona aunque
+# otro lector lo tenga mapeado (en Windows no se puede extender ni truncar un archivo con una
+# vista mapeada). Cuando la capacidad se agota se crea un archivo nuevo del doble de capacidad
+# con una copia de las filas; los anteriores se eliminan cuando ningún lector los usa.
+
+DIMENSION = 768
+TAMANO_CABECERA = 128  # Cabecera .npy de tamaño fijo
+CAPACIDAD_MINIMA = 1024
+FILAS_POR_COPIA = 65536
+
+
+def rutas_almacen(ruta_embeddings):
+    """Rutas de la matriz y de los ids asociadas a la ruta histórica del archivo de embeddings."""
+    base = os.path.splitext(ruta_embeddings)[0]
+    return base + '_matriz.npy', base + '_ids.txt'
+
+
+def ruta_capacidad(ruta_matriz, capacidad):
+    """Archivo de la matriz con espacio reservado para `capacidad` filas."""
+    return f"{os.path.splitext(ruta_matriz)[0]}_{capacidad}.npy"
+
+
+def _archivos_capacidad(ruta_matriz):
+    """Lista ordenada de (capacidad, ruta) de los archivos de la matriz con capacidad reservada."""
+    directorio = os.path.dirname(ruta_matriz) or '.'
+    patron = re.compile(re.escape(os.path.basename(os.path.splitext(ruta_matriz)[0])) + r'_(\d+)\.npy$')
+    archivos = []
+    for nombre in os.listdir(directorio) if os.path.isdir(directorio) else []:
+        coincidencia = patron.match(nombre)
+        if coincidencia:
+            archivos.append((int(coincidencia.group(1)), os.path.join(directorio, nombre)))
+    return sorted(archivos)
+
+
+def _cabecera_npy(filas, dimension):
+    """Cabecera .npy (versión 1.0) de largo fijo para una matriz float32 de `filas` x `dimension`."""
+    descripcion = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (filas, dimension)
+    largo = TAMANO_CABECERA - 10
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', largo) + descripcion.encode('latin1').ljust(largo - 1) + b'\n'
+
+
+def normalizar(vectores):
+    """Convertir a float32 y normalizar por fila (las filas nulas quedan en cero)."""
+    vectores = np.atleast_2d(np.asarray(vectores, dtype=np.float32))
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vectores / normas
+
+
+class AlmacenEmbeddings:
+    """Matriz de embeddings normalizados con búsqueda top-k vectorizada."""
+
+    def __init__(self, ruta_embeddings: str, dimension: int = DIMENSION):
+        self.ruta_matriz, self.ruta_ids = rutas_almacen(ruta_embeddings)
+        self.dimension = dimension
+        self.ids = []
+        if os.path.exists(self.ruta_ids):
+            with open(self.ruta_ids, 'r', encoding='utf-8') as archivo:
+                self.ids = [linea.rstrip('\n') for linea in archivo]
+        self._matriz = None
+        self._ruta_datos = None
+        self._capacidad = 0
+        self._filas = {}
+        self._cargar()
+
+    def _ruta_vigente(self):
+        """Archivo con la mayor capacidad, o la matriz sin capacidad reservada de versiones anteriores."""
+        archivos = _archivos_capacidad(self.ruta_matriz)
+        if archivos:
+            return archivos[-1][1]
+        return self.ruta_matriz if os.path.exists(self.ruta_matriz) else None
+
+    def _cargar(self):
+        """Mapear la matriz en memoria (solo las filas con id registrado)."""
+        self._ruta_datos = self._ruta_vigente()
+        if self._ruta_datos is not None:
+            matriz = np.load(self._ruta_datos, mmap_mode='r')
+            self._capacidad = matriz.shape[0]
+            self.ids = self.ids[:matriz.shape[0]]
+            self._matriz = matriz[:len(self.ids)]
+        else:
+            self._capacidad = 0
+            self.ids = []
+            self._matriz = np.empty((0, self.dimension), dtype=np.float32)
+        self._filas = {doc_id: fila for fila, doc_id in enumerate(self.ids)}
+        self._codigos = None
+
+    @property
+    def matriz(self):
+        return self._matriz
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._filas
+
+    def _documentos_por_fila(self):
+        """Documentos distintos y, para cada fila, el índice de su documento (para matrices de pasajes)."""
+        if self._codigos is None:
+            posiciones = {}
+            codigos = np.fromiter((posiciones.setdefault(doc_id, len(posiciones)) for doc_id in self.ids), dtype=np.int64, count=len(self.ids))
+            self._codigos = (list(posiciones), codigos)
+        return self._codigos
+
+    def vector(self, doc_id):
+        """Embedding normalizado del documento o None si no existe."""
+        fila = self._filas.get(doc_id)
+        return None if fila is None else self._matriz[fila]
+
+    def agregar_lote(self, ids, vectores):
+        """Agregar filas al final de la matriz sin reescribir las existentes."""
+        vectores = normalizar(vectores)
+        if vectores.shape != (len(ids), self.dimension):
+            raise ValueError(f"Se esperaban {len(ids)} vectores de dimensión {self.dimension}, se recibió {vectores.shape}")
+        filas = len(self.ids) + len(ids)
+        if filas > self._capacidad:
+            self._crecer(filas)
+        # Dentro del espacio reservado: el tamaño del archivo no cambia
+        with open(self._ruta_datos, 'r+b') as archivo:
+            archivo.seek(TAMANO_CABECERA + len(self.ids) * self.dimension * 4)
+            archivo.write(vectores.tobytes())
+        with open(self.ruta_ids, 'a', encoding='utf-8') as archivo:
+            archivo.writelines(f"{doc_id}\n" for doc_id in ids)
+        self.ids.extend(ids)
+        self._cargar()
+
+    def _crecer(self, filas):
+        """Crear un archivo con capacidad para al menos `filas` filas y copiar en él las existentes."""
+        capacidad = max(CAPACIDAD_MINIMA, 1 << (filas - 1).bit_length())
+        ruta = ruta_capacidad(self.ruta_matriz, capacidad)
+        ruta_temporal = ruta + '.tmp'
+        with open(ruta_temporal, 'wb') as archivo:
+            archivo.write(_cabecera_npy(capacidad, self.dimension))
+            for inicio in range(0, len(self.ids), FILAS_POR_COPIA):
+                archivo.write(np.ascontiguousarray(self._matriz[inicio:inicio + FILAS_POR_COPIA], dtype=np.float32).tobytes())
+            archivo.truncate(TAMANO_CABECERA + capacidad * self.dimension * 4)
+        os.replace(ruta_temporal, ruta)  # Archivo nuevo: ningún lector lo tiene abierto
+        anteriores = [ruta_anterior for capacidad_anterior, ruta_anterior in _archivos_capacidad(self.ruta_matriz) if capacidad_anterior < capacidad]
+        if os.path.exists(self.ruta_matriz):
+            anteriores.insert(0, self.ruta_matriz)
+        # Se conserva el anterior inmediato para los lectores que todavía no vieron el nuevo
+        for ruta_anterior in anteriores[:-1]:
+            try:
+                os.remove(ruta_anterior)
+            except OSError:
+                pass  # Todavía mapeado por un lector: se reintenta en el próximo crecimiento
+        self._ruta_datos = ruta
+        self._capacidad = capacidad
+
+    def agregar(self, doc_id, vector):
+        """Agregar el embedding de un documento."""
+        self.agregar_lote([doc_id], np.reshape(vector, (1, -1)))
+
+    def similitudes(self, doc_ids, vector_consulta):
+        """Coseno entre la consulta y cada documento dado en un solo producto (NaN si no tiene embedding)."""
+        resultado = np.full(len(doc_ids), np.nan, dtype=np.float32)
+        posiciones = [j for j, doc_id in enumerate(doc_ids) if doc_id in self._filas]
+        if posiciones:
+            filas = np.array([self._filas[doc_ids[j]] for j in posiciones], dtype=np.int64)
+            resultado[posiciones] = self._matriz[filas] @ normalizar(vector_consulta).ravel()
+        return resultado
+
+    def buscar(self, vector_consulta, k=10, documentos=None):
+        """
+        Los `k` documentos más similares (coseno) como lista de (doc_id, similitud).
+        Con `documentos` (conjunto de ids) solo se puntúan sus filas.
+        """
+        if documentos is not None:
+            filas = np.array(sorted(self._filas[doc_id] for doc_id in documentos if doc_id in self._filas), dtype=np.int64)
+        else:
+            filas = None
+        if len(self.ids) == 0 or (filas is not None and len(filas) == 0):
+            return []
+        consulta = normalizar(vector_consulta).ravel()
+        similitudes = (self._matriz if filas is None else self._matriz[filas]) @ consulta
+        k = min(k, len(similitudes))
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        if filas is not None:
+            return [(self.ids[filas[i]], float(similitudes[i])) for i in mejores]
+        return [(self.ids[fila], float(similitudes[fila])) for fila in mejores]
+
+    def buscar_lote(self, vectores_consulta, k=10):
+        """
+        Búsqueda de varias consultas con un solo producto matriz-matriz: una lista de
+        (doc_id, similitud) con los `k` mejores documentos por cada fila de `vectores_consulta`.
+        """
+        consultas = normalizar(vectores_consulta)
+        if len(self.ids) == 0:
+            return [[] for _ in range(len(consultas))]
+        similitudes = consultas @ self._matriz.T
+        k = min(k, similitudes.shape[1])
+        mejores = np.argpartition(-similitudes, k - 1, axis=1)[:, :k]
+        puntajes = np.take_along_axis(similitudes, mejores, axis=1)
+        orden = np.argsort(-puntajes, axis=1)
+        mejores = np.take_along_axis(mejores, orden, axis=1)
+        puntajes = np.take_along_axis(puntajes, orden, axis=1)
+        return [
+            [(self.ids[fila], float(puntaje)) for fila, puntaje in zip(filas, puntajes_fila)]
+            for filas, puntajes_fila in zip(mejores, puntajes)
+        ]
+
+    def buscar_agregado(self, vector_consulta, k=10, agregacion='max', documentos=None):
+        """
+        Búsqueda sobre una matriz de pasajes (varias filas por documento): los puntajes de los
+        pasajes se agregan por documento con 'max' o 'sum' y se retornan los `k` mejores documentos.
+        Con `documentos` (conjunto de ids) solo se puntúan los pasajes de esos documentos.
+        """
+        if len(self.ids) == 0:
+            return []
+        filtro = documentos
+        documentos, codigos = self._documentos_por_fila()
+        consulta = normalizar(vector_consulta).ravel()
+        if filtro is None:
+            similitudes = self._matriz @ consulta
+            candidatos = len(documentos)
+        else:
+            admitidos = np.array([i for i, doc_id in enumerate(documentos) if doc_id in filtro], dtype=np.int64)
+            filas = np.flatnonzero(np.isin(codigos, admitidos))
+            if len(filas) == 0:
+                return []
+            codigos = codigos[filas]
+            similitudes = self._matriz[filas] @ consulta
+            candidatos = len(admitidos)
+        if agregacion == 'max':
+            puntajes = np.full(len(documentos), -np.inf, dtype=np.float32)
+            np.maximum.at(puntajes, codigos, similitudes)
+        elif agregacion == 'sum':
+            puntajes = np.bincount(codigos, weights=similitudes, minlength=len(documentos))
+            if filtro is not None:
+                puntajes[np.setdiff1d(np.arange(len(documentos)), admitidos)] = -np.inf
+        else:
+            raise ValueError(f"Agregación desconocida: {agregacion}")
+        k = min(k, candidatos)
+        mejores = np.argpartition(-puntajes, k - 1)[:k]
+        mejores = mejores[np.argsort(-puntajes[mejores])]
+        return [(documentos[i], float(puntajes[i])) for i in mejores]
+
+    @classmethod
+    def desde_diccionario(cls, ruta_embeddings, embeddings_dict, dimension=DIMENSION):
+        """Crear el almacén a partir del diccionario {doc_id: embedding} del formato histórico."""
+        almacen = cls(ruta_embeddings, dimension)
+        nuevos = [doc_id for doc_id in embeddings_dict if doc_id not in almacen]
+        if nuevos:
+            almacen.agregar_lote(nuevos, np.vstack([np.reshape(embeddings_dict[doc_id], (1, -1)) for doc_id in nuevos]))
+        return almacen
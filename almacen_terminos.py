@@ -0,0 +1,258 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from threading import Lock
+from metricas import medido
+
+try:
+    from pymongo import ASCENDING, InsertOne, UpdateOne
+except ImportError:
+    # Sin pymongo solo está disponible el almacenamiento embebido
+    ASCENDING = InsertOne = UpdateOne = None
+
+# Almacenamiento de postings y metadatos de documentos, con dos implementaciones
+# intercambiables detrás de la misma interfaz: MongoDB (servidor) y SQLite (embebido, en
+# el mismo proceso, sin viaje de red). config_db.obtener_almacen() elige una según BACKEND.
+#
+# MongoDB:
+# En lugar de un documento por término con un arreglo `documents` que crece con el corpus
+# (y que se actualizaba con `$addToSet` sobre subdocumentos completos), se guarda una fila
+# compacta por par (término, documento) en la colección de postings, con un índice
+# compuesto único sobre (word, documento). Los metadatos de cada documento (número de
+# norma, año, estado) viven una sola vez en la colección de documentos. Las consultas leen
+# todos los términos en un solo `$in` con proyección, de modo que cada ida y vuelta trae
+# solo los campos necesarios.
+
+TAMANO_LOTE_MONGO = 10000
+
+
+def _metadatos_de_indice(inverted_index):
+    """Metadatos por documento y filas (término, documento, tf) de un índice en el formato histórico."""
+    metadatos = {}
+    filas = []
+    for termino, entradas in inverted_index.items():
+        for entrada in entradas:
+            documento = entrada["documento"]
+            if documento not in metadatos:
+                metadatos[documento] = {
+                    "documento": documento,
+                    "numero_norma": entrada.get("numero_norma"),
+                    "fecha": entrada.get("fecha"),
+                    "estado": entrada.get("estado", "activo")
+                }
+            filas.append((termino, documento, entrada["tf"]))
+    return metadatos, filas
+
+
+class AlmacenTerminos(ABC):
+    """
+    Interfaz del almacenamiento de postings.
+    Cada implementación guarda una fila por (término, documento) con su tf y una fila de
+    metadatos por documento. Una implementación a la que le falte un método no se puede
+    instanciar (TypeError al crearla en config_db.crear_almacen).
+    """
+
+    @abstractmethod
+    def crear_indices(self):
+        """Crear las estructuras e índices necesarios (idempotente)."""
+
+    @abstractmethod
+    def agregar(self, metadatos, postings):
+        """
+        Registrar documentos nuevos.
+        metadatos: lista de dicts con documento, numero_norma, fecha y estado.
+        postings: {término: [(documento, tf), ...]}.
+        Reintentar un lote no duplica filas.
+        """
+
+    @abstractmethod
+    def cargar_indice(self, inverted_index):
+        """
+        Reemplazar el contenido con un índice completo en el formato histórico
+        {término: [{"documento", "numero_norma", "tf", "fecha", "estado"}, ...]}.
+        Retorna (cantidad de postings, cantidad de documentos).
+        """
+
+    @abstractmethod
+    def buscar_terminos(self, terminos):
+        """Postings de varios términos en una sola consulta: {término: [(documento, tf), ...]}."""
+
+    @abstractmethod
+    def documentos_con_terminos(self, terminos):
+        """Documentos que contienen al menos uno de los términos."""
+
+    @abstractmethod
+    def metadatos(self, nombres):
+        """Metadatos de los documentos dados: {documento: dict}."""
+
+
+class AlmacenMongo(AlmacenTerminos):
+    """Postings (una fila por término y documento) y metadatos de documentos en MongoDB."""
+
+    def __init__(self, postings, documentos):
+        self.postings = postings
+        self.documentos = documentos
+        self._indices_creados = False
+        self._lock = Lock()
+
+    def crear_indices(self):
+        with self._lock:
+            if self._indices_creados:
+                return
+            self.postings.create_index([("word", ASCENDING), ("documento", ASCENDING)], unique=True, name="word_documento")
+            self.documentos.create_index([("documento", ASCENDING)], unique=True, name="documento")
+            self._indices_creados = True
+
+    @medido('mongo.agregar')
+    def agregar(self, metadatos, postings):
+        # Upserts por clave: reintentar un lote no duplica filas
+        self.crear_indices()
+        if metadatos:
+            self.documentos.bulk_write([
+                UpdateOne({"documento": fila["documento"]}, {"$set": fila}, upsert=True) for fila in metadatos
+            ], ordered=False)
+        operaciones = [
+            UpdateOne({"word": termino, "documento": documento}, {"$set": {"tf": tf}}, upsert=True)
+            for termino, entradas in postings.items()
+            for documento, tf in entradas
+        ]
+        for inicio in range(0, len(operaciones), TAMANO_LOTE_MONGO):
+            self.postings.bulk_write(operaciones[inicio:inicio + TAMANO_LOTE_MONGO], ordered=False)
+
+    @medido('mongo.cargar_indice')
+    def cargar_indice(self, inverted_index):
+        self.crear_indices()
+        self.postings.delete_many({})
+        self.documentos.delete_many({})
+        metadatos, filas = _metadatos_de_indice(inverted_index)
+        for inicio in range(0, len(filas), TAMANO_LOTE_MONGO):
+            self.postings.bulk_write([
+                InsertOne({"word": termino, "documento": documento, "tf": tf})
+                for termino, documento, tf in filas[inicio:inicio + TAMANO_LOTE_MONGO]
+            ], ordered=False)
+        if metadatos:
+            self.documentos.insert_many(list(metadatos.values()), ordered=False)
+        return len(filas), len(metadatos)
+
+    @medido('mongo.buscar_terminos')
+    def buscar_terminos(self, terminos):
+        self.crear_indices()
+        resultado = {termino: [] for termino in terminos}
+        if not resultado:
+            return resultado
+        cursor = self.postings.find(
+            {"word": {"$in": list(resultado)}},
+            {"_id": 0, "word": 1, "documento": 1, "tf": 1}
+        )
+        for fila in cursor:
+            resultado[fila["word"]].append((fila["documento"], fila["tf"]))
+        return resultado
+
+    @medido('mongo.documentos_con_terminos')
+    def documentos_con_terminos(self, terminos):
+        self.crear_indices()
+        if not terminos:
+            return set()
+        return set(self.postings.distinct("documento", {"word": {"$in": list(terminos)}}))
+
+    @medido('mongo.metadatos')
+    def metadatos(self, nombres):
+        self.crear_indices()
+        cursor = self.documentos.find({"documento": {"$in": list(nombres)}}, {"_id": 0})
+        return {fila["documento"]: fila for fila in cursor}
+
+
+_ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS postings (
+    word TEXT NOT NULL,
+    documento TEXT NOT NULL,
+    tf REAL NOT NULL,
+    PRIMARY KEY (word, documento)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS documentos (
+    documento TEXT PRIMARY KEY,
+    numero_norma TEXT,
+    fecha TEXT,
+    estado TEXT NOT NULL DEFAULT 'activo'
+);
+"""
+
+# Límite de parámetros por sentencia en versiones antiguas de SQLite
+MAX_PARAMETROS_SQLITE = 900
+
+
+class AlmacenSQLite(AlmacenTerminos):
+    """Postings y metadatos en un archivo SQLite local (o ':memory:'), sin servidor."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._lock = Lock()
+        self.crear_indices()
+
+    def crear_indices(self):
+        with self._lock:
+            self._conexion.executescript(_ESQUEMA_SQLITE)
+
+    def _transaccion(self, sentencias):
+        """Ejecutar [(sql, filas)] con executemany dentro de una sola transacción."""
+        with self._lock:
+            self._conexion.execute("BEGIN")
+            try:
+                for sql, filas in sentencias:
+                    self._conexion.executemany(sql, filas)
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+
+    def _consultar(self, sql, parametros):
+        """Ejecutar una consulta `... IN ({})` por tramos de parámetros y concatenar las filas."""
+        parametros = list(parametros)
+        filas = []
+        with self._lock:
+            for inicio in range(0, len(parametros), MAX_PARAMETROS_SQLITE):
+                tramo = parametros[inicio:inicio + MAX_PARAMETROS_SQLITE]
+                filas.extend(self._conexion.execute(sql.format(', '.join('?' * len(tramo))), tramo).fetchall())
+        return filas
+
+    @medido('sqlite.agregar')
+    def agregar(self, metadatos, postings):
+        self._transaccion([
+            ("INSERT OR REPLACE INTO documentos (documento, numero_norma, fecha, estado) VALUES (?, ?, ?, ?)",
+             [(fila["documento"], fila.get("numero_norma"), fila.get("fecha"), fila.get("estado", "activo")) for fila in metadatos]),
+            ("INSERT OR REPLACE INTO postings (word, documento, tf) VALUES (?, ?, ?)",
+             [(termino, documento, tf) for termino, entradas in postings.items() for documento, tf in entradas])
+        ])
+
+    @medido('sqlite.cargar_indice')
+    def cargar_indice(self, inverted_index):
+        metadatos, filas = _metadatos_de_indice(inverted_index)
+        self._transaccion([
+            ("DELETE FROM postings", [()]),
+            ("DELETE FROM documentos", [()]),
+            ("INSERT INTO documentos (documento, numero_norma, fecha, estado) VALUES (?, ?, ?, ?)",
+             [(fila["documento"], fila["numero_norma"], fila["fecha"], fila["estado"]) for fila in metadatos.values()]),
+            ("INSERT INTO postings (word, documento, tf) VALUES (?, ?, ?)", filas)
+        ])
+        return len(filas), len(metadatos)
+
+    @medido('sqlite.buscar_terminos')
+    def buscar_terminos(self, terminos):
+        resultado = {termino: [] for termino in terminos}
+        for termino, documento, tf in self._consultar("SELECT word, documento, tf FROM postings WHERE word IN ({})", resultado):
+            resultado[termino].append((documento, tf))
+        return resultado
+
+    @medido('sqlite.documentos_con_terminos')
+    def documentos_con_terminos(self, terminos):
+        return {fila[0] for fila in self._consultar("SELECT DISTINCT documento FROM postings WHERE word IN ({})", set(terminos))}
+
+    @medido('sqlite.metadatos')
+    def metadatos(self, nombres):
+        columnas = ("documento", "numero_norma", "fecha", "estado")
+        return {
+            fila[0]: dict(zip(columnas, fila))
+            for fila in self._consultar("SELECT documento, numero_norma, fecha, estado FROM documentos WHERE documento IN ({})", set(nombres))
+        }
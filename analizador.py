@@ -0,0 +1,88 @@
+import glob
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from functools import lru_cache
+from nltk.corpus import stopwords
+from nltk.stem import SnowballStemmer
+from metricas import medido
+
+# Analizador de texto en español compartido por la indexación y las consultas.
+# Pasos: minúsculas, plegado de acentos (se conserva la ñ), tokenización con una expresión
+# regular precompilada, eliminación de palabras vacías (frozenset, también plegadas) y
+# stemming Snowball con un cache de raíces, porque el vocabulario de los decretos se repite
+# mucho y la misma palabra se vuelve a reducir miles de veces.
+
+_PLEGADO = str.maketrans('áàâäéèêëíìîïóòôöúùûüÁÀÂÄÉÈÊËÍÌÎÏÓÒÔÖÚÙÛÜÑ', 'aaaaeeeeiiiioooouuuuaaaaeeeeiiiioooouuuuñ')
+_TOKEN = re.compile(r'[a-zñ]+')
+_stemmer = SnowballStemmer('spanish')
+
+PALABRAS_VACIAS = frozenset(
+    [palabra.translate(_PLEGADO) for palabra in stopwords.words('spanish')] + list('abcdefghijklmnopqrstuvwxyz')
+)
+RAICES_EN_CACHE = 200000
+
+
+def plegar(texto):
+    """Minúsculas y sin acentos (la ñ se conserva)."""
+    return texto.lower().translate(_PLEGADO)
+
+
+def tokenizar(texto):
+    """Tokens plegados del texto, sin filtrar ni reducir."""
+    return _TOKEN.findall(plegar(texto))
+
+
+@lru_cache(maxsize=RAICES_EN_CACHE)
+def raiz(token):
+    """Raíz Snowball de un token plegado."""
+    return _stemmer.stem(token)
+
+
+@medido('tokenizacion')
+def analizar(texto):
+    """Términos del texto tal como se guardan en el índice: tokens sin palabras vacías y reducidos a su raíz."""
+    return [raiz(token) for token in _TOKEN.findall(plegar(texto)) if token not in PALABRAS_VACIAS]
+
+
+def terminos_con_posiciones(texto):
+    """Pares (término, posición del primer carácter del token en el texto) en orden de aparición."""
+    return [(raiz(coincidencia.group()), coincidencia.start())
+            for coincidencia in _TOKEN.finditer(plegar(texto)) if coincidencia.group() not in PALABRAS_VACIAS]
+
+
+def _textos_de_prueba(rutas):
+    """Textos de archivos .txt o de entradas del cache de texto extraído (.json.gz)."""
+    for ruta in rutas:
+        if ruta.endswith('.json.gz'):
+            with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+                yield json.load(archivo)["texto"]
+        else:
+            with open(ruta, 'r', encoding='utf-8', errors='replace') as archivo:
+                yield archivo.read()
+
+
+if __name__ == '__main__':
+    # Uso: python analizador.py [archivos .txt o .json.gz ...]
+    # Sin argumentos se usa el texto OCR del cache de extracción.
+    rutas = sys.argv[1:]
+    if not rutas:
+        from cache_texto import DIRECTORIO_CACHE_TEXTO
+        rutas = glob.glob(os.path.join(DIRECTORIO_CACHE_TEXTO, '*', '*.json.gz'))
+    textos = list(_textos_de_prueba(rutas))
+    if not textos:
+        print("Error: No se encontraron textos para medir.")
+        sys.exit(1)
+
+    tokens = sum(len(tokenizar(texto)) for texto in textos)
+    for pasada in ('fría', 'caliente'):
+        if pasada == 'fría':
+            raiz.cache_clear()
+        inicio = time.perf_counter()
+        terminos = sum(len(analizar(texto)) for texto in textos)
+        duracion = time.perf_counter() - inicio
+        print(f"Pasada {pasada}: {len(textos)} textos, {tokens} tokens, {terminos} términos en {duracion:.3f} s "
+              f"({tokens / duracion:,.0f} tokens/s); cache de raíces: {raiz.cache_info()}")
@@ -1,5 +1,8 @@
-from flask import Flask, request, render_template, send_file
-from facade import BuscadorFacade
+from flask import Flask, Response, request, render_template, send_file, jsonify
+from facade import BuscadorFacade, TAMANO_PAGINA, MAX_TAMANO_PAGINA
+from crawler import cola_existente
+from analizador import raiz
+from metricas import exponer, medidor, medir
 import os
 
 app = Flask(__name__)
@@ -8,23 +11,79 @@ app = Flask(__name__)
 RUTA_DOCUMENTOS = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\decretos_2023_test"
 facade = BuscadorFacade(RUTA_DOCUMENTOS, debug=True)
 
+# Aciertos, fallos y tasa de acierto de los caches, leídos en cada exportación de /metrics
+def estadisticas_caches():
+    raices = raiz.cache_info()
+    caches = {
+        "consultas": facade.cache.estadisticas(),
+        "fragmentos": facade.fragmentos.cache.estadisticas(),
+        "raices": {"aciertos": raices.hits, "fallos": raices.misses}
+    }
+    for estadisticas in caches.values():
+        total = estadisticas["aciertos"] + estadisticas["fallos"]
+        estadisticas["tasa_aciertos"] = estadisticas["aciertos"] / total if total else 0.0
+    return caches
+
+medidor('buscador_cache_aciertos_total', 'Aciertos de cada cache',
+        lambda: {(nombre,): datos["aciertos"] for nombre, datos in estadisticas_caches().items()}, ('cache',), 'counter')
+medidor('buscador_cache_fallos_total', 'Fallos de cada cache',
+        lambda: {(nombre,): datos["fallos"] for nombre, datos in estadisticas_caches().items()}, ('cache',), 'counter')
+medidor('buscador_cache_tasa_aciertos', 'Fracción de lecturas de cada cache que fueron aciertos',
+        lambda: {(nombre,): datos["tasa_aciertos"] for nombre, datos in estadisticas_caches().items()}, ('cache',))
+
+# Renderizar una plantilla midiendo el tiempo de renderizado
+def renderizar(plantilla, **contexto):
+    with medir('renderizado'):
+        return render_template(plantilla, **contexto)
+
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return renderizar("index.html")
 
-@app.route("/buscar", methods=["POST"])
+@app.route("/buscar", methods=["GET", "POST"])
 def buscar():
-    query = request.form.get("query")
+    query = request.values.get("query")
     if not query:
-        return render_template("error.html", error_message="Por favor, ingrese una consulta.")
+        return renderizar("error.html", error_message="Por favor, ingrese una consulta.")
+    pagina = max(1, request.values.get("page", 1, type=int))
+    tamano = min(max(1, request.values.get("size", TAMANO_PAGINA, type=int)), MAX_TAMANO_PAGINA)
+    # Filtros por metadatos del documento (opcionales)
+    filtros = {
+        "anio": request.values.get("anio", type=int),
+        "norma_desde": request.values.get("norma_desde", type=int),
+        "norma_hasta": request.values.get("norma_hasta", type=int),
+        "estado": request.values.get("estado") or None
+    }
 
     try:
-        resultados = facade.buscar_documentos(query)
+        resultados = facade.buscar_documentos(query, pagina, tamano, filtros)
         if not resultados:
-            return render_template("error.html", error_message="No se encontraron documentos para la consulta.")
-        return render_template("resultados.html", resultados=resultados)
+            return renderizar("error.html", error_message="No se encontraron documentos para la consulta.")
+        return renderizar(
+            "resultados.html",
+            resultados=resultados,
+            query=query,
+            pagina=pagina,
+            tamano=tamano,
+            filtros=filtros,
+            hay_siguiente=len(resultados) == tamano
+        )
     except Exception as e:
-        return render_template("error.html", error_message=f"Ocurrió un error: {e}")
+        return renderizar("error.html", error_message=f"Ocurrió un error: {e}")
+
+@app.route("/estadisticas")
+def estadisticas():
+    # Consultar las estadísticas no debe crear la cola ni iniciar sus trabajadores
+    cola = cola_existente(facade.output_path, facade.embeddings_path)
+    return jsonify({
+        "cache": facade.cache.estadisticas(),
+        "generacion": facade.generacion(),
+        "ingesta": cola.estadisticas() if cola is not None else None
+    })
+
+@app.route("/metrics")
+def metrics():
+    return Response(exponer(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/ver/<doc_id>")
 def ver_documento(doc_id):
@@ -32,7 +91,7 @@ def ver_documento(doc_id):
     if os.path.exists(ruta_archivo):
         return send_file(ruta_archivo, mimetype="application/pdf")
     else:
-        return render_template("error.html", error_message="Documento no encontrado.")
+        return renderizar("error.html", error_message="Documento no encontrado.")
 
 @app.route("/descargar/<doc_id>")
 def descargar_documento(doc_id):
@@ -40,7 +99,7 @@ def descargar_documento(doc_id):
     if os.path.exists(ruta_archivo):
         return send_file(ruta_archivo, as_attachment=True)
     else:
-        return render_template("error.html", error_message="Documento no encontrado.")
+        return renderizar("error.html", error_message="Documento no encontrado.")
 
 if __name__ == "__main__":
     print("[DEBUG] Iniciando la aplicación Flask...")
@@ -0,0 +1,306 @@
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+# Benchmark reproducible de indexación y búsqueda sobre un corpus sintético de decretos.
+# Genera documentos con nombres `Decreto_Nº_<n>_del_<año>.pdf` y texto con vocabulario
+# jurídico y palabras de relleno con frecuencias tipo Zipf, los indexa con el escritor
+# incremental (almacenamiento embebido SQLite por omisión, o un MongoDB local) y calcula los
+# embeddings con un codificador sintético (hashing de términos), sin descargar modelos.
+# Luego mide la latencia de consultas de términos, de frase y semánticas (términos ausentes
+# del índice, que caen a embeddings) a través de BuscadorFacade.buscar_documentos, con el
+# cache de resultados vacío en cada consulta, y de consultas híbridas a través de
+# procesar_consulta.run: candidatos BM25 puntuados con TF-IDF y con embeddings y fusionados
+# con combinar_puntajes. Todo sale de una semilla, así que dos corridas con los mismos
+# parámetros generan el mismo corpus y las mismas consultas. Los módulos pesados (torch,
+# OCR) se importan solo al usarse, así que basta con numpy, scipy y nltk.
+#
+# Uso: python benchmark_busqueda.py --documentos 10000 --salida resultados.json
+
+DOCUMENTOS = 1000
+CONSULTAS_POR_TIPO = 200
+CALENTAMIENTO = 20
+SEMILLA = 2024
+DIMENSION_SINTETICA = 768
+TAMANO_LOTE_INDEXACION = 5000
+PALABRAS_POR_DOCUMENTO = (150, 600)
+TAMANO_VOCABULARIO = 20000
+ANIOS = (2015, 2024)
+SALIDA = 'benchmark_busqueda.json'
+
+TIPOS_CONSULTA = ('terminos', 'frase', 'embeddings', 'hibrida')
+
+_JURIDICAS = (
+    "decreto ley articulo municipal alcaldia municipalidad ordenanza reglamento permiso edificacion "
+    "patente comercial concejo resolucion direccion obras urbanismo transito plan regulador comunal "
+    "presupuesto modificacion aprueba designa funcionario contrato licitacion publica adjudica "
+    "subvencion organizacion comunitaria vecinal derecho aseo retiro residuos impuesto territorial "
+    "rentas tesoreria contraloria sumario administrativo sancion multa juzgado policia local "
+    "vivienda social subsidio salud educacion establecimiento escolar cementerio arriendo bien "
+    "inmueble comodato convenio transferencia fondos proyecto inversion calle pasaje avenida"
+).split()
+_CONECTORES = ("de", "la", "el", "en", "y", "del", "los", "las", "que", "por", "con", "para", "a")
+_SILABAS = [c + v for c in ('', 'b', 'c', 'd', 'f', 'g', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'ch', 'tr', 'pr', 'bl')
+            for v in 'aeiou'] + ['n', 's', 'r', 'l']
+# Tokens cortos con letras que no aparecen en el vocabulario: no están en el índice ni tienen expansiones
+_LETRAS_AUSENTES = 'kqwxyz'
+
+
+class CodificadorSintetico:
+    """Embeddings deterministas por hashing de los términos analizados (reemplaza a BERT en el benchmark)."""
+
+    def __init__(self, dimension: int = DIMENSION_SINTETICA):
+        self.dimension = dimension
+
+    def codificar(self, texto):
+        import numpy as np
+        from analizador import analizar
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for termino in analizar(texto):
+            vector[zlib.crc32(termino.encode('utf-8')) % self.dimension] += 1.0
+        return vector
+
+
+class CorpusSintetico:
+    """Generador reproducible de decretos sintéticos y de consultas sobre su vocabulario."""
+
+    def __init__(self, documentos: int, semilla: int = SEMILLA, tamano_vocabulario: int = TAMANO_VOCABULARIO):
+        self.documentos = documentos
+        self.semilla = semilla
+        aleatorio = random.Random(semilla)
+        relleno = set()
+        while len(relleno) < tamano_vocabulario:
+            relleno.add(''.join(aleatorio.choice(_SILABAS) for _ in range(aleatorio.randint(2, 5))))
+        self.vocabulario = list(_JURIDICAS) + sorted(relleno)
+        # Frecuencias tipo Zipf: el peso de la palabra de rango r es 1 / r
+        acumulado = 0.0
+        self._acumulados = []
+        for rango in range(1, len(self.vocabulario) + 1):
+            acumulado += 1.0 / rango
+            self._acumulados.append(acumulado)
+
+    def nombre(self, numero):
+        anio = ANIOS[0] + numero % (ANIOS[1] - ANIOS[0] + 1)
+        return f"Decreto_Nº_{numero}_del_{anio}.pdf"
+
+    def texto(self, numero):
+        """Texto del decreto `numero` (siempre el mismo para la misma semilla)."""
+        aleatorio = random.Random(self.semilla * 1000003 + numero)
+        cantidad = aleatorio.randint(*PALABRAS_POR_DOCUMENTO)
+        palabras = aleatorio.choices(self.vocabulario, cum_weights=self._acumulados, k=cantidad)
+        for posicion in range(3, cantidad, 4):
+            palabras[posicion] = aleatorio.choice(_CONECTORES)
+        return f"DECRETO Nº {numero}. VISTOS: " + ' '.join(palabras) + ". ANÓTESE, COMUNÍQUESE Y ARCHÍVESE."
+
+    def __iter__(self):
+        for numero in range(1, self.documentos + 1):
+            yield self.nombre(numero), self.texto(numero)
+
+    def consultas(self, tipo, cantidad):
+        """Lista reproducible de consultas del tipo indicado."""
+        aleatorio = random.Random(f"{self.semilla}-{tipo}")
+        resultado = []
+        for _ in range(cantidad):
+            if tipo == 'terminos':
+                consulta = ' '.join(aleatorio.choices(self.vocabulario, cum_weights=self._acumulados, k=aleatorio.randint(1, 3)))
+            elif tipo == 'frase':
+                # Palabras consecutivas (sin conectores) de un documento del corpus
+                palabras = [palabra for palabra in self.texto(aleatorio.randint(1, self.documentos)).split()[4:-4]
+                            if palabra not in _CONECTORES]
+                inicio = aleatorio.randrange(len(palabras) - 2)
+                consulta = '"' + ' '.join(palabras[inicio:inicio + aleatorio.randint(2, 3)]) + '"'
+            elif tipo == 'embeddings':
+                consulta = ' '.join(''.join(aleatorio.choices(_LETRAS_AUSENTES, k=3)) for _ in range(aleatorio.randint(2, 4)))
+            elif tipo == 'hibrida':
+                # Un término jurídico y uno o dos términos del vocabulario (candidatos BM25 para la fusión)
+                consulta = ' '.join([aleatorio.choice(_JURIDICAS)] +
+                                    aleatorio.choices(self.vocabulario, cum_weights=self._acumulados, k=aleatorio.randint(1, 2)))
+            else:
+                raise ValueError(f"Tipo de consulta desconocido: {tipo}")
+            resultado.append(consulta)
+        return resultado
+
+
+# Función para obtener el máximo de memoria residente del proceso en bytes (None si no se puede medir)
+def rss_maximo():
+    try:
+        import resource
+    except ImportError:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB y macOS bytes
+    return maximo if sys.platform == 'darwin' else maximo * 1024
+
+
+# Función para sumar el tamaño en disco de los archivos del directorio del benchmark
+def tamano_en_disco(directorio):
+    tamanos = {}
+    for nombre in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, nombre)
+        if os.path.isfile(ruta):
+            tamanos[nombre] = os.path.getsize(ruta)
+    return {"archivos": tamanos, "total": sum(tamanos.values())}
+
+
+# Función para calcular un percentil (rango más cercano) de una lista de valores
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))]
+
+
+# Función para indexar el corpus con el escritor incremental, los fragmentos y los embeddings sintéticos
+def indexar(corpus, output_path, embeddings_path, codificador, tamano_lote=TAMANO_LOTE_INDEXACION):
+    import numpy as np
+    from actualizar_indice_invertido import EscritorIndice, extraer_palabras
+    from almacen_embeddings import AlmacenEmbeddings
+    from fragmentos import obtener_fragmentos
+
+    escritor = EscritorIndice(output_path, max_documentos=tamano_lote, max_segundos=float('inf'))
+    fragmentos = obtener_fragmentos(output_path)
+    embeddings = AlmacenEmbeddings(embeddings_path, codificador.dimension)
+    lote = []
+    inicio = time.perf_counter()
+
+    def vaciar_lote():
+        escritor.vaciar()
+        fragmentos.agregar_lote(lote)
+        embeddings.agregar_lote([nombre for nombre, _ in lote], np.vstack([codificador.codificar(texto) for _, texto in lote]))
+        lote.clear()
+
+    for nombre, texto in corpus:
+        escritor.agregar(nombre, extraer_palabras(texto))
+        lote.append((nombre, texto))
+        if len(lote) >= tamano_lote:
+            vaciar_lote()
+            print(f"[INFO] {len(embeddings)} documentos indexados ({time.perf_counter() - inicio:.1f} s)")
+    if lote:
+        vaciar_lote()
+    segundos = time.perf_counter() - inicio
+    return {
+        "documentos": corpus.documentos,
+        "segundos": round(segundos, 3),
+        "documentos_por_segundo": round(corpus.documentos / segundos, 2) if segundos > 0 else None,
+        "tamano_lote": tamano_lote
+    }
+
+
+# Función para medir la latencia de un tipo de consulta; `antes` se llama fuera de la medición (p. ej. para vaciar el cache)
+def medir_consultas(buscar, consultas, calentamiento=CALENTAMIENTO, antes=None):
+    for consulta in consultas[:calentamiento]:
+        if antes:
+            antes()
+        buscar(consulta)
+    latencias = []
+    resultados = 0
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        if antes:
+            antes()
+        t0 = time.perf_counter()
+        resultados += len(buscar(consulta))
+        latencias.append((time.perf_counter() - t0) * 1000)
+    segundos = time.perf_counter() - inicio
+    return {
+        "consultas": len(consultas),
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "media_ms": round(sum(latencias) / len(latencias), 3),
+        "consultas_por_segundo": round(len(consultas) / segundos, 2) if segundos > 0 else None,
+        "resultados_promedio": round(resultados / len(consultas), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de indexación y búsqueda sobre un corpus sintético de decretos.")
+    parser.add_argument("--documentos", type=int, default=DOCUMENTOS, help="Cantidad de documentos sintéticos (1k a 1M)")
+    parser.add_argument("--consultas", type=int, default=CONSULTAS_POR_TIPO, help="Consultas medidas por tipo")
+    parser.add_argument("--calentamiento", type=int, default=CALENTAMIENTO, help="Consultas de calentamiento por tipo (no se miden)")
+    parser.add_argument("--semilla", type=int, default=SEMILLA, help="Semilla del corpus y de las consultas")
+    parser.add_argument("--backend", choices=("sqlite", "mongo"), default="sqlite", help="Almacenamiento de postings")
+    parser.add_argument("--dimension", type=int, default=DIMENSION_SINTETICA, help="Dimensión de los embeddings sintéticos")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE_INDEXACION, help="Documentos por vaciado del escritor")
+    parser.add_argument("--directorio", help="Directorio de trabajo (por omisión uno temporal que se borra al terminar)")
+    parser.add_argument("--salida", default=SALIDA, help="Archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    directorio = args.directorio or tempfile.mkdtemp(prefix='benchmark_busqueda_')
+    os.makedirs(directorio, exist_ok=True)
+    # El backend se elige antes de importar los módulos que crean el almacenamiento compartido
+    os.environ['BUSCADOR_BACKEND'] = args.backend
+    os.environ['BUSCADOR_RUTA_SQLITE'] = os.path.join(directorio, 'postings.db')
+    from facade import BuscadorFacade
+
+    output_path = os.path.join(directorio, 'indice.json')
+    embeddings_path = os.path.join(directorio, 'embeddings.npy')
+    corpus = CorpusSintetico(args.documentos, args.semilla)
+    codificador = CodificadorSintetico(args.dimension)
+
+    try:
+        print(f"[INFO] Indexando {args.documentos} documentos sintéticos en {directorio}")
+        indexacion = indexar(corpus, output_path, embeddings_path, codificador, args.tamano_lote)
+        disco = tamano_en_disco(directorio)
+
+        facade = BuscadorFacade(directorio, output_path=output_path, embeddings_path=embeddings_path,
+                                iniciar_crawler=False, codificador=codificador)
+        import procesar_consulta
+        procesar_consulta.configurar(output_path, embeddings_path, codificador, codificador.dimension)
+
+        def buscar_hibrida(consulta):
+            # run imprime todos sus resultados; la salida se descarta para no medir la consola
+            with redirect_stdout(io.StringIO()):
+                resultados = procesar_consulta.run(consulta)
+            if isinstance(resultados, dict):
+                raise RuntimeError(f"La consulta híbrida {consulta!r} falló: {resultados['error']}")
+            return resultados
+
+        consultas = {}
+        for tipo in TIPOS_CONSULTA:
+            if tipo == 'hibrida':
+                consultas[tipo] = medir_consultas(buscar_hibrida, corpus.consultas(tipo, args.consultas), args.calentamiento)
+            else:
+                consultas[tipo] = medir_consultas(facade.buscar_documentos, corpus.consultas(tipo, args.consultas),
+                                                  args.calentamiento, facade.cache.limpiar)
+            print(f"[INFO] {tipo}: p50 {consultas[tipo]['p50_ms']} ms, p99 {consultas[tipo]['p99_ms']} ms, "
+                  f"{consultas[tipo]['resultados_promedio']} resultados en promedio")
+
+        resultados = {
+            "fecha": datetime.now().isoformat(timespec='seconds'),
+            "plataforma": platform.platform(),
+            "python": platform.python_version(),
+            "parametros": {
+                "documentos": args.documentos,
+                "consultas_por_tipo": args.consultas,
+                "calentamiento": args.calentamiento,
+                "semilla": args.semilla,
+                "backend": args.backend,
+                "dimension": args.dimension,
+                "tamano_lote": args.tamano_lote
+            },
+            "indexacion": indexacion,
+            "disco_bytes": disco,
+            "rss_maximo_bytes": rss_maximo(),
+            "consultas": consultas
+        }
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=4)
+        print(f"[INFO] Resultados guardados en {args.salida}")
+    finally:
+        if args.directorio is None:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import re
+from bisect import bisect_left
+from analizador import analizar
+
+# Consultas de frase y de proximidad sobre el índice posicional.
+# Sintaxis: las frases van entre comillas ("plan regulador comunal") y la proximidad se
+# escribe `término NEAR/k término` (a lo más k términos de distancia, en cualquier orden).
+# Las palabras vacías no cuentan: las posiciones del índice son las de los términos ya
+# analizados, así que "ley de rentas" se busca como ley, rent consecutivos.
+#
+# La evaluación intersecta primero las listas de doc_id (ya decodificadas y en cache en el
+# motor BM25) con búsqueda galopante desde la lista más corta, y solo para los documentos
+# que sobreviven lee las posiciones de cada término desde el índice posicional.
+
+_FRASE = re.compile(r'"([^"]+)"')
+_CERCANIA = re.compile(r'(\S+)\s+NEAR/(\d+)\s+(\S+)', re.IGNORECASE)
+
+FRASE = 'frase'
+CERCANIA = 'cercania'
+
+
+def interpretar_consulta(query):
+    """
+    Separar la consulta en términos (todos, para el ranking) y restricciones posicionales:
+    lista de (FRASE, [términos]) o (CERCANIA, [término, término], k).
+    """
+    restricciones = []
+    for frase in _FRASE.findall(query):
+        terminos = analizar(frase)
+        if len(terminos) > 1:
+            restricciones.append((FRASE, terminos))
+    for izquierda, distancia, derecha in _CERCANIA.findall(query):
+        terminos = analizar(izquierda) + analizar(derecha)
+        if len(terminos) == 2:
+            restricciones.append((CERCANIA, terminos, int(distancia)))
+    libre = _CERCANIA.sub(r'\1 \3', query).replace('"', ' ')
+    return analizar(libre), restricciones
+
+
+def galopar(lista, objetivo, inicio):
+    """Primera posición desde `inicio` con lista[posición] >= objetivo (salto exponencial y luego binaria)."""
+    salto = 1
+    alto = inicio
+    while alto < len(lista) and lista[alto] < objetivo:
+        inicio = alto + 1
+        alto += salto
+        salto *= 2
+    return bisect_left(lista, objetivo, inicio, min(alto, len(lista)))
+
+
+def interseccion_galopante(listas):
+    """Documentos presentes en todas las listas, con la posición del posting en cada una: [(doc_id, [j, ...])]."""
+    orden = sorted(range(len(listas)), key=lambda i: len(listas[i]))
+    corta = orden[0]
+    cursores = [0] * len(listas)
+    resultado = []
+    for j, doc_id in enumerate(listas[corta]):
+        cursores[corta] = j
+        for i in orden[1:]:
+            cursores[i] = galopar(listas[i], doc_id, cursores[i])
+            if cursores[i] == len(listas[i]):
+                return resultado
+            if listas[i][cursores[i]] != doc_id:
+                break
+        else:
+            resultado.append((doc_id, list(cursores)))
+    return resultado
+
+
+def contiene_frase(posiciones):
+    """True si hay un inicio p con p + i en las posiciones del término i para todos los términos."""
+    siguientes = [set(lista) for lista in posiciones[1:]]
+    return any(all(inicio + i in conjunto for i, conjunto in enumerate(siguientes, 1)) for inicio in posiciones[0])
+
+
+def a_distancia(izquierda, derecha, distancia):
+    """True si alguna posición de una lista está a lo más a `distancia` de alguna de la otra."""
+    i = j = 0
+    while i < len(izquierda) and j < len(derecha):
+        if abs(izquierda[i] - derecha[j]) <= distancia:
+            return True
+        if izquierda[i] < derecha[j]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def documentos_que_cumplen(motor, restricciones):
+    """Conjunto de doc_id que cumplen todas las restricciones posicionales."""
+    segmento = motor.segmento
+    posicional = motor.posicional
+    admitidos = None
+    for restriccion in restricciones:
+        terminos = restriccion[1]
+        indices = [segmento.buscar(termino) for termino in terminos]
+        if min(indices) < 0:
+            return set()
+        candidatos = interseccion_galopante([motor.lista(termino)[0] for termino in terminos])
+        cumplen = set()
+        for doc_id, postings in candidatos:
+            if admitidos is not None and doc_id not in admitidos:
+                continue
+            posiciones = [posicional.posiciones(i, j) for i, j in zip(indices, postings)]
+            if restriccion[0] == FRASE and contiene_frase(posiciones):
+                cumplen.add(doc_id)
+            elif restriccion[0] == CERCANIA and a_distancia(posiciones[0], posiciones[1], restriccion[2]):
+                cumplen.add(doc_id)
+        admitidos = cumplen
+        if not admitidos:
+            break
+    return admitidos if admitidos is not None else set()
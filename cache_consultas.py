@@ -0,0 +1,96 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# Cache de resultados de consultas con invalidación por generación del índice.
+# Cada archivo de datos (segmento del índice, matriz de embeddings) tiene un contador de
+# generación en un archivo `.gen` que el escritor incrementa cada vez que confirma
+# documentos nuevos. La generación forma parte de la clave del cache, por lo que una
+# consulta repetida después de una actualización nunca recibe un resultado obsoleto.
+
+MAX_ENTRADAS = 1024
+TTL_SEGUNDOS = 600
+_ESPACIOS = re.compile(r'\s+')
+_generacion_lock = Lock()
+
+
+def ruta_generacion(ruta_datos):
+    """Ruta del contador de generación asociado a un archivo de datos."""
+    return ruta_datos + '.gen'
+
+
+def leer_generacion(ruta_datos):
+    """Generación actual del archivo de datos (0 si nunca se ha confirmado una actualización)."""
+    try:
+        with open(ruta_generacion(ruta_datos), 'r', encoding='utf-8') as archivo:
+            return int(archivo.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def incrementar_generacion(ruta_datos):
+    """Incrementar la generación del archivo de datos de forma atómica y retornar el nuevo valor."""
+    with _generacion_lock:
+        generacion = leer_generacion(ruta_datos) + 1
+        ruta_temporal = ruta_generacion(ruta_datos) + '.tmp'
+        with open(ruta_temporal, 'w', encoding='utf-8') as archivo:
+            archivo.write(str(generacion))
+        os.replace(ruta_temporal, ruta_generacion(ruta_datos))
+        return generacion
+
+
+def normalizar_consulta(query):
+    """Forma canónica de una consulta para usarla como clave del cache."""
+    return _ESPACIOS.sub(' ', query.strip().lower())
+
+
+class CacheConsultas:
+    """Cache LRU acotado con expiración por tiempo y contadores de aciertos y fallos."""
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS, ttl: float = TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = Lock()
+
+    def obtener(self, clave):
+        """Valor guardado para la clave o None si no existe o expiró."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.monotonic() - entrada[0] <= self.ttl:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            if entrada is not None:
+                del self._entradas[clave]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor):
+        """Guardar un valor, descartando el menos usado recientemente si se supera el límite."""
+        with self._lock:
+            self._entradas[clave] = (time.monotonic(), valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        """Vaciar el cache."""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Contadores de aciertos y fallos del cache."""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / total if total else 0.0,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas
+            }
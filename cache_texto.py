@@ -0,0 +1,57 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from extraccion_texto import DPI_OCR, MIN_CARACTERES_PAGINA, extraer_texto
+from metricas import contador
+
+# Cache persistente del texto extraído de los PDFs, direccionado por contenido.
+# La clave combina el SHA-256 del PDF con la configuración del extractor, de modo que el
+# índice invertido, los embeddings y el crawler comparten una sola extracción por
+# documento, y una re-indexación (por ejemplo, tras cambiar el analizador) no vuelve a
+# hacer OCR. Las entradas se guardan comprimidas con gzip en subdirectorios por prefijo.
+
+DIRECTORIO_CACHE_TEXTO = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\cache_texto'
+VERSION_EXTRACTOR = 1
+
+
+LECTURAS_CACHE = contador('buscador_cache_texto_total', 'Lecturas del cache de texto extraído', ('resultado',))
+
+def hash_pdf(pdf_path):
+    """SHA-256 del contenido del PDF."""
+    resumen = hashlib.sha256()
+    with open(pdf_path, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def _ruta_entrada(hash_contenido, dpi, directorio):
+    clave = f"{hash_contenido}-v{VERSION_EXTRACTOR}-dpi{dpi}-min{MIN_CARACTERES_PAGINA}"
+    return os.path.join(directorio, hash_contenido[:2], clave + '.json.gz')
+
+
+def obtener_texto(pdf_path, dpi=DPI_OCR, directorio=DIRECTORIO_CACHE_TEXTO, hash_contenido=None):
+    """
+    Texto del PDF y tiempos por página, leídos del cache o extraídos y guardados en él.
+    En un acierto, los tiempos indican el método "cache" para cada página.
+    `hash_contenido`, si se indica, es el hash_pdf ya calculado por quien llama.
+    """
+    ruta = _ruta_entrada(hash_contenido or hash_pdf(pdf_path), dpi, directorio)
+    if os.path.exists(ruta):
+        LECTURAS_CACHE.incrementar(resultado='acierto')
+        with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+            entrada = json.load(archivo)
+        tiempos = [{"pagina": pagina, "metodo": "cache", "rasterizado_segundos": 0.0, "ocr_segundos": 0.0}
+                   for pagina in range(1, entrada["paginas"] + 1)]
+        return entrada["texto"], tiempos
+
+    LECTURAS_CACHE.incrementar(resultado='fallo')
+    texto, tiempos = extraer_texto(pdf_path, dpi)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(ruta_temporal, 'wt', encoding='utf-8') as archivo:
+        json.dump({"texto": texto, "paginas": len(tiempos)}, archivo, ensure_ascii=False)
+    os.replace(ruta_temporal, ruta)
+    return texto, tiempos
@@ -0,0 +1,88 @@
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock, Thread
+import torch
+from metricas import medido
+
+# Servicio de codificación de consultas con micro-lotes.
+# Las solicitudes que llegan desde distintos hilos de Flask se acumulan durante unos
+# milisegundos (o hasta completar un lote) y se codifican en una sola pasada de BERT con
+# relleno; el promedio de la última capa ignora los tokens de relleno. Los embeddings de
+# las consultas recientes se memorizan para no volver a calcularlos.
+
+MAX_LOTE = 16
+ESPERA_MS = 5
+MAX_MEMORIA = 1024
+
+
+class CodificadorConsultas:
+    """Agrupa las consultas concurrentes en lotes para la inferencia de BERT."""
+
+    def __init__(self, modelo, tokenizador, max_lote: int = MAX_LOTE, espera_ms: float = ESPERA_MS, max_memoria: int = MAX_MEMORIA):
+        self.modelo = modelo
+        self.tokenizador = tokenizador
+        self.max_lote = max_lote
+        self.espera_ms = espera_ms
+        self.max_memoria = max_memoria
+        self.modelo.eval()
+        self._cola = queue.Queue()
+        self._memoria = OrderedDict()
+        self._memoria_lock = Lock()
+        self._hilo = Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    def codificar(self, texto):
+        """Embedding (vector de dimensión 768) de un texto; bloquea hasta que su lote se procese."""
+        with self._memoria_lock:
+            if texto in self._memoria:
+                self._memoria.move_to_end(texto)
+                return self._memoria[texto]
+        futuro = Future()
+        self._cola.put((texto, futuro))
+        return futuro.result()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.espera_ms / 1000
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._procesar(lote)
+
+    def _procesar(self, lote):
+        """Codificar un lote en una sola pasada y resolver los futuros de cada solicitud."""
+        try:
+            textos = list(dict.fromkeys(texto for texto, _ in lote))
+            embeddings = dict(zip(textos, codificar_lote(self.modelo, self.tokenizador, textos)))
+        except Exception as e:
+            for _, futuro in lote:
+                futuro.set_exception(e)
+            return
+
+        with self._memoria_lock:
+            for texto, embedding in embeddings.items():
+                self._memoria[texto] = embedding
+                self._memoria.move_to_end(texto)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+        for texto, futuro in lote:
+            futuro.set_result(embeddings[texto])
+
+
+@medido('inferencia')
+def codificar_lote(modelo, tokenizador, textos):
+    """Embeddings promedio (sin contar el relleno) de una lista de textos como arreglo (n, 768)."""
+    inputs = tokenizador(textos, return_tensors='pt', truncation=True, padding=True)
+    with torch.no_grad():
+        outputs = modelo(**inputs)
+    mascara = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+    suma = (outputs.last_hidden_state * mascara).sum(dim=1)
+    return (suma / mascara.sum(dim=1).clamp(min=1)).numpy()
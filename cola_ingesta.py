@@ -0,0 +1,198 @@
+import os
+import queue
+import time
+from threading import Lock, Thread, Timer
+from actualizar_indice_invertido import obtener_escritor, extraer_palabras
+from actualizar_embeddings import calcular_embeddings, cargar_embeddings, guardar_embeddings
+from cache_texto import obtener_texto, hash_pdf
+from manifiesto import PROCESADO, ERROR
+from fragmentos import obtener_fragmentos
+
+# Cola de ingesta por etapas.
+# Los trabajadores de extracción (OCR y tokenización) alimentan una cola acotada: cuando el
+# escritor no alcanza a consumir, `put` bloquea y la extracción se frena (contrapresión).
+# Un único hilo escritor toma lotes de esa cola, calcula los embeddings del lote y confirma
+# el índice invertido y los embeddings de una sola vez, de modo que nunca hay dos
+# escrituras concurrentes sobre el segmento ni sobre la matriz. Los fallos se reintentan
+# con espera exponencial y, agotados los intentos, pasan a la lista de descartados.
+# El hash del PDF se calcula al extraerlo y viaja con el texto hasta el manifiesto, de modo
+# que el hash registrado corresponde siempre al contenido que se indexó.
+
+TRABAJADORES_EXTRACCION = os.cpu_count() or 4
+CAPACIDAD_COLA = 64
+TAMANO_LOTE_ESCRITURA = 32
+ESPERA_LOTE_SEGUNDOS = 5
+MAX_INTENTOS = 3
+ESPERA_BASE_REINTENTO = 2.0
+
+
+class ColaIngesta:
+    """Pipeline de ingesta: extracción en paralelo, cola acotada y un único escritor por lotes."""
+
+    def __init__(self, output_path: str, embeddings_path: str, manifiesto=None,
+                 trabajadores: int = TRABAJADORES_EXTRACCION, capacidad: int = CAPACIDAD_COLA,
+                 tamano_lote: int = TAMANO_LOTE_ESCRITURA, max_intentos: int = MAX_INTENTOS):
+        self.output_path = output_path
+        self.embeddings_path = embeddings_path
+        self.manifiesto = manifiesto
+        self.trabajadores = trabajadores
+        self.tamano_lote = tamano_lote
+        self.max_intentos = max_intentos
+        self._entrada = queue.Queue()
+        self._extraidos = queue.Queue(maxsize=capacidad)
+        self._en_proceso = set()
+        self._lock = Lock()
+        self.descartados = []
+        self._contadores = {"extraidos": 0, "confirmados": 0, "reintentos": 0, "descartados": 0}
+        self._segundos = {"extraccion": 0.0, "escritura": 0.0}
+        self._inicio = time.monotonic()
+        self._hilos = []
+
+    def iniciar(self):
+        """Iniciar los hilos de extracción y el hilo escritor."""
+        for _ in range(self.trabajadores):
+            self._hilos.append(Thread(target=self._trabajador_extraccion, daemon=True))
+        self._hilos.append(Thread(target=self._escritor, daemon=True))
+        for hilo in self._hilos:
+            hilo.start()
+        return self
+
+    def enviar(self, pdf_path):
+        """Encolar un PDF; se ignora si ya está en proceso. Retorna True si se encoló."""
+        with self._lock:
+            if pdf_path in self._en_proceso:
+                return False
+            self._en_proceso.add(pdf_path)
+        self._entrada.put((pdf_path, 1))
+        return True
+
+    def _fallo(self, pdf_path, intento, error):
+        """Reintentar con espera exponencial o descartar cuando se agotan los intentos."""
+        if intento < self.max_intentos:
+            espera = ESPERA_BASE_REINTENTO * 2 ** (intento - 1)
+            print(f"[WARN] Error procesando {os.path.basename(pdf_path)} (intento {intento}): {error}. Reintento en {espera:.0f} s")
+            with self._lock:
+                self._contadores["reintentos"] += 1
+            temporizador = Timer(espera, self._entrada.put, args=((pdf_path, intento + 1),))
+            temporizador.daemon = True
+            temporizador.start()
+            return
+        print(f"[ERROR] Error procesando {os.path.basename(pdf_path)} tras {intento} intentos: {error}")
+        with self._lock:
+            self._en_proceso.discard(pdf_path)
+            self._contadores["descartados"] += 1
+            self.descartados.append({"ruta": pdf_path, "error": str(error), "intentos": intento, "instante": time.time()})
+        self._marcar(pdf_path, ERROR, error=str(error))
+
+    def _marcar(self, pdf_path, estado, **datos):
+        """Registrar el estado en el manifiesto; un error aquí no detiene los hilos de la cola."""
+        if self.manifiesto is None:
+            return
+        try:
+            self.manifiesto.marcar(pdf_path, estado, **datos)
+        except Exception as e:
+            print(f"[ERROR] No se pudo registrar {os.path.basename(pdf_path)} en el manifiesto: {e}")
+
+    def _trabajador_extraccion(self):
+        while True:
+            pdf_path, intento = self._entrada.get()
+            inicio = time.perf_counter()
+            try:
+                contenido = hash_pdf(pdf_path)
+                texto, _ = obtener_texto(pdf_path, hash_contenido=contenido)
+                if not texto.strip():
+                    raise ValueError("No se pudo extraer texto del archivo")
+                palabras = extraer_palabras(texto)
+            except Exception as e:
+                self._fallo(pdf_path, intento, e)
+                continue
+            with self._lock:
+                self._segundos["extraccion"] += time.perf_counter() - inicio
+                self._contadores["extraidos"] += 1
+            # Bloquea si la cola está llena: contrapresión hacia la extracción
+            self._extraidos.put((pdf_path, intento, texto, palabras, contenido))
+
+    def _tomar_lote(self):
+        """Esperar el primer elemento y completar el lote hasta su tamaño o hasta ESPERA_LOTE_SEGUNDOS."""
+        lote = [self._extraidos.get()]
+        limite = time.monotonic() + ESPERA_LOTE_SEGUNDOS
+        while len(lote) < self.tamano_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._extraidos.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _escritor(self):
+        escritor_indice = obtener_escritor(self.output_path)
+        fragmentos = obtener_fragmentos(self.output_path)
+        while True:
+            lote = self._tomar_lote()
+            try:
+                self._escribir_lote(escritor_indice, fragmentos, lote)
+            except Exception as e:
+                # El escritor es único: un error inesperado no puede terminar el hilo
+                print(f"[ERROR] Error inesperado en el escritor de ingesta: {e}")
+                with self._lock:
+                    self._en_proceso.difference_update(pdf_path for pdf_path, *_ in lote)
+
+    def _escribir_lote(self, escritor_indice, fragmentos, lote):
+        """Confirmar un lote en el índice, los fragmentos y los embeddings, y registrarlo en el manifiesto."""
+        inicio = time.perf_counter()
+        try:
+            validos = []
+            for elemento in lote:
+                pdf_path, intento, _, palabras, _ = elemento
+                try:
+                    escritor_indice.agregar(os.path.basename(pdf_path), palabras)
+                except ValueError as e:
+                    # Solo el documento inválido pasa a reintentos; el resto del lote sigue
+                    self._fallo(pdf_path, intento, e)
+                    continue
+                validos.append(elemento)
+            lote = validos
+            existentes = cargar_embeddings(self.embeddings_path)
+            nombres, pasajes, documentos = [], [], []
+            for pdf_path, _, texto, _, _ in lote:
+                filename = os.path.basename(pdf_path)
+                if filename not in existentes and filename not in nombres:
+                    embeddings_pasajes, embedding_documento = calcular_embeddings(texto)
+                    nombres.append(filename)
+                    pasajes.append(embeddings_pasajes)
+                    documentos.append(embedding_documento)
+            escritor_indice.vaciar()
+            fragmentos.agregar_lote([(os.path.basename(pdf_path), texto) for pdf_path, _, texto, _, _ in lote])
+            if nombres:
+                guardar_embeddings(self.embeddings_path, nombres, pasajes, documentos)
+        except Exception as e:
+            for pdf_path, intento, *_ in lote:
+                self._fallo(pdf_path, intento, e)
+            return
+
+        # Se registra el hash calculado al extraer: el del contenido que efectivamente se indexó
+        for pdf_path, _, _, _, contenido in lote:
+            self._marcar(pdf_path, PROCESADO, hash_contenido=contenido)
+            print(f"[INFO] Archivo procesado correctamente: {os.path.basename(pdf_path)}")
+        with self._lock:
+            self._segundos["escritura"] += time.perf_counter() - inicio
+            self._contadores["confirmados"] += len(lote)
+            self._en_proceso.difference_update(pdf_path for pdf_path, *_ in lote)
+
+    def estadisticas(self):
+        """Profundidad de las colas, contadores y rendimiento de cada etapa."""
+        with self._lock:
+            transcurrido = max(time.monotonic() - self._inicio, 1e-9)
+            return {
+                "pendientes_extraccion": self._entrada.qsize(),
+                "pendientes_escritura": self._extraidos.qsize(),
+                "capacidad_escritura": self._extraidos.maxsize,
+                "en_proceso": len(self._en_proceso),
+                **self._contadores,
+                "extraccion_docs_por_segundo": self._contadores["extraidos"] / transcurrido,
+                "escritura_docs_por_segundo": self._contadores["confirmados"] / transcurrido,
+                "extraccion_segundos": self._segundos["extraccion"],
+                "escritura_segundos": self._segundos["escritura"]
+            }
@@ -1,9 +1,38 @@
-from pymongo import MongoClient
+import os
+from threading import Lock
+from almacen_terminos import AlmacenMongo, AlmacenSQLite
+
+# Backend del almacenamiento de postings: 'mongo' (servidor MongoDB) o 'sqlite' (embebido en
+# el proceso, sin red). Se puede sobrescribir con la variable de entorno BUSCADOR_BACKEND.
+BACKEND = os.environ.get('BUSCADOR_BACKEND', 'mongo')
 
 # Configuración de MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['indice_invertido_decretos_munvalp_test']
-collection = db['indice_invertido_test']
+MONGO_URI = 'mongodb://localhost:27017/'
+NOMBRE_BD = 'indice_invertido_decretos_munvalp_test'
+COLECCION_POSTINGS = 'postings_test'
+COLECCION_DOCUMENTOS = 'documentos_test'
+
+# Configuración del almacenamiento embebido (se puede sobrescribir con BUSCADOR_RUTA_SQLITE)
+RUTA_SQLITE = os.environ.get('BUSCADOR_RUTA_SQLITE', r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\postings_test.db')
+
+_almacen = None
+_lock = Lock()
+
+# Crear el almacenamiento del backend indicado
+def crear_almacen(backend=None):
+    backend = backend or BACKEND
+    if backend == 'sqlite':
+        return AlmacenSQLite(RUTA_SQLITE)
+    if backend == 'mongo':
+        from pymongo import MongoClient  # Solo se necesita pymongo con este backend
+        db = MongoClient(MONGO_URI)[NOMBRE_BD]
+        return AlmacenMongo(db[COLECCION_POSTINGS], db[COLECCION_DOCUMENTOS])
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
 
-# Validación
-#print(f"[DEBUG] Tipo de 'collection' en config_db: {type(collection)}")
\ No newline at end of file
+# Obtener el almacenamiento compartido del proceso (se crea en el primer uso)
+def obtener_almacen():
+    global _almacen
+    with _lock:
+        if _almacen is None:
+            _almacen = crear_almacen()
+        return _almacen
@@ -1,71 +1,151 @@
 import os
 import time
 from threading import Thread, Lock
-from concurrent.futures import ThreadPoolExecutor
-from actualizar_indice_invertido import actualizar_indice_invertido
-from actualizar_embeddings import actualizar_embeddings
+from manifiesto import Manifiesto, PENDIENTE, MODIFICADO, ELIMINADO
+from cola_ingesta import ColaIngesta
+from metadatos_documentos import ELIMINADO as ESTADO_ELIMINADO, obtener_metadatos
+
+try:
+    # watchdog usa inotify en Linux (y los mecanismos nativos en Windows y macOS)
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
 
 # Configuraciones y rutas
 RUTA_DOCUMENTOS = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\decretos_2023_test'
 OUTPUT_PATH = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\indice_invertido_con_stopwords_normalizados_avanzado_test.json'
 EMBEDDINGS_PATH = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\embeddings_avanzado.npy'
-CHECK_INTERVAL = 120  # Intervalo de verificación en segundos
-ARCHIVO_PROCESADOS = 'archivos_procesados.txt'
+CHECK_INTERVAL = 120  # Intervalo de verificación en segundos (solo sin watchdog)
+ESTABILIDAD_SEGUNDOS = 2  # Tiempo sin eventos antes de procesar un archivo (evita leerlo a medio copiar)
+ARCHIVO_PROCESADOS = 'archivos_procesados.txt'  # Registro histórico, se migra al manifiesto
+RUTA_MANIFIESTO = 'manifiesto_crawler.db'
 lock = Lock()
+_manifiesto = None
+_colas = {}
+
+# Obtener el manifiesto compartido del crawler
+def obtener_manifiesto():
+    global _manifiesto
+    with lock:
+        if _manifiesto is None:
+            _manifiesto = Manifiesto(RUTA_MANIFIESTO)
+        return _manifiesto
 
-# Cargar lista de archivos procesados
-def cargar_archivos_procesados():
-    if os.path.exists(ARCHIVO_PROCESADOS):
-        with open(ARCHIVO_PROCESADOS, 'r', encoding='utf-8') as f:
-            return set(line.strip() for line in f.readlines())
-    return set()
+# Obtener la cola de ingesta compartida para un par de rutas de índice y embeddings
+def obtener_cola(output_path, embeddings_path):
+    manifiesto = obtener_manifiesto()
+    with lock:
+        if (output_path, embeddings_path) not in _colas:
+            _colas[(output_path, embeddings_path)] = ColaIngesta(output_path, embeddings_path, manifiesto).iniciar()
+        return _colas[(output_path, embeddings_path)]
 
-# Registrar un archivo como procesado
-def guardar_archivo_procesado(filename):
-    with open(ARCHIVO_PROCESADOS, 'a', encoding='utf-8') as f:
-        f.write(f"{filename}\n")
+# Obtener la cola de ingesta de un par de rutas solo si ya fue creada (None si no; no inicia trabajadores)
+def cola_existente(output_path, embeddings_path):
+    with lock:
+        return _colas.get((output_path, embeddings_path))
 
-# Procesar un documento PDF
+# Procesar un documento PDF: se envía a la cola de ingesta, el único escritor del índice y los embeddings
 def procesar_documento(pdf_path, filename, output_path, embeddings_path):
-    try:
-        print(f"[INFO] Procesando nuevo archivo: {filename}")
-        # Actualizar índice invertido
-        actualizar_indice_invertido(pdf_path, filename, output_path)
+    if obtener_cola(output_path, embeddings_path).enviar(pdf_path):
+        print(f"[INFO] Archivo encolado para procesar: {filename}")
 
-        # Actualizar embeddings
-        actualizar_embeddings(pdf_path, filename, embeddings_path)
+# Encolar los archivos pendientes del manifiesto en la cola de ingesta
+def procesar_pendientes(output_path, embeddings_path):
+    cola = obtener_cola(output_path, embeddings_path)
+    encolados = sum(cola.enviar(pdf_path) for pdf_path in obtener_manifiesto().con_estado(PENDIENTE))
+    if encolados:
+        print(f"[INFO] Detectados {encolados} nuevos archivos.")
 
-        # Registrar archivo como procesado
-        guardar_archivo_procesado(filename)
-        print(f"[INFO] Archivo procesado correctamente: {filename}")
-    except Exception as e:
-        print(f"[ERROR] Error procesando {filename}: {e}")
+# Informar cambios que el índice no puede aplicar por sí solo; los eliminados se marcan en los metadatos
+# (quedan fuera de las búsquedas sin reescribir sus postings)
+def informar_cambios(cambios, output_path):
+    for ruta, estado in cambios.items():
+        if estado == MODIFICADO:
+            print(f"[WARN] Archivo modificado después de indexarse: {os.path.basename(ruta)}")
+        elif estado == ELIMINADO:
+            print(f"[WARN] Archivo eliminado de la carpeta: {os.path.basename(ruta)}")
+            obtener_metadatos(output_path).cambiar_estado(os.path.basename(ruta), ESTADO_ELIMINADO)
 
-# Verificar y procesar nuevos archivos
+# Verificar y procesar nuevos archivos (reconciliación por stat contra el manifiesto)
 def check_for_new_files(folder_path, output_path, embeddings_path):
-    archivos_procesados = cargar_archivos_procesados()
-    current_files = set(f for f in os.listdir(folder_path) if f.endswith('.pdf'))
-    nuevos_archivos = current_files - archivos_procesados
-
-    if nuevos_archivos:
-        print(f"[INFO] Detectados {len(nuevos_archivos)} nuevos archivos.")
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            for filename in nuevos_archivos:
-                pdf_path = os.path.join(folder_path, filename)
-                executor.submit(procesar_documento, pdf_path, filename, output_path, embeddings_path)
+    manifiesto = obtener_manifiesto()
+    manifiesto.migrar_archivos_procesados(ARCHIVO_PROCESADOS, folder_path)
+    cambios = manifiesto.reconciliar(folder_path)
+    informar_cambios(cambios, output_path)
+    if manifiesto.con_estado(PENDIENTE):
+        procesar_pendientes(output_path, embeddings_path)
     else:
         print("[INFO] No se detectaron nuevos archivos.")
 
-# Iniciar el crawler en un hilo continuo
+
+class ManejadorEventos(FileSystemEventHandler):
+    """Registra las rutas de PDF creadas, modificadas, movidas o eliminadas en la carpeta."""
+
+    def __init__(self):
+        self.cambios = {}
+        self.lock = Lock()
+
+    def _anotar(self, ruta):
+        if ruta.endswith('.pdf'):
+            with self.lock:
+                self.cambios[ruta] = time.monotonic()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._anotar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._anotar(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._anotar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._anotar(event.src_path)
+            self._anotar(event.dest_path)
+
+    def estables(self):
+        """Rutas sin eventos nuevos durante ESTABILIDAD_SEGUNDOS (se retiran de la lista)."""
+        ahora = time.monotonic()
+        with self.lock:
+            listas = [ruta for ruta, instante in self.cambios.items() if ahora - instante >= ESTABILIDAD_SEGUNDOS]
+            for ruta in listas:
+                del self.cambios[ruta]
+        return listas
+
+# Iniciar el crawler: reconciliación inicial y luego eventos del sistema de archivos (o sondeo)
 def start_crawler(folder_path, output_path, embeddings_path):
+    check_for_new_files(folder_path, output_path, embeddings_path)
+    if Observer is None:
+        print(f"[INFO] watchdog no está instalado; se revisará la carpeta cada {CHECK_INTERVAL} segundos.")
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            check_for_new_files(folder_path, output_path, embeddings_path)
+
+    manejador = ManejadorEventos()
+    observador = Observer()
+    observador.schedule(manejador, folder_path, recursive=False)
+    observador.start()
+    manifiesto = obtener_manifiesto()
     while True:
-        check_for_new_files(folder_path, output_path, embeddings_path)
-        time.sleep(CHECK_INTERVAL)
+        time.sleep(1)
+        cambios = {}
+        for ruta in manejador.estables():
+            estado = manifiesto.registrar(ruta)
+            if estado is not None:
+                cambios[ruta] = estado
+        informar_cambios(cambios, output_path)
+        if PENDIENTE in cambios.values():
+            procesar_pendientes(output_path, embeddings_path)
 
 if __name__ == '__main__':
     print("[INFO] Iniciando Crawler...")
 
-    # El programa solo escucha archivos nuevos; no procesa los existentes.
     thread = Thread(target=start_crawler, args=(RUTA_DOCUMENTOS, OUTPUT_PATH, EMBEDDINGS_PATH))
     thread.daemon = True
     thread.start()
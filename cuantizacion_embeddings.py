@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+import numpy as np
+from almacen_embeddings import AlmacenEmbeddings, normalizar
+
+# Representación cuantizada de la matriz de embeddings para el recorrido de candidatos.
+# 'int8' guarda cada dimensión escalada a [-127, 127] con una escala por dimensión (4x menos
+# memoria) y 'float16' la matriz en media precisión (2x menos). La copia cuantizada queda
+# residente en memoria; los `k * FACTOR_RERANKING` mejores candidatos se reordenan con el
+# producto exacto en float32 leyendo solo esas filas de la matriz mapeada del almacén.
+# Solo el escritor de ingesta (guardar_embeddings) persiste el archivo; los lectores lo cargan
+# y cuantizan en memoria las filas que todavía no tenga.
+
+FACTOR_RERANKING = 4
+TAMANO_BLOQUE = 4096  # Filas por bloque convertido a float32 (unos 12 MB con 768 dimensiones)
+
+
+def ruta_cuantizada(ruta_embeddings, tipo):
+    """Ruta de la matriz cuantizada de un tipo ('int8' o 'float16') junto a los embeddings."""
+    return os.path.splitext(ruta_embeddings)[0] + f'_{tipo}.npz'
+
+
+class AlmacenCuantizado:
+    """Búsqueda de candidatos sobre embeddings cuantizados con reordenamiento exacto."""
+
+    def __init__(self, almacen: AlmacenEmbeddings, ruta: str, tipo: str = 'int8'):
+        if tipo not in ('int8', 'float16'):
+            raise ValueError(f"Tipo de cuantización desconocido: {tipo}")
+        self.almacen = almacen
+        self.ruta = ruta
+        self.tipo = tipo
+        self._filas = np.empty((0, almacen.dimension), dtype=np.int8 if tipo == 'int8' else np.float16)
+        self.escalas = np.ones(almacen.dimension, dtype=np.float32)
+        if os.path.exists(ruta):
+            with np.load(ruta) as datos:
+                self._filas = datos['matriz']
+                self.escalas = datos['escalas']
+        elif tipo == 'int8' and len(almacen) > 0:
+            # Escala por dimensión a partir de la matriz completa; las filas futuras se recortan a ella
+            self.escalas = np.maximum(np.abs(almacen.matriz).max(axis=0), 1e-12).astype(np.float32) / 127
+        self.matriz = self._filas
+        self.sincronizar()
+
+    def _cuantizar(self, vectores):
+        vectores = np.asarray(vectores, dtype=np.float32)
+        if self.tipo == 'float16':
+            return vectores.astype(np.float16)
+        return np.clip(np.rint(vectores / self.escalas), -127, 127).astype(np.int8)
+
+    def sincronizar(self):
+        """
+        Cuantizar en memoria las filas agregadas al almacén desde la última vez. Retorna cuántas.
+        Las filas se escriben en un búfer con capacidad que se duplica al llenarse, así que la
+        matriz residente no se copia completa en cada sincronización.
+        """
+        inicio = len(self.matriz)
+        total = len(self.almacen)
+        if inicio >= total:
+            return 0
+        if total > len(self._filas):
+            filas = np.empty((max(total, 2 * len(self._filas)), self._filas.shape[1]), dtype=self._filas.dtype)
+            filas[:inicio] = self.matriz
+            self._filas = filas
+        for i in range(inicio, total, TAMANO_BLOQUE):
+            self._filas[i:min(i + TAMANO_BLOQUE, total)] = self._cuantizar(self.almacen.matriz[i:i + TAMANO_BLOQUE])
+        self.matriz = self._filas[:total]
+        return total - inicio
+
+    def guardar(self):
+        """Persistir la matriz cuantizada y sus escalas (solo desde el escritor de ingesta o la línea de comandos)."""
+        ruta_temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(ruta_temporal, matriz=self.matriz, escalas=self.escalas)
+        os.replace(ruta_temporal, self.ruta)
+
+    def memoria_bytes(self):
+        """Memoria residente de la representación cuantizada."""
+        return self._filas.nbytes + self.escalas.nbytes
+
+    def _puntajes_aproximados(self, consulta):
+        """
+        Producto aproximado de la consulta con cada fila. Cada bloque de TAMANO_BLOQUE filas se
+        convierte a float32 en un mismo búfer, así la memoria transitoria no crece con la matriz.
+        """
+        consulta = (consulta * self.escalas if self.tipo == 'int8' else consulta).astype(np.float32)
+        puntajes = np.empty(len(self.matriz), dtype=np.float32)
+        bufer = np.empty((min(TAMANO_BLOQUE, len(self.matriz)), self.matriz.shape[1]), dtype=np.float32)
+        for inicio in range(0, len(self.matriz), TAMANO_BLOQUE):
+            bloque = self.matriz[inicio:inicio + TAMANO_BLOQUE]
+            convertido = bufer[:len(bloque)]
+            convertido[...] = bloque
+            np.matmul(convertido, consulta, out=puntajes[inicio:inicio + len(bloque)])
+        return puntajes
+
+    def buscar(self, vector_consulta, k=10, factor_reranking=FACTOR_RERANKING):
+        """Los `k` documentos más similares: candidatos cuantizados y reordenamiento exacto en float32."""
+        if len(self.matriz) == 0:
+            return []
+        consulta = normalizar(vector_consulta).ravel()
+        aproximados = self._puntajes_aproximados(consulta)
+        n_candidatos = min(len(aproximados), max(k, k * factor_reranking))
+        candidatos = np.sort(np.argpartition(-aproximados, n_candidatos - 1)[:n_candidatos])
+        similitudes = self.almacen.matriz[candidatos] @ consulta
+        k = min(k, len(candidatos))
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        return [(self.almacen.ids[candidatos[i]], float(similitudes[i])) for i in mejores]
+
+
+def recall_cuantizado(almacen, cuantizado, consultas, k=10, factor_reranking=FACTOR_RERANKING):
+    """Recall@k promedio de la búsqueda cuantizada frente a la exacta y latencia media en ms."""
+    aciertos = 0
+    tiempo_total = 0.0
+    for consulta in consultas:
+        exactos = {doc_id for doc_id, _ in almacen.buscar(consulta, k)}
+        inicio = time.perf_counter()
+        aproximados = {doc_id for doc_id, _ in cuantizado.buscar(consulta, k, factor_reranking)}
+        tiempo_total += time.perf_counter() - inicio
+        aciertos += len(exactos & aproximados) / max(1, len(exactos))
+    return aciertos / len(consultas), 1000 * tiempo_total / len(consultas)
+
+
+if __name__ == '__main__':
+    # Uso: python cuantizacion_embeddings.py <ruta_embeddings> [int8|float16] [n_consultas] [k]
+    # Construye (o actualiza) la matriz cuantizada y mide recall@k y memoria frente a float32.
+    # Con la ruta de pasajes (<embeddings>_pasajes.npy) cuantiza la matriz de pasajes.
+    if len(sys.argv) < 2:
+        print("Error: Debe indicar la ruta del archivo de embeddings.")
+        sys.exit(1)
+    ruta_embeddings = sys.argv[1]
+    tipo = sys.argv[2] if len(sys.argv) > 2 else 'int8'
+    n_consultas = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    k = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+    almacen = AlmacenEmbeddings(ruta_embeddings)
+    cuantizado = AlmacenCuantizado(almacen, ruta_cuantizada(ruta_embeddings, tipo), tipo)
+    cuantizado.guardar()
+    print(f"[INFO] {len(almacen)} embeddings: float32 {almacen.matriz.nbytes / 2**20:.1f} MiB, "
+          f"{tipo} {cuantizado.memoria_bytes() / 2**20:.1f} MiB")
+
+    rng = np.random.default_rng(1)
+    filas = rng.choice(len(almacen), min(n_consultas, len(almacen)), replace=False)
+    consultas = np.asarray(almacen.matriz[np.sort(filas)]) + rng.normal(0, 0.02, (len(filas), almacen.dimension)).astype(np.float32)
+    for factor in (1, 2, 4, 8):
+        recall, latencia = recall_cuantizado(almacen, cuantizado, consultas, k, factor)
+        print(f"factor_reranking={factor}  recall@{k}={recall:.4f}  latencia={latencia:.3f} ms por consulta")
@@ -0,0 +1,152 @@
+import heapq
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from analizador import plegar, raiz
+
+# Expansión de términos por prefijo y por similitud (errores de OCR).
+# El diccionario del segmento ya está ordenado; se copia una vez a una lista de cadenas
+# ordenada que funciona como un trie implícito: los términos que empiezan con un prefijo
+# forman un rango contiguo que se ubica con dos búsquedas binarias. La búsqueda difusa
+# recorre ese trie en profundidad llevando la fila de la matriz de Levenshtein del
+# prefijo actual (un autómata de Levenshtein simulado): una rama se abandona apenas el
+# mínimo de su fila supera la distancia permitida, así que solo se visitan los prefijos
+# que todavía pueden quedar a distancia 1 o 2 del término, sin recorrer el vocabulario.
+# Como en las consultas difusas de Lucene, las primeras letras deben coincidir (el
+# recorrido parte del rango de ese prefijo) y solo se busca a distancia 2 si no hay
+# ningún término a distancia 1.
+# Las expansiones tienen un límite por término y entran al ranking con un peso menor que
+# el de los términos exactos.
+
+# Prefijo explícito en la consulta: palabra terminada en * (p. ej. "municip*")
+_PREFIJO = re.compile(r'(\w+)\*')
+_FIN_RANGO = '\U0010ffff'
+
+# Largo mínimo del término para expandir por prefijo y para tolerar 1 o 2 errores
+LARGO_MIN_PREFIJO = 3
+LARGO_MIN_DIFUSO = 4
+LARGO_DISTANCIA_2 = 8
+
+# Letras iniciales que deben coincidir en la búsqueda difusa
+PREFIJO_FIJO = 1
+
+# Cantidad máxima de expansiones por término
+MAX_EXPANSIONES_PREFIJO = 20
+MAX_EXPANSIONES_DIFUSAS = 5
+
+# Peso en el ranking de cada expansión respecto del término exacto
+PESO_PREFIJO = 0.8
+PESO_DISTANCIA = {1: 0.6, 2: 0.3}
+
+EXPANSIONES_EN_CACHE = 4096
+
+
+def separar_prefijos(query):
+    """Quitar de la consulta las palabras terminadas en * y retornar (consulta, raíces de los prefijos)."""
+    prefijos = [raiz(plegar(prefijo)) for prefijo in _PREFIJO.findall(query)]
+    return _PREFIJO.sub(' ', query), [prefijo for prefijo in prefijos if len(prefijo) >= LARGO_MIN_PREFIJO]
+
+
+def distancia_maxima(termino):
+    """Errores tolerados según el largo del término (los términos cortos no se expanden)."""
+    if len(termino) < LARGO_MIN_DIFUSO:
+        return 0
+    return 2 if len(termino) >= LARGO_DISTANCIA_2 else 1
+
+
+class DiccionarioTerminos:
+    """Términos de un segmento en una lista ordenada, con expansión por prefijo y por distancia de edición."""
+
+    def __init__(self, segmento):
+        self.segmento = segmento
+        self.terminos = list(segmento.terminos())
+        self.similares = lru_cache(maxsize=EXPANSIONES_EN_CACHE)(self._similares)
+
+    def __len__(self):
+        return len(self.terminos)
+
+    def rango(self, prefijo, bajo=0, alto=None):
+        """Posiciones [inicio, fin) de los términos que empiezan con `prefijo`."""
+        alto = len(self.terminos) if alto is None else alto
+        inicio = bisect_left(self.terminos, prefijo, bajo, alto)
+        return inicio, bisect_left(self.terminos, prefijo + _FIN_RANGO, inicio, alto)
+
+    def con_prefijo(self, prefijo, limite=MAX_EXPANSIONES_PREFIJO):
+        """Hasta `limite` términos que empiezan con `prefijo`, los más frecuentes primero."""
+        inicio, fin = self.rango(prefijo)
+        mejores = heapq.nlargest(limite, range(inicio, fin), key=self.segmento.df_por_posicion)
+        return [self.terminos[i] for i in mejores]
+
+    def _similares(self, termino, distancia=None, limite=MAX_EXPANSIONES_DIFUSAS):
+        """
+        Hasta `limite` pares (término, distancia) a distancia de edición entre 1 y `distancia`
+        del término, ordenados por distancia y luego por frecuencia.
+        """
+        distancia = distancia_maxima(termino) if distancia is None else distancia
+        for maxima in range(1, distancia + 1):
+            encontrados = self._recorrer(termino, maxima)
+            if encontrados:
+                return [(similar, d) for d, _, similar in sorted(encontrados)[:limite]]
+        return []
+
+    def _recorrer(self, termino, distancia):
+        """Lista de (distancia, -df, término) de los términos a distancia entre 1 y `distancia`."""
+        largo = len(termino)
+        tope = distancia + 1
+        fijo = termino[:PREFIJO_FIJO]
+        inicio, fin = self.rango(fijo)
+        # Fila de Levenshtein del prefijo fijo; fuera de la banda de la diagonal vale `tope`
+        fila = [min(j, tope) for j in range(largo + 1)]
+        for profundidad, letra in enumerate(fijo, 1):
+            fila, _ = _fila_siguiente(termino, fila, letra, profundidad, distancia)
+        encontrados = []
+        # Cada entrada: (prefijo, rango de términos con ese prefijo, fila de Levenshtein del prefijo)
+        pila = [(fijo, inicio, fin, fila)]
+        while pila:
+            prefijo, inicio, fin, fila = pila.pop()
+            if inicio < fin and self.terminos[inicio] == prefijo:
+                if 0 < fila[largo] <= distancia:
+                    encontrados.append((fila[largo], -self.segmento.df_por_posicion(inicio), prefijo))
+                inicio += 1
+            profundidad = len(prefijo) + 1
+            while inicio < fin:
+                letra = self.terminos[inicio][profundidad - 1]
+                siguiente = prefijo + letra
+                _, fin_hijo = self.rango(siguiente, inicio, fin)
+                nueva, minimo = _fila_siguiente(termino, fila, letra, profundidad, distancia)
+                if minimo <= distancia:
+                    pila.append((siguiente, inicio, fin_hijo, nueva))
+                inicio = fin_hijo
+        return encontrados
+
+
+def _fila_siguiente(termino, fila, letra, profundidad, distancia):
+    """Fila de Levenshtein al agregar `letra` al prefijo (solo la banda de ancho 2 * distancia + 1) y su mínimo."""
+    tope = distancia + 1
+    nueva = [tope] * (len(termino) + 1)
+    nueva[0] = minimo = min(profundidad, tope)
+    for j in range(max(1, profundidad - distancia), min(len(termino), profundidad + distancia) + 1):
+        valor = min(nueva[j - 1] + 1, fila[j] + 1, fila[j - 1] + (termino[j - 1] != letra), tope)
+        nueva[j] = valor
+        if valor < minimo:
+            minimo = valor
+    return nueva, minimo
+
+
+def expandir_consulta(diccionario, terminos, prefijos=()):
+    """
+    Pesos de los términos para el ranking: los exactos con su frecuencia en la consulta; los
+    que no están en el diccionario se reemplazan por sus términos similares y cada prefijo
+    por los términos que lo completan, con pesos menores.
+    """
+    pesos = {}
+    for termino in terminos:
+        if diccionario.segmento.buscar(termino) >= 0:
+            pesos[termino] = pesos.get(termino, 0) + 1
+            continue
+        for similar, distancia in diccionario.similares(termino):
+            pesos[similar] = max(pesos.get(similar, 0), PESO_DISTANCIA[distancia])
+    for prefijo in prefijos:
+        for completo in diccionario.con_prefijo(prefijo):
+            pesos[completo] = max(pesos.get(completo, 0), PESO_PREFIJO)
+    return pesos
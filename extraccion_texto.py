@@ -0,0 +1,89 @@
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from metricas import medir, observar_etapa
+
+# Extracción de texto de PDFs página a página.
+# Primero se lee la capa de texto incrustada del PDF con `pdftotext` (Poppler, ya requerido
+# por pdf2image); solo las páginas sin texto útil pasan por OCR. Cada página a OCR se
+# rasteriza por separado, de modo que nunca hay más imágenes en memoria que trabajadores,
+# y las páginas se reparten en un pool: cada rasterización (pdftoppm) y cada OCR
+# (tesseract) corre en su propio proceso, así que los hilos del pool solo esperan procesos
+# externos y el trabajo se reparte entre todos los núcleos.
+
+DPI_OCR = 200
+MIN_CARACTERES_PAGINA = 20  # Menos caracteres visibles que esto se considera una página escaneada
+TRABAJADORES_OCR = os.cpu_count() or 4
+
+_pool = None
+_pool_lock = Lock()
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=TRABAJADORES_OCR)
+        return _pool
+
+
+def texto_incrustado(pdf_path):
+    """Texto de la capa incrustada de cada página (lista por página) o None si no se pudo leer."""
+    try:
+        salida = subprocess.run(['pdftotext', '-layout', '-enc', 'UTF-8', pdf_path, '-'],
+                                capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    paginas = salida.decode('utf-8', errors='replace').split('\f')
+    # pdftotext termina cada página con un salto de página; el último fragmento queda vacío
+    return paginas[:-1] if paginas and not paginas[-1].strip() else paginas
+
+
+def _ocr_pagina(pdf_path, pagina, dpi):
+    """Rasterizar y aplicar OCR a una sola página. Retorna (texto, segundos rasterizando, segundos de OCR)."""
+    import pytesseract  # Dependencias del OCR: se importan en el primer uso
+    from pdf2image import convert_from_path
+    inicio = time.perf_counter()
+    imagen = convert_from_path(pdf_path, dpi=dpi, first_page=pagina, last_page=pagina)[0]
+    rasterizado = time.perf_counter()
+    texto = pytesseract.image_to_string(imagen)
+    imagen.close()
+    return texto, rasterizado - inicio, time.perf_counter() - rasterizado
+
+
+def extraer_texto(pdf_path, dpi=DPI_OCR):
+    """
+    Extraer el texto de un PDF.
+    Retorna el texto completo y una lista con el método y los tiempos de cada página.
+    """
+    from pdf2image import pdfinfo_from_path
+    n_paginas = pdfinfo_from_path(pdf_path)['Pages']
+    with medir('texto_incrustado'):
+        incrustado = texto_incrustado(pdf_path) or []
+    textos = [''] * n_paginas
+    tiempos = []
+    pendientes = {}
+    for pagina in range(1, n_paginas + 1):
+        texto = incrustado[pagina - 1] if pagina <= len(incrustado) else ''
+        if len(''.join(texto.split())) >= MIN_CARACTERES_PAGINA:
+            textos[pagina - 1] = texto
+            tiempos.append({"pagina": pagina, "metodo": "texto", "rasterizado_segundos": 0.0, "ocr_segundos": 0.0})
+        else:
+            pendientes[pagina] = _obtener_pool().submit(_ocr_pagina, pdf_path, pagina, dpi)
+
+    for pagina, futuro in pendientes.items():
+        texto, segundos_rasterizado, segundos_ocr = futuro.result()
+        textos[pagina - 1] = texto
+        observar_etapa('rasterizado', segundos_rasterizado)
+        observar_etapa('ocr', segundos_ocr)
+        tiempos.append({
+            "pagina": pagina,
+            "metodo": "ocr",
+            "rasterizado_segundos": round(segundos_rasterizado, 6),
+            "ocr_segundos": round(segundos_ocr, 6)
+        })
+
+    tiempos.sort(key=lambda tiempo: tiempo["pagina"])
+    return '\n'.join(textos), tiempos
@@ -1,93 +1,265 @@
-from crawler import start_crawler, check_for_new_files
-from actualizar_embeddings import cargar_embeddings, actualizar_embeddings
-from actualizar_indice_invertido import cargar_indice, actualizar_indice_invertido
-from transformers import BertTokenizer, BertModel
-from pymongo import MongoClient
+from crawler import start_crawler, check_for_new_files, obtener_cola
+from actualizar_embeddings import cargar_embeddings, ruta_pasajes
+from almacen_embeddings import AlmacenEmbeddings
+from actualizar_indice_invertido import cargar_indice
+from indice_ann import IndiceIVF, ruta_indice_ann
+from cuantizacion_embeddings import AlmacenCuantizado, ruta_cuantizada
+from motor_bm25 import BuscadorBM25
+from segmento_indice import ruta_segmento
+from cache_consultas import CacheConsultas, leer_generacion, normalizar_consulta
+from analizador import analizar
+from busqueda_posicional import interpretar_consulta
+from diccionario_terminos import separar_prefijos
+from fragmentos import obtener_fragmentos
+from metadatos_documentos import normalizar_filtros, obtener_metadatos
+from config_db import obtener_almacen
+from modelos import CALENTAR_MODELOS, obtener_codificador, verificar_modelo_almacen
+from metricas import contador, medir, traza_consulta
+from threading import Thread
+import heapq
 import numpy as np
 import os
-import torch
+
+# Paginación de resultados: tamaño por omisión y máximo de una página
+TAMANO_PAGINA = 10
+MAX_TAMANO_PAGINA = 100
+
+# Agregación de los puntajes de pasajes por documento ('max' o 'sum')
+AGREGACION_PASAJES = 'max'
+
+# Pasajes candidatos por documento pedido en la búsqueda aproximada de pasajes
+PASAJES_POR_DOCUMENTO = 8
+
+# Rutas por omisión del índice y de los embeddings
+OUTPUT_PATH = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\indice_invertido_con_stopwords_normalizados_avanzado_test.json'
+EMBEDDINGS_PATH = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\embeddings_avanzado_test.npy'
+
+RESPUESTAS = contador('buscador_consultas_total', 'Consultas de búsqueda según la etapa que las respondió', ('respuesta',))
 
 
 class BuscadorFacade:
-    def __init__(self, ruta_documentos: str, debug: bool = False):
+    def __init__(self, ruta_documentos: str, debug: bool = False, almacen=None, output_path: str = OUTPUT_PATH,
+                 embeddings_path: str = EMBEDDINGS_PATH, iniciar_crawler: bool = True, codificador=None):
         self.ruta_documentos = ruta_documentos
         self.debug = debug
 
         # Rutas
-        self.output_path = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\indice_invertido_con_stopwords_normalizados_avanzado_test.json'
-        self.embeddings_path = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\embeddings_avanzado_test.npy'
+        self.output_path = output_path
+        self.embeddings_path = embeddings_path
+
+        # Almacenamiento de postings (MongoDB o embebido, según config_db); respaldo cuando no hay segmento local
+        self.almacen = almacen or obtener_almacen()
+        try:
+            self.almacen.crear_indices()
+        except Exception as e:
+            print(f"[WARN] No se pudieron crear los índices del almacenamiento: {e}")
+
+        # Ranking BM25 sobre el segmento binario del índice
+        self.bm25 = BuscadorBM25(ruta_segmento(self.output_path))
+
+        # Cache de resultados, invalidado por la generación del índice y de los embeddings
+        self.cache = CacheConsultas()
+
+        # Texto y posiciones de términos por documento para los fragmentos resaltados
+        self.fragmentos = obtener_fragmentos(self.output_path)
 
-        # Conexión a MongoDB
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['indice_invertido_decretos_munvalp_test']
-        self.collection = db['indice_invertido_test']
+        # Metadatos por documento (año, número de norma, estado) para filtrar antes de puntuar;
+        # un índice construido antes de existir la tabla se carga desde su segmento
+        self.metadatos = obtener_metadatos(self.output_path)
+        if len(self.metadatos) == 0 and self.bm25.motor() is not None:
+            self.metadatos.desde_segmento(self.bm25.motor().segmento)
 
-        # Inicializar BERT
-        self.tokenizador = BertTokenizer.from_pretrained('dccuchile/bert-base-spanish-wwm-uncased')
-        self.modelo = BertModel.from_pretrained('dccuchile/bert-base-spanish-wwm-uncased')
+        # Codificación de consultas en micro-lotes compartida por los hilos de Flask
+        # (el modelo se carga desde el registro en la primera consulta semántica, o al iniciar si se pide calentarlo)
+        # (se puede inyectar otro codificador con un método codificar(texto), p. ej. en benchmarks)
+        self.codificador = codificador or (obtener_codificador() if CALENTAR_MODELOS else None)
 
-        # Cargar embeddings
+        # Cargar embeddings (por documento y por pasaje) y, si existe, el índice aproximado
         self.embeddings = cargar_embeddings(self.embeddings_path)
+        self._recargar_embeddings(leer_generacion(self.embeddings.ruta_matriz))
 
-        # Iniciar el crawler
-        start_crawler(self.ruta_documentos, self.output_path, self.embeddings_path)
+        # Iniciar el crawler en segundo plano (vigila la carpeta sin bloquear al buscador)
+        self.hilo_crawler = None
+        if iniciar_crawler:
+            self.hilo_crawler = Thread(target=start_crawler, args=(self.ruta_documentos, self.output_path, self.embeddings_path), daemon=True)
+            self.hilo_crawler.start()
 
-    def buscar_documentos(self, query: str):
+    def buscar_documentos(self, query: str, pagina: int = 1, tamano: int = TAMANO_PAGINA, filtros: dict = None):
         """
         Buscar documentos relevantes basados en la consulta.
+        Solo se calculan los primeros pagina * tamano resultados; se retorna la página pedida,
+        cada resultado con un fragmento del texto con los términos de la consulta resaltados.
+        `filtros` (anio, norma_desde, norma_hasta, estado) restringe los documentos antes de puntuarlos.
         """
         try:
-            print(f"[DEBUG] Consulta recibida: {query}")
-            resultados = self._buscar_por_terminos(query)
-            if not resultados:
-                print("[DEBUG] No se encontraron documentos por términos.")
-                resultados = self._procesar_con_embeddings(query)
-            return resultados
+            if self.debug:
+                print(f"[DEBUG] Consulta recibida: {query}")
+            pagina = max(1, int(pagina))
+            tamano = min(max(1, int(tamano)), MAX_TAMANO_PAGINA)
+            with traza_consulta(query, pagina=pagina, tamano=tamano, filtros=normalizar_filtros(filtros)):
+                return self._buscar_pagina(query, pagina, tamano, filtros)
         except Exception as e:
             print(f"[ERROR] Error al buscar documentos: {e}")
             return []
 
-    def _buscar_por_terminos(self, query: str):
+    def _buscar_pagina(self, query: str, pagina: int, tamano: int, filtros: dict = None):
+        """
+        Resultados de la página pedida (desde el cache o calculando los primeros pagina * tamano).
+        """
+        k = pagina * tamano
+        generacion = self.generacion()
+        if generacion[1] != self._generacion_embeddings:
+            self._recargar_embeddings(generacion[1])
+        clave = (normalizar_consulta(query), generacion, k, normalizar_filtros(filtros), self.metadatos.version())
+        resultados = self.cache.obtener(clave)
+        if resultados is not None:
+            RESPUESTAS.incrementar(respuesta='cache')
+        else:
+            documentos = self.metadatos.documentos(filtros)
+            # Sin filtros no se arma el conjunto de admitidos: solo se excluyen los eliminados
+            excluidos = self.metadatos.eliminados() if documentos is None else None
+            if documentos is not None and not documentos:
+                RESPUESTAS.incrementar(respuesta='sin_documentos_filtrados')
+                resultados = []
+            else:
+                resultados = self._buscar_por_terminos(query, k, documentos, excluidos)
+                if resultados:
+                    RESPUESTAS.incrementar(respuesta='terminos')
+                else:
+                    if self.debug:
+                        print("[DEBUG] No se encontraron documentos por términos.")
+                    resultados = self._procesar_con_embeddings(query, k, documentos, excluidos)
+                    RESPUESTAS.incrementar(respuesta='embeddings')
+            self.cache.guardar(clave, resultados)
+        return self._con_fragmentos(resultados[(pagina - 1) * tamano:k], analizar(query))
+
+    def _con_fragmentos(self, resultados, terminos):
+        """
+        Copiar los resultados de la página agregando su fragmento resaltado.
+        """
+        with medir('fragmentos'):
+            return [dict(resultado, fragmento=self.fragmentos.fragmento(resultado["documento"], terminos)) for resultado in resultados]
+
+    def _recargar_embeddings(self, generacion):
+        """
+        Volver a mapear los embeddings después de que el crawler confirmó documentos nuevos.
+        """
+        verificar_modelo_almacen(self.embeddings_path)
+        self.embeddings = AlmacenEmbeddings(self.embeddings_path)
+        self.pasajes = AlmacenEmbeddings(ruta_pasajes(self.embeddings_path))
+        self.indice_ann, self.cuantizado = self._busqueda_aproximada(self.embeddings, self.embeddings_path)
+        self.indice_ann_pasajes, self.cuantizado_pasajes = self._busqueda_aproximada(self.pasajes, ruta_pasajes(self.embeddings_path))
+        # Documentos sin pasajes (p. ej. migrados del diccionario histórico): se puntúan con su embedding de documento
+        self.sin_pasajes = set(self.embeddings.ids).difference(self.pasajes.ids)
+        self._generacion_embeddings = generacion
+
+    def _busqueda_aproximada(self, almacen, ruta_embeddings):
+        """
+        Índice IVF y matriz cuantizada de un almacén de embeddings, si fueron construidos (None si no).
+        Se cargan y se sincronizan en memoria; solo el escritor de ingesta los vuelve a guardar.
+        """
+        indice_ann = None
+        if os.path.exists(ruta_indice_ann(ruta_embeddings)):
+            indice_ann = IndiceIVF.cargar(almacen, ruta_indice_ann(ruta_embeddings))
+        for tipo in ('int8', 'float16'):
+            if os.path.exists(ruta_cuantizada(ruta_embeddings, tipo)):
+                return indice_ann, AlmacenCuantizado(almacen, ruta_cuantizada(ruta_embeddings, tipo), tipo)
+        return indice_ann, None
+
+    def generacion(self):
+        """
+        Generación actual del índice invertido y de los embeddings.
+        """
+        return leer_generacion(ruta_segmento(self.output_path)), leer_generacion(self.embeddings.ruta_matriz)
+
+    def _buscar_por_terminos(self, query: str, k: int = TAMANO_PAGINA, documentos=None, excluidos=None):
         """
-        Buscar documentos directamente por términos en el índice invertido.
+        Buscar los `k` mejores documentos por términos en el índice invertido, ordenados por BM25.
+        `documentos`, si se indica, es el conjunto de nombres admitidos por los filtros y
+        `excluidos` el de los nombres que no deben aparecer (los eliminados).
         """
         try:
-            terms = query.lower().split()
-            doc_ids = []
-            for term in terms:
-                cursor = self.collection.find({"word": term})
-                for resultado in cursor:
-                    if "documents" in resultado:
-                        doc_ids.extend([doc["documento"] for doc in resultado["documents"]])
-            return list(set(doc_ids))
+            # Palabras terminadas en * se expanden por prefijo; los términos que no están en el
+            # índice (errores de OCR o de tipeo) se expanden a términos similares
+            query, prefijos = separar_prefijos(query)
+            # Frases entre comillas y NEAR/k restringen los documentos; todos los términos puntúan
+            terms, restricciones = interpretar_consulta(query)
+            if self.bm25.motor() is not None:
+                with medir('bm25'):
+                    return [
+                        {"documento": doc_id, "puntaje": puntaje}
+                        for doc_id, puntaje in self.bm25.buscar(terms, k, restricciones=restricciones, prefijos=prefijos,
+                                                                   documentos=documentos, excluidos=excluidos)
+                    ]
+
+            # Sin segmento local: unión sin ranking desde el almacenamiento, en una sola consulta
+            candidatos = self.almacen.documentos_con_terminos(terms)
+            if documentos is not None:
+                candidatos &= documentos
+            if excluidos:
+                candidatos -= excluidos
+            return [{"documento": doc_id} for doc_id in sorted(candidatos)[:k]]
         except Exception as e:
             print(f"[ERROR] Error al buscar documentos por términos: {e}")
             return []
 
-    def _procesar_con_embeddings(self, query: str):
+    def _procesar_con_embeddings(self, query: str, k: int = TAMANO_PAGINA, documentos=None, excluidos=None):
         """
-        Buscar documentos utilizando embeddings.
+        Buscar los `k` documentos más similares utilizando embeddings: los documentos con pasajes
+        se puntúan por sus pasajes y los que no tienen (p. ej. migrados) por su embedding de documento.
+        `documentos`, si se indica, es el conjunto de nombres admitidos por los filtros y
+        `excluidos` el de los nombres que no deben aparecer (se piden tantos resultados más como excluidos haya).
         """
         try:
             embedding_query = self.obtener_embeddings(query)
-            resultados = []
-            for doc_id, embedding_doc in self.embeddings.items():
-                similitud = self.similitud_coseno(embedding_query, embedding_doc)
-                resultados.append({"documento": doc_id, "similitud": similitud})
-            return sorted(resultados, key=lambda x: x["similitud"], reverse=True)
+            excluidos = excluidos or ()
+            pedidos = k + len(excluidos)
+            with medir('busqueda_vectorial'):
+                candidatos = self._buscar_pasajes(embedding_query, pedidos, documentos) + self._buscar_sin_pasajes(embedding_query, pedidos, documentos)
+            mejores = heapq.nlargest(k, (par for par in candidatos if par[0] not in excluidos), key=lambda par: par[1])
+            return [{"documento": doc_id, "similitud": similitud} for doc_id, similitud in mejores]
         except Exception as e:
             print(f"[ERROR] Error al procesar con embeddings: {e}")
             return []
 
+    def _buscar_pasajes(self, embedding_query, k: int, documentos=None):
+        """
+        Los `k` mejores documentos según sus pasajes. Sin filtro, con agregación 'max' y un índice
+        aproximado (o cuantizado) de pasajes, se agrupan sus mejores pasajes por documento.
+        """
+        if len(self.pasajes) == 0:
+            return []
+        aproximado = self.indice_ann_pasajes or self.cuantizado_pasajes
+        if documentos is None and aproximado is not None and AGREGACION_PASAJES == 'max':
+            mejores = {}
+            for doc_id, similitud in aproximado.buscar(embedding_query, k * PASAJES_POR_DOCUMENTO):
+                mejores.setdefault(doc_id, similitud)  # Vienen ordenados: el primero de cada documento es su máximo
+            return list(mejores.items())[:k]
+        return self.pasajes.buscar_agregado(embedding_query, k, AGREGACION_PASAJES, documentos)
+
+    def _buscar_sin_pasajes(self, embedding_query, k: int, documentos=None):
+        """
+        Los `k` mejores documentos sin pasajes según su embedding de documento. Si ningún documento
+        tiene pasajes se usa el índice aproximado o la matriz cuantizada; si no, se recorren
+        exactamente solo las filas de los documentos sin pasajes (o las admitidas por el filtro).
+        """
+        if not self.sin_pasajes:
+            return []
+        if documentos is None and len(self.sin_pasajes) == len(self.embeddings):
+            return (self.indice_ann or self.cuantizado or self.embeddings).buscar(embedding_query, k)
+        admitidos = self.sin_pasajes if documentos is None else self.sin_pasajes & documentos
+        return self.embeddings.buscar(embedding_query, k, admitidos)
+
     def obtener_embeddings(self, texto: str):
         """
-        Obtener embeddings para un texto usando BERT.
+        Obtener embeddings para un texto usando BERT (en lote con otras consultas concurrentes).
         """
         try:
-            inputs = self.tokenizador(texto, return_tensors="pt", truncation=True, padding=True)
-            with torch.no_grad():
-                outputs = self.modelo(**inputs)
-            return outputs.last_hidden_state.mean(dim=1).numpy().squeeze()
+            if self.codificador is None:
+                self.codificador = obtener_codificador()
+            # Incluye la espera del micro-lote; la inferencia del lote se mide en codificar_lote
+            with medir('codificacion_consulta'):
+                return self.codificador.codificar(texto)
         except Exception as e:
             print(f"[ERROR] Error al obtener embeddings: {e}")
             return None
@@ -103,27 +275,31 @@ class BuscadorFacade:
             return 0.0
         return producto_punto / (magnitud1 * magnitud2)
 
-    def actualizar_indice(self, pdf_path: str):
+    def _encolar(self, pdf_path: str):
         """
-        Actualizar el índice invertido.
+        Enviar un PDF a la cola de ingesta, el único escritor del índice, los fragmentos y los embeddings.
+        Retorna True si se encoló (False si ya estaba en proceso o si falló).
         """
         try:
-            filename = os.path.basename(pdf_path)
-            actualizar_indice_invertido(pdf_path, filename, self.output_path, self.collection)
-            print(f"[INFO] Índice invertido actualizado para {filename}")
+            encolado = obtener_cola(self.output_path, self.embeddings_path).enviar(pdf_path)
+            if encolado:
+                print(f"[INFO] Archivo encolado para procesar: {os.path.basename(pdf_path)}")
+            return encolado
         except Exception as e:
-            print(f"[ERROR] Error al actualizar el índice: {e}")
+            print(f"[ERROR] Error al encolar {pdf_path}: {e}")
+            return False
+
+    def actualizar_indice(self, pdf_path: str):
+        """
+        Actualizar el índice invertido (a través de la cola de ingesta, que también calcula los embeddings).
+        """
+        return self._encolar(pdf_path)
 
     def actualizar_embeddings(self, pdf_path: str):
         """
-        Actualizar embeddings.
+        Actualizar embeddings (a través de la cola de ingesta, que también actualiza el índice invertido).
         """
-        try:
-            filename = os.path.basename(pdf_path)
-            actualizar_embeddings(pdf_path, filename, self.embeddings_path)
-            print(f"[INFO] Embeddings actualizados para {filename}")
-        except Exception as e:
-            print(f"[ERROR] Error al actualizar embeddings: {e}")
+        return self._encolar(pdf_path)
 
     def ejecutar_crawler(self):
         """
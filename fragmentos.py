@@ -0,0 +1,128 @@
+import html
+import os
+import sqlite3
+from threading import Lock
+from analizador import _TOKEN, plegar, raiz, terminos_con_posiciones
+from cache_consultas import CacheConsultas
+
+# Fragmentos de texto con los términos de la consulta resaltados.
+# Al indexar un documento se guarda su texto plano y, por cada término (raíz) que contiene,
+# la posición de su primera aparición. Al mostrar un resultado basta con una consulta por
+# clave a SQLite para ubicar el término más temprano de la consulta y un `substr` de la
+# ventana alrededor, sin volver a leer el PDF ni a recorrer el texto completo. Los
+# fragmentos ya armados se guardan en un cache LRU por (documento, términos).
+
+ANCHO_FRAGMENTO = 240
+FRAGMENTOS_EN_CACHE = 4096
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS textos (
+    documento TEXT PRIMARY KEY,
+    texto TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posiciones (
+    documento TEXT NOT NULL,
+    termino TEXT NOT NULL,
+    inicio INTEGER NOT NULL,
+    PRIMARY KEY (documento, termino)
+) WITHOUT ROWID;
+"""
+
+
+def ruta_fragmentos(ruta_indice):
+    """Ruta de la base de textos y posiciones asociada a la ruta del índice."""
+    return os.path.splitext(ruta_indice)[0] + '_fragmentos.db'
+
+
+def resaltar(texto, terminos):
+    """Escapar el texto como HTML y envolver en <mark> los tokens cuya raíz está en `terminos`."""
+    partes = []
+    anterior = 0
+    for coincidencia in _TOKEN.finditer(plegar(texto)):
+        if raiz(coincidencia.group()) in terminos:
+            partes.append(html.escape(texto[anterior:coincidencia.start()]))
+            partes.append('<mark>' + html.escape(texto[coincidencia.start():coincidencia.end()]) + '</mark>')
+            anterior = coincidencia.end()
+    partes.append(html.escape(texto[anterior:]))
+    return ''.join(partes)
+
+
+class AlmacenFragmentos:
+    """Texto plano y primeras posiciones de cada término por documento, para armar fragmentos."""
+
+    def __init__(self, ruta: str, ancho: int = ANCHO_FRAGMENTO, max_cache: int = FRAGMENTOS_EN_CACHE):
+        self.ruta = ruta
+        self.ancho = ancho
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+        self._lock = Lock()
+        # Sin expiración: el fragmento de un documento solo cambia si se vuelve a indexar
+        self.cache = CacheConsultas(max_cache, ttl=float('inf'))
+
+    def agregar_lote(self, documentos):
+        """Guardar el texto y las posiciones de una lista de (documento, texto) en una sola transacción."""
+        filas_textos = []
+        filas_posiciones = []
+        for documento, texto in documentos:
+            primeras = {}
+            for termino, inicio in terminos_con_posiciones(texto):
+                primeras.setdefault(termino, inicio)
+            filas_textos.append((documento, texto))
+            filas_posiciones.extend((documento, termino, inicio) for termino, inicio in primeras.items())
+        with self._lock:
+            self._conexion.execute("BEGIN")
+            try:
+                self._conexion.executemany("DELETE FROM posiciones WHERE documento = ?", [(documento,) for documento, _ in filas_textos])
+                self._conexion.executemany("INSERT OR REPLACE INTO textos (documento, texto) VALUES (?, ?)", filas_textos)
+                self._conexion.executemany("INSERT INTO posiciones (documento, termino, inicio) VALUES (?, ?, ?)", filas_posiciones)
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+        self.cache.limpiar()
+
+    def agregar(self, documento, texto):
+        """Guardar el texto y las posiciones de un documento."""
+        self.agregar_lote([(documento, texto)])
+
+    def fragmento(self, documento, terminos):
+        """HTML con la ventana del texto alrededor del primer término de la consulta, resaltado."""
+        terminos = frozenset(terminos)
+        clave = (documento, terminos)
+        resultado = self.cache.obtener(clave)
+        if resultado is not None:
+            return resultado
+
+        marcadores = ', '.join('?' * len(terminos))
+        with self._lock:
+            fila = self._conexion.execute(
+                f"SELECT MIN(inicio) FROM posiciones WHERE documento = ? AND termino IN ({marcadores})",
+                (documento, *terminos)
+            ).fetchone() if terminos else None
+            inicio = max(0, fila[0] - self.ancho // 4) if fila and fila[0] is not None else 0
+            # substr de SQLite cuenta caracteres desde 1
+            fila = self._conexion.execute(
+                "SELECT substr(texto, ?, ?), length(texto) FROM textos WHERE documento = ?",
+                (inicio + 1, self.ancho, documento)
+            ).fetchone()
+        if fila is None:
+            resultado = ''
+        else:
+            ventana, largo = fila
+            ventana = ' '.join(ventana.split())
+            resultado = ('… ' if inicio > 0 else '') + resaltar(ventana, terminos) + (' …' if inicio + self.ancho < largo else '')
+        self.cache.guardar(clave, resultado)
+        return resultado
+
+
+_almacenes = {}
+_almacenes_lock = Lock()
+
+
+def obtener_fragmentos(ruta_indice):
+    """Almacén de fragmentos compartido por el proceso para la ruta del índice."""
+    with _almacenes_lock:
+        if ruta_indice not in _almacenes:
+            _almacenes[ruta_indice] = AlmacenFragmentos(ruta_fragmentos(ruta_indice))
+        return _almacenes[ruta_indice]
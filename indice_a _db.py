@@ -1,49 +1,51 @@
 import os
 import json
-import re
-import pytesseract
 import time
-from pdf2image import convert_from_path
-from PIL import Image
-from nltk.corpus import stopwords
-from pymongo import MongoClient
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from math import log
-from pymongo.errors import ConnectionFailure
-
-# Cargar stopwords en español y agregar letras individuales a eliminar
-stop_words = set(stopwords.words('spanish'))
-stop_words.update(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z'])
+from segmento_indice import SegmentoIndice, escribir_segmento, existe_segmento, ruta_segmento
+from matriz_tfidf import guardar_tfidf, ruta_tfidf
+from fragmentos import AlmacenFragmentos, ruta_fragmentos
+from metadatos_documentos import obtener_metadatos, ruta_metadatos
+from config_db import BACKEND, obtener_almacen
+from cache_texto import obtener_texto
+from analizador import PALABRAS_VACIAS, raiz, tokenizar
+from actualizar_indice_invertido import extract_norma_number_and_year
+from metricas import medir, observar_etapa
+
+try:
+    from pymongo.errors import ConnectionFailure
+except ImportError:
+    # Sin pymongo solo se usa el almacenamiento embebido
+    class ConnectionFailure(Exception):
+        pass
+
+# Stopwords en español (plegadas) más letras individuales, compartidas con las consultas
+stop_words = PALABRAS_VACIAS
 
 def pdf_to_text(pdf_path):
-    """Convertir PDF a texto usando OCR y contar las páginas."""
-    images = convert_from_path(pdf_path)
-    text = ''
-    for image in images:
-        text += pytesseract.image_to_string(image)
-    return text, len(images)  # Retorna el texto y el número de páginas
-
-def extract_norma_number_and_year(filename):
-    """Extraer el número de norma y el año del nombre del archivo."""
-    match = re.search(r'Decreto_Nº_(\d+)_del_(\d{4})', filename)
-    if match:
-        norma_number = match.group(1)
-        year = match.group(2)
-        return norma_number, year
-    return None, None
+    """Convertir PDF a texto (cache, capa de texto incrustada u OCR por página) y contar las páginas."""
+    text, page_times = obtener_texto(pdf_path)
+    return text, len(page_times), page_times  # Retorna el texto, el número de páginas y los tiempos por página
 
 def process_pdf_file(pdf_path):
-    """Procesar un archivo PDF y devolver las palabras utilizadas, eliminadas y el número de páginas."""
-    text, num_pages = pdf_to_text(pdf_path)
-    text = text.lower()
-    words = re.findall(r'\b[a-záéíóúñü]+\b', text)
-    used_words = [word for word in words if word not in stop_words]
-    removed_words = [word for word in words if word in stop_words]
-    return used_words, removed_words, num_pages
-
-def build_inverted_index_parallel(folder_path, used_words_path, removed_words_path, stats_path, processing_times_path):
-    """Construir el índice invertido, calcular TF-IDF, contar palabras utilizadas y eliminadas, y calcular tiempos de procesamiento."""
+    """Procesar un archivo PDF y devolver las palabras utilizadas, eliminadas, el número de páginas, los tiempos por página,
+    el texto y los segundos que tomó procesarlo (medidos en el hilo trabajador, no al recoger el resultado)."""
+    start = time.perf_counter()
+    text, num_pages, page_times = pdf_to_text(pdf_path)
+    with medir('tokenizacion'):
+        words = tokenizar(text)
+        used_words = [raiz(word) for word in words if word not in stop_words]
+        removed_words = [word for word in words if word in stop_words]
+    return used_words, removed_words, num_pages, page_times, text, time.perf_counter() - start
+
+def build_inverted_index_parallel(folder_path, used_words_path, removed_words_path, stats_path, processing_times_path, fragments_path=None):
+    """Construir el índice invertido, calcular TF-IDF, contar palabras utilizadas y eliminadas, y calcular tiempos de procesamiento.
+    Si se indica fragments_path, guarda el texto y las posiciones de los términos para los fragmentos de resultados.
+    Retorna el índice, la longitud (en palabras utilizadas) de cada documento y las posiciones de cada término por documento."""
     inverted_index = {}
+    doc_lengths = {}
+    doc_positions = {}
     doc_count = 0
     word_doc_count = {}
     total_used_words = 0
@@ -60,6 +62,8 @@ def build_inverted_index_parallel(folder_path, used_words_path, removed_words_pa
     all_removed_words = []
     processing_times = []  # Lista para almacenar tiempos de procesamiento de cada archivo
 
+    fragments = AlmacenFragmentos(fragments_path) if fragments_path else None
+
     start_time = time.time()
 
     with ThreadPoolExecutor() as executor:
@@ -70,11 +74,10 @@ def build_inverted_index_parallel(folder_path, used_words_path, removed_words_pa
             doc_id = os.path.splitext(filename)[0]
             norma_number, year = extract_norma_number_and_year(filename)
             try:
-                # Medir tiempo de procesamiento por archivo
-                file_start_time = time.time()
-                used_words, removed_words, num_pages = future.result()
-                file_end_time = time.time()
-                processing_time = file_end_time - file_start_time
+                # Tiempo de procesamiento por archivo, medido dentro de process_pdf_file
+                # (future.result() después de as_completed ya no espera nada)
+                used_words, removed_words, num_pages, page_times, text, processing_time = future.result()
+                observar_etapa('procesamiento_pdf', processing_time)
 
                 # Evitar dividir por cero en el cálculo de tiempo por hoja
                 avg_time_per_page = processing_time / num_pages if num_pages > 0 else 0
@@ -84,7 +87,8 @@ def build_inverted_index_parallel(folder_path, used_words_path, removed_words_pa
                     "file": filename,
                     "total_time_seconds": round(processing_time, 6),
                     "pages": num_pages,
-                    "avg_time_per_page_seconds": round(avg_time_per_page, 6)
+                    "avg_time_per_page_seconds": round(avg_time_per_page, 6),
+                    "pages_detail": page_times
                 })
 
                 # Acumular tiempos y páginas totales
@@ -98,9 +102,16 @@ def build_inverted_index_parallel(folder_path, used_words_path, removed_words_pa
                 total_removed_words += len(removed_words)
                 total_words_per_page += (len(used_words) + len(removed_words)) / num_pages if num_pages > 0 else 0
                 doc_count += 1
+                if fragments is not None:
+                    fragments.agregar(filename, text)
 
                 word_counts = {word: used_words.count(word) for word in set(used_words)}
                 total_words = len(used_words)
+                doc_lengths[filename] = total_words
+                positions = {}
+                for position, word in enumerate(used_words):
+                    positions.setdefault(word, []).append(position)
+                doc_positions[filename] = positions
 
                 for word, count in word_counts.items():
                     if word not in inverted_index:
@@ -171,7 +182,7 @@ def build_inverted_index_parallel(folder_path, used_words_path, removed_words_pa
         json.dump(processing_times, times_file, ensure_ascii=False, indent=4)
     print(f"Tiempos de procesamiento guardados en {processing_times_path}")
 
-    return inverted_index
+    return inverted_index, doc_lengths, doc_positions
 
 def save_inverted_index_to_json(inverted_index, output_path):
     """Guardar el índice invertido en un archivo JSON."""
@@ -179,69 +190,62 @@ def save_inverted_index_to_json(inverted_index, output_path):
     with open(output_path, 'w', encoding='utf-8') as json_file:
         json.dump(sorted_index, json_file, ensure_ascii=False, indent=4)
 
-def save_inverted_index_to_mongodb(inverted_index, db_name, collection_name):
-    """Guardar el índice invertido en MongoDB."""
+def save_inverted_index_to_segment(inverted_index, output_path, doc_lengths=None, doc_positions=None):
+    """Guardar el índice invertido como segmento binario mapeable en memoria (y su índice posicional, si se entregan las posiciones)."""
+    segment_path = ruta_segmento(output_path)
+    with medir('escritura_segmento'):
+        escribir_segmento(segment_path, inverted_index, doc_lengths, doc_positions)
+    print(f"Segmento del índice guardado en {segment_path}")
+    guardar_tfidf(segment_path)
+    print(f"Matriz TF-IDF guardada en {ruta_tfidf(segment_path)}")
+    with SegmentoIndice(segment_path) as segment:
+        obtener_metadatos(output_path).desde_segmento(segment)
+    print(f"Metadatos de documentos guardados en {ruta_metadatos(output_path)}")
+
+def save_inverted_index_to_store(inverted_index):
+    """Guardar el índice invertido en el almacenamiento de postings configurado (MongoDB o embebido)."""
     try:
-        client = MongoClient('mongodb://localhost:27017/')
-        client.admin.command('ping')
-        
-        db = client[db_name]
-        collection = db[collection_name]
-        
-        documents = [{'word': word, 'documents': docs} for word, docs in inverted_index.items()]
-        if documents:
-            collection.insert_many(documents)
-            print(f"{len(documents)} documentos insertados en MongoDB en la colección '{collection_name}'")
+        almacen = obtener_almacen()
+        if inverted_index:
+            postings, documents = almacen.cargar_indice(inverted_index)
+            print(f"{postings} postings y {documents} documentos guardados en el almacenamiento '{BACKEND}'")
         else:
-            print("No hay documentos para insertar en MongoDB.")
-            
+            print("No hay documentos para guardar en el almacenamiento.")
     except ConnectionFailure:
         print("Error: No se pudo conectar a MongoDB. Verifique la conexión.")
     except Exception as e:
-        print(f"Error al insertar documentos en MongoDB: {e}")
+        print(f"Error al guardar el índice en el almacenamiento: {e}")
 
-def load_json_to_mongodb(json_path, db_name, collection_name):
-    """Cargar un archivo JSON en MongoDB."""
+def load_json_to_store(json_path):
+    """Cargar un archivo JSON en el almacenamiento de postings."""
     try:
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client[db_name]
-        collection = db[collection_name]
-        
         with open(json_path, 'r', encoding='utf-8') as json_file:
             data = json.load(json_file)
-        
-        documents = [{'word': word, 'documents': docs} for word, docs in data.items()]
-        
-        if documents:
-            collection.insert_many(documents)
-            print(f"{len(documents)} documentos insertados desde JSON a MongoDB en la colección '{collection_name}'")
-        else:
-            print("No hay documentos para insertar en MongoDB.")
-            
+        save_inverted_index_to_store(data)
     except Exception as e:
-        print(f"Error al cargar JSON a MongoDB: {e}")
+        print(f"Error al cargar JSON al almacenamiento: {e}")
 
-# Configurar paths y conexión a MongoDB
+# Configurar paths (el almacenamiento de postings se configura en config_db)
 folder_path = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\decretos_2023_test"
 output_path = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\indice_invertido_con_stopwords_normalizados_avanzado_test.json"
 used_words_path = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\used_words_test.json"
 removed_words_path = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\removed_words_test.json"
 stats_path = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\stats_test.json"
 processing_times_path = r"C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\processing_times_test.json"
-db_name = 'indice_invertido_decretos_munvalp_test'
-collection_name = 'indice_invertido_test'
 
-# Verificar si el archivo JSON ya existe y está completo
-if os.path.exists(output_path):
+# Verificar si el segmento o el archivo JSON histórico ya existen y están completos
+if existe_segmento(ruta_segmento(output_path)):
+    print(f"El segmento del índice ya existe en {ruta_segmento(output_path)}")
+elif os.path.exists(output_path):
     try:
         with open(output_path, 'r', encoding='utf-8') as f:
-            json.load(f)
-        load_json_to_mongodb(output_path, db_name, collection_name)
+            save_inverted_index_to_segment(json.load(f), output_path)
+        load_json_to_store(output_path)
     except (json.JSONDecodeError, FileNotFoundError):
-        inverted_index = build_inverted_index_parallel(folder_path, used_words_path, removed_words_path, stats_path, processing_times_path)
-        save_inverted_index_to_json(inverted_index, output_path)
-        save_inverted_index_to_mongodb(inverted_index, db_name, collection_name)
+        inverted_index, doc_lengths, doc_positions = build_inverted_index_parallel(folder_path, used_words_path, removed_words_path, stats_path, processing_times_path, ruta_fragmentos(output_path))
+        save_inverted_index_to_segment(inverted_index, output_path, doc_lengths, doc_positions)
+        save_inverted_index_to_store(inverted_index)
 else:
-    inverted_index = build_inverted_index_parallel(folder_path, used_words_path, removed_words_path, stats_path, processing_times_path)
-    save_inverted_index_to_json(inverted_index, output_path)
-    save_inverted_index_to_mongodb(inverted_index, db_name, collection_name)
+    inverted_index, doc_lengths, doc_positions = build_inverted_index_parallel(folder_path, used_words_path, removed_words_path, stats_path, processing_times_path, ruta_fragmentos(output_path))
+    save_inverted_index_to_segment(inverted_index, output_path, doc_lengths, doc_positions)
+    save_inverted_index_to_store(inverted_index)
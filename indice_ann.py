@@ -0,0 +1,166 @@
+import os
+import sys
+import threading
+import time
+import numpy as np
+from almacen_embeddings import AlmacenEmbeddings, normalizar
+
+# Índice aproximado de vecinos cercanos (IVF) sobre la matriz de embeddings.
+# Un k-means esférico agrupa las filas en `n_listas` listas invertidas; una consulta solo
+# recorre las `n_sondeos` listas cuyos centroides son más parecidos a ella. Más sondeos
+# significan más recall y más latencia. El índice guarda solo los centroides y la lista
+# asignada a cada fila; los vectores se leen de la matriz mapeada del almacén.
+# Solo el escritor de ingesta (guardar_embeddings) persiste el índice; los lectores lo cargan
+# e insertan en memoria las filas que todavía no tenga.
+
+N_SONDEOS = 8
+ITERACIONES_KMEANS = 20
+MUESTRAS_POR_LISTA = 256
+TAMANO_BLOQUE = 65536
+
+
+def ruta_indice_ann(ruta_embeddings):
+    """Ruta del índice IVF junto al archivo de embeddings."""
+    return os.path.splitext(ruta_embeddings)[0] + '_ivf.npz'
+
+
+class IndiceIVF:
+    """Índice IVF con cuantizador grueso k-means para la búsqueda semántica."""
+
+    def __init__(self, almacen: AlmacenEmbeddings, ruta: str, centroides, asignaciones, n_sondeos: int = N_SONDEOS):
+        self.almacen = almacen
+        self.ruta = ruta
+        self.centroides = centroides
+        self.asignaciones = asignaciones
+        self.n_sondeos = n_sondeos
+        self._construir_listas()
+
+    def _construir_listas(self):
+        """Agrupar las filas por lista a partir del arreglo de asignaciones."""
+        orden = np.argsort(self.asignaciones, kind='stable')
+        limites = np.searchsorted(self.asignaciones[orden], np.arange(len(self.centroides) + 1))
+        self.listas = [orden[limites[c]:limites[c + 1]] for c in range(len(self.centroides))]
+
+    def _asignar(self, vectores):
+        """Lista más cercana para cada vector, procesando por bloques para acotar memoria."""
+        asignaciones = np.empty(len(vectores), dtype=np.int32)
+        for inicio in range(0, len(vectores), TAMANO_BLOQUE):
+            bloque = np.asarray(vectores[inicio:inicio + TAMANO_BLOQUE])
+            asignaciones[inicio:inicio + len(bloque)] = np.argmax(bloque @ self.centroides.T, axis=1)
+        return asignaciones
+
+    @classmethod
+    def entrenar(cls, almacen, ruta, n_listas=None, iteraciones=ITERACIONES_KMEANS, n_sondeos=N_SONDEOS, semilla=0):
+        """Entrenar los centroides con k-means esférico sobre una muestra y asignar todas las filas."""
+        total = len(almacen)
+        if total == 0:
+            raise ValueError("No hay embeddings para entrenar el índice IVF.")
+        n_listas = min(total, n_listas or max(1, int(np.sqrt(total))))
+        rng = np.random.default_rng(semilla)
+        muestra = np.asarray(almacen.matriz[np.sort(rng.choice(total, min(total, n_listas * MUESTRAS_POR_LISTA), replace=False))])
+        centroides = muestra[rng.choice(len(muestra), n_listas, replace=False)].copy()
+
+        for _ in range(iteraciones):
+            asignaciones = np.argmax(muestra @ centroides.T, axis=1)
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, asignaciones, muestra)
+            conteos = np.bincount(asignaciones, minlength=n_listas)
+            vacias = conteos == 0
+            sumas[vacias] = muestra[rng.choice(len(muestra), int(vacias.sum()))]
+            centroides = normalizar(sumas)
+
+        indice = cls(almacen, ruta, centroides, np.empty(0, dtype=np.int32), n_sondeos)
+        indice.asignaciones = indice._asignar(almacen.matriz)
+        indice._construir_listas()
+        return indice
+
+    @classmethod
+    def cargar(cls, almacen, ruta, n_sondeos=N_SONDEOS):
+        """Cargar el índice persistido y sincronizarlo en memoria con las filas nuevas del almacén (no lo guarda)."""
+        with np.load(ruta) as datos:
+            indice = cls(almacen, ruta, datos['centroides'], datos['asignaciones'], n_sondeos)
+        indice.sincronizar()
+        return indice
+
+    def guardar(self):
+        """Persistir centroides y asignaciones junto al archivo de embeddings (solo desde el escritor de ingesta o la línea de comandos)."""
+        ruta_temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(ruta_temporal, centroides=self.centroides, asignaciones=self.asignaciones)
+        os.replace(ruta_temporal, self.ruta)
+
+    def sincronizar(self):
+        """Insertar en sus listas las filas agregadas al almacén desde la última vez. Retorna cuántas."""
+        inicio = len(self.asignaciones)
+        if inicio >= len(self.almacen):
+            return 0
+        nuevas = self._asignar(self.almacen.matriz[inicio:])
+        self.asignaciones = np.concatenate([self.asignaciones, nuevas])
+        for lista in np.unique(nuevas):
+            filas = inicio + np.flatnonzero(nuevas == lista)
+            self.listas[lista] = np.concatenate([self.listas[lista], filas])
+        return len(nuevas)
+
+    def buscar(self, vector_consulta, k=10, n_sondeos=None):
+        """Los `k` documentos aproximadamente más similares como lista de (doc_id, similitud)."""
+        if len(self.asignaciones) == 0:
+            return []
+        consulta = normalizar(vector_consulta).ravel()
+        n_sondeos = min(n_sondeos or self.n_sondeos, len(self.centroides))
+        cercanas = np.argpartition(-(self.centroides @ consulta), n_sondeos - 1)[:n_sondeos]
+        candidatos = np.sort(np.concatenate([self.listas[lista] for lista in cercanas]))
+        if len(candidatos) == 0:
+            return []
+        similitudes = self.almacen.matriz[candidatos] @ consulta
+        k = min(k, len(candidatos))
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        return [(self.almacen.ids[candidatos[i]], float(similitudes[i])) for i in mejores]
+
+
+def recall_en_k(almacen, indice, consultas, k=10, n_sondeos=None):
+    """Recall@k promedio del índice IVF frente a la búsqueda exacta y latencia media en ms."""
+    aciertos = 0
+    tiempo_total = 0.0
+    for consulta in consultas:
+        exactos = {doc_id for doc_id, _ in almacen.buscar(consulta, k)}
+        inicio = time.perf_counter()
+        aproximados = {doc_id for doc_id, _ in indice.buscar(consulta, k, n_sondeos)}
+        tiempo_total += time.perf_counter() - inicio
+        aciertos += len(exactos & aproximados) / max(1, len(exactos))
+    return aciertos / len(consultas), 1000 * tiempo_total / len(consultas)
+
+
+if __name__ == '__main__':
+    # Uso: python indice_ann.py <ruta_embeddings> [n_consultas] [k]
+    # Entrena (o carga) el índice y compara recall@k y latencia contra la búsqueda exacta.
+    # Con la ruta de pasajes (<embeddings>_pasajes.npy) construye el índice de los pasajes.
+    if len(sys.argv) < 2:
+        print("Error: Debe indicar la ruta del archivo de embeddings.")
+        sys.exit(1)
+    ruta_embeddings = sys.argv[1]
+    n_consultas = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    almacen = AlmacenEmbeddings(ruta_embeddings)
+    ruta = ruta_indice_ann(ruta_embeddings)
+    if os.path.exists(ruta):
+        indice = IndiceIVF.cargar(almacen, ruta)
+    else:
+        indice = IndiceIVF.entrenar(almacen, ruta)
+    indice.guardar()
+    print(f"[INFO] {len(almacen)} embeddings, {len(indice.centroides)} listas")
+
+    # Consultas: embeddings del corpus con ruido, para que no coincidan exactamente con una fila
+    rng = np.random.default_rng(1)
+    filas = rng.choice(len(almacen), min(n_consultas, len(almacen)), replace=False)
+    consultas = np.asarray(almacen.matriz[np.sort(filas)]) + rng.normal(0, 0.02, (len(filas), almacen.dimension)).astype(np.float32)
+
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        almacen.buscar(consulta, k)
+    print(f"Búsqueda exacta: {1000 * (time.perf_counter() - inicio) / len(consultas):.3f} ms por consulta")
+    for n_sondeos in (1, 2, 4, 8, 16, 32, 64):
+        if n_sondeos > len(indice.centroides):
+            break
+        recall, latencia = recall_en_k(almacen, indice, consultas, k, n_sondeos)
+        print(f"n_sondeos={n_sondeos:3d}  recall@{k}={recall:.4f}  latencia={latencia:.3f} ms por consulta")
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+from cache_texto import hash_pdf
+
+# Manifiesto persistente del crawler en SQLite.
+# Guarda, por cada PDF de la carpeta vigilada, su tamaño, mtime, hash de contenido y estado
+# de procesamiento. La reconciliación al inicio compara solo tamaño y mtime (un `stat` por
+# archivo); el hash se recalcula únicamente cuando cambian, para distinguir una
+# modificación real de un simple `touch`. Las rutas se guardan y se comparan normalizadas
+# (absolutas, sin separadores sobrantes), así que la misma carpeta dada de otra forma
+# (relativa, con separador final) no hace parecer eliminados a los archivos conocidos.
+
+PENDIENTE = 'pendiente'
+PROCESADO = 'procesado'
+ERROR = 'error'
+MODIFICADO = 'modificado'
+ELIMINADO = 'eliminado'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    ruta TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    tamano INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archivos_estado ON archivos (estado);
+"""
+
+
+def normalizar_ruta(ruta):
+    """Ruta absoluta y normalizada con que se identifica un archivo en el manifiesto."""
+    return os.path.normpath(os.path.abspath(ruta))
+
+
+class Manifiesto:
+    """Registro de archivos vistos por el crawler y su estado de procesamiento."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+        self._lock = Lock()
+        self._normalizar_filas()
+
+    def _normalizar_filas(self):
+        """Llevar a la forma normalizada las rutas guardadas antes de normalizarlas (una sola vez)."""
+        for (ruta,) in self._ejecutar("SELECT ruta FROM archivos"):
+            normalizada = normalizar_ruta(ruta)
+            if normalizada == ruta:
+                continue
+            if self._ejecutar("SELECT 1 FROM archivos WHERE ruta = ?", (normalizada,)):
+                self._ejecutar("DELETE FROM archivos WHERE ruta = ?", (ruta,))
+            else:
+                self._ejecutar("UPDATE archivos SET ruta = ? WHERE ruta = ?", (normalizada, ruta))
+
+    def _ejecutar(self, sql, parametros=()):
+        with self._lock:
+            return self._conexion.execute(sql, parametros).fetchall()
+
+    def migrar_archivos_procesados(self, ruta_txt, carpeta):
+        """Importar como procesados los archivos del registro de texto histórico (una sola vez)."""
+        if not os.path.exists(ruta_txt) or self._ejecutar("SELECT 1 FROM archivos LIMIT 1"):
+            return
+        with open(ruta_txt, 'r', encoding='utf-8') as f:
+            nombres = {line.strip() for line in f if line.strip()}
+        for nombre in nombres:
+            ruta = normalizar_ruta(os.path.join(carpeta, nombre))
+            if os.path.exists(ruta):
+                estado = os.stat(ruta)
+                self._guardar(ruta, estado.st_size, estado.st_mtime_ns, None, PROCESADO)
+
+    def _guardar(self, ruta, tamano, mtime_ns, hash_contenido, estado):
+        self._ejecutar(
+            "INSERT INTO archivos (ruta, nombre, tamano, mtime_ns, hash, estado, actualizado) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(ruta) DO UPDATE SET tamano = excluded.tamano, mtime_ns = excluded.mtime_ns, "
+            "hash = excluded.hash, estado = excluded.estado, intentos = 0, error = NULL, actualizado = excluded.actualizado",
+            (ruta, os.path.basename(ruta), tamano, mtime_ns, hash_contenido, estado, time.time())
+        )
+
+    def registrar(self, ruta, estado_archivo=None, fila=None):
+        """
+        Comparar un archivo con su fila del manifiesto y registrar el cambio.
+        Retorna el nuevo estado (PENDIENTE, MODIFICADO, ELIMINADO) o None si no cambió.
+        """
+        ruta = normalizar_ruta(ruta)
+        if fila is None:
+            filas = self._ejecutar("SELECT tamano, mtime_ns, hash, estado FROM archivos WHERE ruta = ?", (ruta,))
+            fila = filas[0] if filas else None
+        if estado_archivo is None:
+            try:
+                estado_archivo = os.stat(ruta)
+            except FileNotFoundError:
+                estado_archivo = None
+
+        if estado_archivo is None:
+            if fila is not None and fila[3] != ELIMINADO:
+                self.marcar(ruta, ELIMINADO)
+                return ELIMINADO
+            return None
+        if fila is None:
+            self._guardar(ruta, estado_archivo.st_size, estado_archivo.st_mtime_ns, None, PENDIENTE)
+            return PENDIENTE
+        tamano, mtime_ns, hash_anterior, estado = fila
+        if estado == ELIMINADO:
+            self._guardar(ruta, estado_archivo.st_size, estado_archivo.st_mtime_ns, None, PENDIENTE)
+            return PENDIENTE
+        if (tamano, mtime_ns) == (estado_archivo.st_size, estado_archivo.st_mtime_ns):
+            return None
+
+        hash_actual = hash_pdf(ruta)
+        if hash_anterior is not None and hash_actual == hash_anterior:
+            # Solo cambió el mtime: actualizar el stat sin reprocesar
+            self._ejecutar("UPDATE archivos SET tamano = ?, mtime_ns = ? WHERE ruta = ?",
+                           (estado_archivo.st_size, estado_archivo.st_mtime_ns, ruta))
+            return None
+        nuevo_estado = PENDIENTE if estado in (PENDIENTE, ERROR) else MODIFICADO
+        self._guardar(ruta, estado_archivo.st_size, estado_archivo.st_mtime_ns, hash_actual, nuevo_estado)
+        return nuevo_estado
+
+    def reconciliar(self, carpeta, extension='.pdf'):
+        """Diferencia de `stat` entre la carpeta y el manifiesto. Retorna {ruta: nuevo estado}."""
+        carpeta = normalizar_ruta(carpeta)
+        filas = {fila[0]: fila[1:] for fila in self._ejecutar("SELECT ruta, tamano, mtime_ns, hash, estado FROM archivos")}
+        cambios = {}
+        vistos = set()
+        with os.scandir(carpeta) as entradas:
+            for entrada in entradas:
+                if not entrada.name.endswith(extension) or not entrada.is_file():
+                    continue
+                ruta = os.path.join(carpeta, entrada.name)
+                vistos.add(ruta)
+                estado = self.registrar(ruta, entrada.stat(), filas.get(ruta))
+                if estado is not None:
+                    cambios[ruta] = estado
+        for ruta, fila in filas.items():
+            if ruta not in vistos and os.path.dirname(ruta) == carpeta and fila[3] != ELIMINADO:
+                self.marcar(ruta, ELIMINADO)
+                cambios[ruta] = ELIMINADO
+        return cambios
+
+    def marcar(self, ruta, estado, error=None, hash_contenido=None):
+        """Actualizar el estado de procesamiento de un archivo."""
+        ruta = normalizar_ruta(ruta)
+        self._ejecutar(
+            "UPDATE archivos SET estado = ?, error = ?, hash = COALESCE(?, hash), actualizado = ?, "
+            "intentos = intentos + (CASE WHEN ? = 'error' THEN 1 ELSE 0 END) WHERE ruta = ?",
+            (estado, error, hash_contenido, time.time(), estado, ruta)
+        )
+
+    def con_estado(self, *estados):
+        """Rutas de los archivos en alguno de los estados dados."""
+        marcadores = ', '.join('?' * len(estados))
+        return [fila[0] for fila in self._ejecutar(f"SELECT ruta FROM archivos WHERE estado IN ({marcadores}) ORDER BY ruta", estados)]
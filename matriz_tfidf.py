@@ -0,0 +1,207 @@
+import os
+import threading
+from math import log
+import numpy as np
+from scipy import sparse
+from segmento_indice import SegmentoIndice, TF_ESCALA, cuantizar_tf
+from metricas import medir
+
+# Matriz TF-IDF del corpus, construida en tiempo de indexación y persistida.
+# Filas: documentos (en el orden de doc_id del segmento); columnas: términos (en el orden
+# del diccionario del segmento). Se construye a partir de los tf del segmento, que a su vez
+# salen del texto real de cada documento pasado por el analizador compartido; por eso el
+# "vectorizador" de las consultas es el mismo analizador más el diccionario del segmento, y
+# no hay que volver a ajustar ningún modelo por consulta. El puntaje de un documento es el
+# coseno entre su fila tf * idf y el vector de la consulta.
+# En disco se guarda solo la matriz de tf (.npz), junto con la versión (mtime y tamaño del
+# archivo de datos) de la generación del segmento de la que salió; el idf y la norma de cada
+# fila se recalculan al cargarla con operaciones vectorizadas (df por columna y un producto
+# disperso), así que no cambian los valores guardados cuando crece el corpus. La matriz
+# siempre se construye y se sella desde una misma instantánea abierta del segmento.
+# La construcción completa del índice la guarda; cada vaciado incremental del escritor le
+# agrega las filas de sus documentos y desplaza las columnas por los términos nuevos
+# (extender_tfidf). Las consultas nunca la reconstruyen: si la guardada no corresponde al
+# segmento, procesar_consulta sigue con la anterior y la reconstruye en segundo plano.
+
+FORMATO = 2  # 2: tf sin ponderar (idf y normas al cargar)
+
+
+def ruta_tfidf(ruta_segmento):
+    """Ruta de la matriz TF-IDF asociada a un segmento."""
+    return os.path.splitext(ruta_segmento)[0] + '_tfidf.npz'
+
+
+def _version_archivo(ruta_datos):
+    estado = os.stat(ruta_datos)
+    return np.array([estado.st_mtime_ns, estado.st_size], dtype=np.int64)
+
+
+def _version_segmento(segmento):
+    """Versión de la generación que tiene abierta `segmento` (no la vigente en disco)."""
+    return _version_archivo(segmento.ruta_datos)
+
+
+def idf(n_documentos, df):
+    """IDF suavizado (como el de scikit-learn), siempre positivo."""
+    return log((1 + n_documentos) / (1 + df)) + 1
+
+
+def ponderar(tf):
+    """IDF de cada columna y norma L2 de cada fila tf * idf de una matriz de tf."""
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    pesos = (np.log((1 + tf.shape[0]) / (1 + df)) + 1).astype(np.float32)
+    normas = np.sqrt(tf.multiply(tf) @ (pesos * pesos)).astype(np.float32)
+    normas[normas == 0] = 1.0
+    return pesos, normas
+
+
+def construir_tf(segmento):
+    """Matriz dispersa CSR (documentos x términos) con el tf de cada posting del segmento."""
+    filas, columnas, valores = [], [], []
+    for i in range(segmento.n_terminos):
+        for doc_id, tf in segmento.postings_por_posicion(i):
+            filas.append(doc_id)
+            columnas.append(i)
+            valores.append(tf)
+    return sparse.csr_matrix(
+        (np.asarray(valores, dtype=np.float32), (np.asarray(filas, dtype=np.int32), np.asarray(columnas, dtype=np.int32))),
+        shape=(segmento.n_documentos, segmento.n_terminos)
+    )
+
+
+def construir_tfidf(segmento):
+    """Matriz dispersa CSR (documentos x términos) con tf * idf y filas normalizadas."""
+    tf = construir_tf(segmento)
+    pesos, normas = ponderar(tf)
+    return sparse.csr_matrix(sparse.diags(1 / normas) @ tf @ sparse.diags(pesos), dtype=np.float32)
+
+
+def _guardar(ruta_segmento, tf, version):
+    ruta = ruta_tfidf(ruta_segmento)
+    ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez(ruta_temporal, data=tf.data, indices=tf.indices, indptr=tf.indptr, shape=np.array(tf.shape),
+             version=version, formato=np.array(FORMATO))
+    os.replace(ruta_temporal, ruta)
+
+
+def _cargar(ruta_segmento, version):
+    """Matriz de tf guardada si corresponde a la versión indicada del segmento, o None."""
+    ruta = ruta_tfidf(ruta_segmento)
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta) as datos:
+        if "formato" not in datos or int(datos["formato"]) != FORMATO or not np.array_equal(datos["version"], version):
+            return None
+        return sparse.csr_matrix((datos["data"], datos["indices"], datos["indptr"]), shape=tuple(datos["shape"]))
+
+
+def guardar_tfidf(ruta_segmento, segmento=None):
+    """
+    Construir y guardar la matriz de tf (escritura atómica). Si se indica `segmento`, la matriz
+    sale de esa instantánea y lleva su versión; si no, de la generación vigente.
+    """
+    if segmento is None:
+        with SegmentoIndice(ruta_segmento) as segmento:
+            return guardar_tfidf(ruta_segmento, segmento)
+    with medir('matriz_tfidf'):
+        tf = construir_tf(segmento)
+        _guardar(ruta_segmento, tf, _version_segmento(segmento))
+    return tf
+
+
+def extender_tfidf(ruta_segmento, anterior, postings_nuevos):
+    """
+    Agregar a la matriz guardada las filas de los documentos de un vaciado del escritor.
+    `anterior` es el archivo de datos de la generación previa al vaciado (None si no había
+    segmento) y `postings_nuevos` los postings {término: [(doc_id, tf)]} que se le fusionaron.
+    Si la matriz guardada no corresponde a la generación anterior, se reconstruye completa.
+    """
+    with SegmentoIndice(ruta_segmento) as segmento:
+        try:
+            tf = _cargar(ruta_segmento, _version_archivo(anterior)) if anterior else sparse.csr_matrix((0, 0), dtype=np.float32)
+        except OSError:
+            tf = None
+        if tf is None:
+            print(f"[INFO] Matriz TF-IDF ausente o desactualizada; reconstruyendo desde {ruta_segmento}")
+            return guardar_tfidf(ruta_segmento, segmento)
+
+        with medir('matriz_tfidf'):
+            # Un término del lote es nuevo si todos sus documentos son del lote
+            posiciones = {termino: segmento.buscar(termino) for termino in postings_nuevos}
+            nuevos = np.zeros(segmento.n_terminos, dtype=bool)
+            for termino, lista in postings_nuevos.items():
+                if segmento.df_por_posicion(posiciones[termino]) == len(lista):
+                    nuevos[posiciones[termino]] = True
+            columnas = np.flatnonzero(~nuevos)
+            primer_id = tf.shape[0]
+            if len(columnas) != tf.shape[1] or any(doc_id < primer_id for lista in postings_nuevos.values() for doc_id, _ in lista):
+                print(f"[WARN] La matriz TF-IDF no coincide con el vaciado; reconstruyendo desde {ruta_segmento}")
+                return guardar_tfidf(ruta_segmento, segmento)
+
+            # Las columnas existentes se desplazan a su posición en el diccionario nuevo
+            tf = sparse.csr_matrix((tf.data, columnas[tf.indices].astype(np.int32), tf.indptr),
+                                   shape=(primer_id, segmento.n_terminos))
+            filas, columnas_nuevas, valores = [], [], []
+            for termino, lista in postings_nuevos.items():
+                for doc_id, valor in lista:
+                    filas.append(doc_id - primer_id)
+                    columnas_nuevas.append(posiciones[termino])
+                    valores.append(cuantizar_tf(valor) / TF_ESCALA)  # Igual que al leerlo del segmento
+            agregadas = sparse.csr_matrix(
+                (np.asarray(valores, dtype=np.float32), (np.asarray(filas, dtype=np.int32), np.asarray(columnas_nuevas, dtype=np.int32))),
+                shape=(segmento.n_documentos - primer_id, segmento.n_terminos)
+            )
+            tf = sparse.vstack([tf, agregadas], format='csr', dtype=np.float32)
+            _guardar(ruta_segmento, tf, _version_segmento(segmento))
+        return tf
+
+
+class MatrizTfidf:
+    """Matriz TF-IDF persistida y el segmento del que salió, para puntuar candidatos por consulta."""
+
+    def __init__(self, ruta_segmento: str, construir: bool = True):
+        """
+        Si la matriz guardada no corresponde al segmento abierto, con `construir` se arma en
+        memoria desde esa misma instantánea (sin guardarla: solo el escritor la persiste);
+        sin `construir`, `vigente` queda en False.
+        """
+        self.ruta_segmento = ruta_segmento
+        self.segmento = SegmentoIndice(ruta_segmento)
+        tf = _cargar(ruta_segmento, _version_segmento(self.segmento))
+        self.vigente = tf is not None
+        if tf is None and construir:
+            print(f"[INFO] Matriz TF-IDF ausente o desactualizada; construyendo en memoria desde {ruta_segmento}")
+            with medir('matriz_tfidf'):
+                tf = construir_tf(self.segmento)
+            self.vigente = True
+        self.matriz = tf
+        if tf is not None:
+            self.pesos, self.normas = ponderar(tf)
+        self.filas = {nombre: doc_id for doc_id, nombre in enumerate(self.segmento.nombres_documentos())}
+
+    def vector_consulta(self, terminos):
+        """Columnas y pesos (tf * idf, normalizados) de los términos de la consulta presentes en el índice."""
+        conteos = {}
+        for termino in terminos:
+            i = self.segmento.buscar(termino)
+            if i >= 0:
+                conteos[i] = conteos.get(i, 0) + 1
+        columnas = np.fromiter(conteos, dtype=np.int64, count=len(conteos))
+        pesos = np.array(list(conteos.values()), dtype=np.float32) * self.pesos[columnas]
+        norma = np.linalg.norm(pesos)
+        return columnas, (pesos / norma if norma > 0 else pesos)
+
+    def puntuar(self, terminos, documentos):
+        """Coseno TF-IDF entre la consulta y cada documento (0 para los que no están en la matriz)."""
+        puntajes = np.zeros(len(documentos), dtype=np.float32)
+        columnas, pesos = self.vector_consulta(terminos)
+        posiciones = [j for j, documento in enumerate(documentos) if documento in self.filas]
+        if not posiciones or len(columnas) == 0:
+            return puntajes
+        filas = np.array([self.filas[documentos[j]] for j in posiciones], dtype=np.int64)
+        # Un solo corte de filas candidatas y columnas de la consulta; idf y norma sobre el corte
+        puntajes[posiciones] = (self.matriz[filas][:, columnas] @ (pesos * self.pesos[columnas])) / self.normas[filas]
+        return puntajes
+
+    def cerrar(self):
+        self.segmento.cerrar()
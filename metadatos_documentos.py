@@ -0,0 +1,217 @@
+import os
+import sqlite3
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+# Metadatos por documento (número de norma, año y estado) en una sola tabla, con índices
+# para filtrar las búsquedas antes de puntuar.
+# La tabla vive en SQLite junto al índice; cambiar el estado de un decreto es actualizar
+# una fila, sin tocar sus postings. Cada escritura incrementa `user_version`, y los lectores
+# reconstruyen los índices en memoria cuando la versión cambia (también si la escribió otro
+# proceso): un mapa de bits (un int de Python) por año y por estado, y los números de norma
+# ordenados para ubicar un rango con búsqueda binaria. Un filtro es el AND de los mapas de
+# bits que correspondan y se traduce a nombres de documento solo al final. Las consultas sin
+# filtro no arman el conjunto de documentos admitidos: solo excluyen el de los eliminados.
+
+ACTIVO = 'activo'
+ELIMINADO = 'eliminado'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    documento TEXT PRIMARY KEY,
+    numero_norma INTEGER,
+    anio INTEGER,
+    estado TEXT NOT NULL DEFAULT 'activo'
+);
+CREATE INDEX IF NOT EXISTS documentos_anio ON documentos (anio);
+CREATE INDEX IF NOT EXISTS documentos_norma ON documentos (numero_norma);
+CREATE INDEX IF NOT EXISTS documentos_estado ON documentos (estado);
+"""
+
+# Un documento que se vuelve a indexar conserva su estado, salvo que estuviera eliminado
+_INSERTAR = """
+INSERT INTO documentos (documento, numero_norma, anio, estado) VALUES (?, ?, ?, ?)
+ON CONFLICT (documento) DO UPDATE SET
+    numero_norma = excluded.numero_norma,
+    anio = excluded.anio,
+    estado = CASE WHEN documentos.estado = 'eliminado' THEN excluded.estado ELSE documentos.estado END
+"""
+
+
+def ruta_metadatos(ruta_indice):
+    """Ruta de la tabla de metadatos asociada a la ruta del índice."""
+    return os.path.splitext(ruta_indice)[0] + '_metadatos.db'
+
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalizar_filtros(filtros):
+    """
+    Tupla (año, norma desde, norma hasta, estado) a partir de un dict con las claves anio,
+    norma_desde, norma_hasta y estado (las ausentes o vacías no filtran); None si no filtra nada.
+    """
+    if not filtros:
+        return None
+    clave = (
+        _entero(filtros.get("anio")),
+        _entero(filtros.get("norma_desde")),
+        _entero(filtros.get("norma_hasta")),
+        filtros.get("estado") or None
+    )
+    return clave if any(valor is not None for valor in clave) else None
+
+
+def _mapa_de_bits(posiciones, cantidad):
+    bits = bytearray((cantidad + 7) // 8)
+    for posicion in posiciones:
+        bits[posicion >> 3] |= 1 << (posicion & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class IndiceFiltros:
+    """Mapas de bits por año y por estado y números de norma ordenados, sobre una versión de la tabla."""
+
+    def __init__(self, filas):
+        self.nombres = [fila[0] for fila in filas]
+        cantidad = len(self.nombres)
+        self.todos = (1 << cantidad) - 1
+        por_anio = {}
+        por_estado = {}
+        normas = []
+        for posicion, (_, numero_norma, anio, estado) in enumerate(filas):
+            por_anio.setdefault(anio, []).append(posicion)
+            por_estado.setdefault(estado, []).append(posicion)
+            if numero_norma is not None:
+                normas.append((numero_norma, posicion))
+        self.por_anio = {anio: _mapa_de_bits(posiciones, cantidad) for anio, posiciones in por_anio.items()}
+        self.por_estado = {estado: _mapa_de_bits(posiciones, cantidad) for estado, posiciones in por_estado.items()}
+        normas.sort()
+        self.numeros_norma = [numero for numero, _ in normas]
+        self.posiciones_norma = [posicion for _, posicion in normas]
+        self.eliminados = frozenset(self.nombres[posicion] for posicion in por_estado.get(ELIMINADO, ()))
+        self._cantidad = cantidad
+
+    def filtrar(self, anio=None, norma_desde=None, norma_hasta=None, estado=None):
+        """Mapa de bits de los documentos que cumplen todos los criterios indicados."""
+        resultado = self.todos
+        if anio is not None:
+            resultado &= self.por_anio.get(anio, 0)
+        if estado is not None:
+            resultado &= self.por_estado.get(estado, 0)
+        elif ELIMINADO in self.por_estado:
+            resultado &= ~self.por_estado[ELIMINADO]
+        if norma_desde is not None or norma_hasta is not None:
+            inicio = bisect_left(self.numeros_norma, norma_desde) if norma_desde is not None else 0
+            fin = bisect_right(self.numeros_norma, norma_hasta) if norma_hasta is not None else len(self.numeros_norma)
+            resultado &= _mapa_de_bits(self.posiciones_norma[inicio:fin], self._cantidad)
+        return resultado
+
+    def nombres_de(self, mapa):
+        """Nombres de los documentos marcados en el mapa de bits."""
+        bits = bin(mapa)[:1:-1]  # Bit menos significativo primero
+        nombres = []
+        posicion = bits.find('1')
+        while posicion >= 0:
+            nombres.append(self.nombres[posicion])
+            posicion = bits.find('1', posicion + 1)
+        return nombres
+
+
+class TablaMetadatos:
+    """Tabla de metadatos por documento con filtros precalculados."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+        self._lock = Lock()
+        self._indice = None
+        self._version_indice = None
+
+    def _escribir(self, sentencia, filas):
+        with self._lock:
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conexion.executemany(sentencia, filas)
+                version = self._conexion.execute("PRAGMA user_version").fetchone()[0]
+                self._conexion.execute(f"PRAGMA user_version = {version + 1}")
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def agregar_lote(self, metadatos):
+        """Agregar o actualizar documentos desde dicts con documento, numero_norma, fecha y estado."""
+        filas = [
+            (fila["documento"], _entero(fila.get("numero_norma")), _entero(fila.get("fecha")), fila.get("estado") or ACTIVO)
+            for fila in metadatos
+        ]
+        if filas:
+            self._escribir(_INSERTAR, filas)
+
+    def agregar(self, metadatos):
+        """Agregar o actualizar un documento."""
+        self.agregar_lote([metadatos])
+
+    def cambiar_estado(self, documento, estado):
+        """Cambiar el estado de un documento sin tocar sus postings. Retorna False si no existe."""
+        return self._escribir("UPDATE documentos SET estado = ? WHERE documento = ?", [(estado, documento)]) > 0
+
+    def desde_segmento(self, segmento):
+        """Cargar los metadatos de la tabla de documentos de un segmento del índice."""
+        self.agregar_lote(segmento.documento(doc_id) for doc_id in range(segmento.n_documentos))
+
+    def __len__(self):
+        with self._lock:
+            return self._conexion.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+
+    def version(self):
+        with self._lock:
+            return self._conexion.execute("PRAGMA user_version").fetchone()[0]
+
+    def indice(self):
+        """Índice de filtros de la versión vigente de la tabla (se reconstruye si cambió)."""
+        version = self.version()
+        if version != self._version_indice:
+            with self._lock:
+                filas = self._conexion.execute(
+                    "SELECT documento, numero_norma, anio, estado FROM documentos ORDER BY documento"
+                ).fetchall()
+            self._indice = IndiceFiltros(filas)
+            self._version_indice = version
+        return self._indice
+
+    def documentos(self, filtros):
+        """
+        Conjunto de nombres de documento que cumplen los filtros (ver normalizar_filtros), o None
+        si no hay filtros; en ese caso los eliminados se excluyen con `eliminados()`. Con filtros
+        pero sin filtro de estado, los eliminados quedan fuera del conjunto.
+        """
+        clave = normalizar_filtros(filtros)
+        if clave is None:
+            return None
+        indice = self.indice()
+        return set(indice.nombres_de(indice.filtrar(*clave)))
+
+    def eliminados(self):
+        """Nombres de los documentos eliminados (conjunto calculado una vez por versión de la tabla)."""
+        return self.indice().eliminados
+
+
+_tablas = {}
+_tablas_lock = Lock()
+
+
+def obtener_metadatos(ruta_indice):
+    """Tabla de metadatos compartida por el proceso para la ruta del índice."""
+    with _tablas_lock:
+        if ruta_indice not in _tablas:
+            _tablas[ruta_indice] = TablaMetadatos(ruta_metadatos(ruta_indice))
+        return _tablas[ruta_indice]
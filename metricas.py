@@ -0,0 +1,236 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+
+# Métricas del proceso: contadores, histogramas de duración por etapa y medidores que se leen
+# al exportar (p. ej. las tasas de acierto de los caches), en el formato de texto de
+# Prometheus para la ruta /metrics. Cada etapa (OCR, tokenización, escritura del índice,
+# almacenamiento, inferencia, búsqueda vectorial, renderizado...) se mide con `medir` o
+# `medido` en un solo histograma con la etiqueta `etapa`. Si una consulta corre dentro de
+# `traza_consulta`, las etapas medidas en su hilo se suman a su traza, y las consultas que
+# superan CONSULTA_LENTA_MS se anotan con ese desglose en un registro JSONL.
+
+# Límites (en segundos) de los buckets de los histogramas de duración
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Registro de consultas lentas: umbral en milisegundos (0 lo desactiva) y archivo JSONL
+CONSULTA_LENTA_MS = float(os.environ.get('BUSCADOR_CONSULTA_LENTA_MS', '0'))
+RUTA_CONSULTAS_LENTAS = os.environ.get('BUSCADOR_RUTA_CONSULTAS_LENTAS', 'consultas_lentas.jsonl')
+
+_registro = {}
+_registro_lock = Lock()
+_consultas_lentas_lock = Lock()
+_hilo = local()
+_LE_INFINITO = 'le="+Inf"'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    return repr(float(valor)) if valor != float('inf') else '+Inf'
+
+
+class Contador:
+    """Contador monótono, opcionalmente con etiquetas."""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = Lock()
+
+    def incrementar(self, cantidad=1, **etiquetas):
+        clave = tuple(etiquetas.get(nombre, '') for nombre in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def muestras(self):
+        with self._lock:
+            return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}" for clave, valor in sorted(self._valores.items())]
+
+
+class Histograma:
+    """Histograma de valores (duraciones en segundos) con buckets acumulados, suma y cantidad."""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}
+        self._lock = Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(etiquetas.get(nombre, '') for nombre in self.etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # Conteo por bucket (sin acumular), suma y cantidad
+                serie = self._series[clave] = [[0] * len(self.limites), 0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def muestras(self):
+        lineas = []
+        with self._lock:
+            for clave, (conteos, suma, cantidad) in sorted(self._series.items()):
+                acumulado = 0
+                for limite, conteo in zip(self.limites, conteos):
+                    acumulado += conteo
+                    le = 'le="%s"' % _numero(limite)
+                    lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, _LE_INFINITO)} {cantidad}")
+                lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}")
+                lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {cantidad}")
+        return lineas
+
+
+class Medidor:
+    """Valor leído al exportar desde una función: un número, o {valores de las etiquetas: número}."""
+
+    def __init__(self, nombre: str, ayuda: str, funcion, etiquetas=(), tipo: str = 'gauge'):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiquetas = tuple(etiquetas)
+        self.tipo = tipo
+
+    def muestras(self):
+        try:
+            valores = self.funcion()
+        except Exception as e:
+            print(f"[WARN] No se pudo leer la métrica {self.nombre}: {e}")
+            return []
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}" for clave, valor in sorted(valores.items())]
+
+
+def _registrar(metrica):
+    with _registro_lock:
+        return _registro.setdefault(metrica.nombre, metrica)
+
+
+def contador(nombre, ayuda, etiquetas=()):
+    """Contador registrado con ese nombre (se crea la primera vez)."""
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def histograma(nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+    """Histograma registrado con ese nombre (se crea la primera vez)."""
+    return _registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+
+def medidor(nombre, ayuda, funcion, etiquetas=(), tipo='gauge'):
+    """Registrar (o reemplazar) un medidor leído al exportar."""
+    metrica = Medidor(nombre, ayuda, funcion, etiquetas, tipo)
+    with _registro_lock:
+        _registro[nombre] = metrica
+    return metrica
+
+
+ETAPAS = histograma('buscador_etapa_segundos', 'Duración de cada etapa del indexado y de la búsqueda', ('etapa',))
+ERRORES = contador('buscador_etapa_errores_total', 'Etapas que terminaron con una excepción', ('etapa',))
+CONSULTAS = histograma('buscador_consulta_segundos', 'Duración total de las consultas de búsqueda')
+CONSULTAS_LENTAS = contador('buscador_consultas_lentas_total', 'Consultas que superaron el umbral de consulta lenta')
+
+
+def observar_etapa(etapa, segundos):
+    """Registrar una duración ya medida (p. ej. los tiempos por página del OCR)."""
+    ETAPAS.observar(segundos, etapa=etapa)
+    traza = getattr(_hilo, 'traza', None)
+    if traza is not None:
+        traza[etapa] = traza.get(etapa, 0.0) + segundos
+
+
+@contextmanager
+def medir(etapa):
+    """Medir la duración del bloque como una observación de la etapa."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORES.incrementar(etapa=etapa)
+        raise
+    finally:
+        observar_etapa(etapa, time.perf_counter() - inicio)
+
+
+def medido(etapa):
+    """Decorador que mide cada llamada a la función como la etapa indicada."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(etapa):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+@contextmanager
+def traza_consulta(consulta, **datos):
+    """
+    Medir una consulta completa y el tiempo de cada etapa medida en el mismo hilo; si supera
+    CONSULTA_LENTA_MS se anota en el registro de consultas lentas junto con `datos`.
+    """
+    anterior = getattr(_hilo, 'traza', None)
+    _hilo.traza = traza = {}
+    inicio = time.perf_counter()
+    try:
+        yield traza
+    finally:
+        duracion = time.perf_counter() - inicio
+        _hilo.traza = anterior
+        CONSULTAS.observar(duracion)
+        if CONSULTA_LENTA_MS > 0 and duracion * 1000 >= CONSULTA_LENTA_MS:
+            CONSULTAS_LENTAS.incrementar()
+            registrar_consulta_lenta(consulta, duracion, traza, datos)
+
+
+def registrar_consulta_lenta(consulta, duracion, etapas, datos=None):
+    """Agregar una línea JSON con la consulta, su duración y el desglose por etapa."""
+    linea = json.dumps({
+        "fecha": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "consulta": consulta,
+        "ms": round(duracion * 1000, 3),
+        "etapas_ms": {etapa: round(segundos * 1000, 3) for etapa, segundos in etapas.items()},
+        **(datos or {})
+    }, ensure_ascii=False, default=str)
+    try:
+        with _consultas_lentas_lock, open(RUTA_CONSULTAS_LENTAS, 'a', encoding='utf-8') as archivo:
+            archivo.write(linea + '\n')
+    except OSError as e:
+        print(f"[WARN] No se pudo escribir el registro de consultas lentas: {e}")
+
+
+def exponer():
+    """Todas las métricas registradas en el formato de texto de Prometheus."""
+    with _registro_lock:
+        metricas = sorted(_registro.values(), key=lambda metrica: metrica.nombre)
+    lineas = []
+    for metrica in metricas:
+        lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+        lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+        lineas.extend(metrica.muestras())
+    return '\n'.join(lineas) + '\n'
@@ -0,0 +1,98 @@
+import os
+from threading import Lock
+
+# Registro de modelos compartido por el proceso.
+# Cada modelo se carga la primera vez que se pide y una sola vez por proceso, aunque lo
+# usen a la vez el crawler, el buscador y los scripts. Los embeddings de las consultas
+# solo son comparables con los de los documentos si ambos salen del mismo codificador:
+# el registro se niega a cargar un codificador de consultas distinto del de documentos, y
+# junto a cada almacén de embeddings se anota el modelo que lo construyó para rechazar
+# consultas (o documentos nuevos) codificados con otro.
+
+DOCUMENTOS = 'documentos'
+CONSULTAS = 'consultas'
+
+# Modelo de cada rol; deben coincidir
+MODELOS = {
+    DOCUMENTOS: 'dccuchile/bert-base-spanish-wwm-uncased',
+    CONSULTAS: 'dccuchile/bert-base-spanish-wwm-uncased'
+}
+
+# Hilos intra-op de torch por proceso y pasada de calentamiento al cargar
+HILOS_TORCH = int(os.environ.get('BUSCADOR_HILOS_TORCH', os.cpu_count() or 1))
+CALENTAR_MODELOS = os.environ.get('BUSCADOR_CALENTAR_MODELOS', '0') == '1'
+
+_modelos = {}
+_codificador = None
+_lock = Lock()
+
+
+def _configurar_torch():
+    import torch
+    torch.set_num_threads(HILOS_TORCH)
+
+
+def _verificar_roles():
+    if MODELOS[CONSULTAS] != MODELOS[DOCUMENTOS]:
+        raise ValueError(
+            f"El codificador de consultas ({MODELOS[CONSULTAS]}) no coincide con el de documentos "
+            f"({MODELOS[DOCUMENTOS]}); sus embeddings no son comparables"
+        )
+
+
+def obtener_modelo(rol=DOCUMENTOS, calentar=None):
+    """(tokenizador, modelo) del rol indicado, cargados en el primer uso y compartidos por el proceso."""
+    _verificar_roles()
+    nombre = MODELOS[rol]
+    with _lock:
+        if nombre not in _modelos:
+            from transformers import BertTokenizer, BertModel
+            if not _modelos:
+                _configurar_torch()
+            tokenizador = BertTokenizer.from_pretrained(nombre)
+            modelo = BertModel.from_pretrained(nombre)
+            modelo.eval()
+            if CALENTAR_MODELOS if calentar is None else calentar:
+                from codificador_consultas import codificar_lote
+                codificar_lote(modelo, tokenizador, ["calentamiento del modelo"])
+            _modelos[nombre] = (tokenizador, modelo)
+        return _modelos[nombre]
+
+
+def obtener_codificador():
+    """Codificador de consultas en micro-lotes compartido por el proceso."""
+    global _codificador
+    tokenizador, modelo = obtener_modelo(CONSULTAS)
+    with _lock:
+        if _codificador is None:
+            from codificador_consultas import CodificadorConsultas
+            _codificador = CodificadorConsultas(modelo, tokenizador)
+        return _codificador
+
+
+def ruta_modelo_almacen(ruta_embeddings):
+    """Archivo que anota el modelo con que se construyó un almacén de embeddings."""
+    return os.path.splitext(ruta_embeddings)[0] + '_modelo.txt'
+
+
+def verificar_modelo_almacen(ruta_embeddings, rol=CONSULTAS):
+    """Rechazar el uso del almacén con el codificador del rol si fue construido con otro modelo."""
+    ruta = ruta_modelo_almacen(ruta_embeddings)
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, 'r', encoding='utf-8') as archivo:
+        modelo_almacen = archivo.read().strip()
+    if modelo_almacen != MODELOS[rol]:
+        raise ValueError(
+            f"Los embeddings de {os.path.basename(ruta_embeddings)} se construyeron con {modelo_almacen}, "
+            f"no con {MODELOS[rol]}"
+        )
+
+
+def registrar_modelo_almacen(ruta_embeddings):
+    """Anotar el modelo de documentos del almacén (o verificar que coincide si ya está anotado)."""
+    if os.path.exists(ruta_modelo_almacen(ruta_embeddings)):
+        verificar_modelo_almacen(ruta_embeddings, DOCUMENTOS)
+        return
+    with open(ruta_modelo_almacen(ruta_embeddings), 'w', encoding='utf-8') as archivo:
+        archivo.write(MODELOS[DOCUMENTOS])
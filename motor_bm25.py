@@ -0,0 +1,195 @@
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from math import log
+from segmento_indice import PosicionesSegmento, SegmentoIndice, ruta_vigente
+from busqueda_posicional import documentos_que_cumplen
+from diccionario_terminos import DiccionarioTerminos, expandir_consulta
+
+# Ranking BM25 sobre el segmento binario del índice invertido.
+# Las longitudes de documento se leen una sola vez de la tabla de documentos y la
+# normalización por longitud queda precalculada por doc_id. Cada lista de postings se
+# decodifica una vez a (doc_ids, puntajes) junto con su puntaje máximo, que sirve de cota
+# superior para la poda dinámica MaxScore: los términos cuya suma de cotas no alcanza el
+# umbral del top-k dejan de generar candidatos y solo se consultan con búsqueda binaria.
+# Los términos que no están en el diccionario se expanden a sus vecinos por distancia de
+# edición (ver diccionario_terminos) antes de puntuar.
+
+K1 = 1.2
+B = 0.75
+LISTAS_EN_CACHE = 1024
+
+
+class MotorBM25:
+    """Evaluación top-k con BM25 y poda MaxScore sobre un segmento del índice."""
+
+    def __init__(self, segmento: SegmentoIndice, k1: float = K1, b: float = B):
+        self.segmento = segmento
+        self.k1 = k1
+        self.b = b
+        self.n_documentos = segmento.n_documentos
+        longitudes = [segmento.documento_crudo(doc_id)[1] for doc_id in range(self.n_documentos)]
+        conocidas = [longitud for longitud in longitudes if longitud]
+        self.longitud_media = sum(conocidas) / len(conocidas) if conocidas else 1.0
+        # Los segmentos migrados desde JSON no traen longitudes: se asume la longitud media
+        self._longitudes = [longitud or self.longitud_media for longitud in longitudes]
+        self._normas = [k1 * (1 - b + b * longitud / self.longitud_media) for longitud in self._longitudes]
+        self.lista = lru_cache(maxsize=LISTAS_EN_CACHE)(self._lista)
+        # Índice posicional opcional para consultas de frase y proximidad
+        self.posicional = PosicionesSegmento.abrir(segmento)
+        self._diccionario = None
+        self._ids_documento = None
+
+    def diccionario(self):
+        """Diccionario de términos para expansiones, cargado en el primer uso."""
+        if self._diccionario is None:
+            self._diccionario = DiccionarioTerminos(self.segmento)
+        return self._diccionario
+
+    def idf(self, df):
+        """IDF de BM25 (siempre positivo)."""
+        return log(1 + (self.n_documentos - df + 0.5) / (df + 0.5))
+
+    def _lista(self, termino):
+        """Tupla (doc_ids, puntajes, cota superior) del término; listas vacías si no existe."""
+        postings = self.segmento.postings(termino)
+        if not postings:
+            return [], [], 0.0
+        idf = self.idf(len(postings))
+        k1 = self.k1
+        doc_ids = []
+        puntajes = []
+        for doc_id, tf in postings:
+            frecuencia = tf * self._longitudes[doc_id]
+            doc_ids.append(doc_id)
+            puntajes.append(idf * frecuencia * (k1 + 1) / (frecuencia + self._normas[doc_id]))
+        return doc_ids, puntajes, max(puntajes)
+
+    def buscar(self, terminos, k=10, pesos=None, filtro=None, excluidos=None):
+        """
+        Los `k` documentos con mayor puntaje BM25 como lista de (doc_id, puntaje).
+        `pesos` permite ponderar términos (por defecto, su frecuencia en la consulta).
+        `filtro`, si se indica, es el conjunto de doc_id admitidos; el resto no entra al top-k.
+        `excluidos`, si se indica, es un conjunto de doc_id que no entran al top-k.
+        """
+        pesos = pesos or Counter(terminos)
+        listas = []
+        for termino, peso in pesos.items():
+            doc_ids, puntajes, cota = self.lista(termino)
+            if doc_ids:
+                listas.append([doc_ids, puntajes, cota * peso, peso, 0])
+        if not listas or k <= 0:
+            return []
+
+        # Ordenar por cota creciente; acumuladas[i] es la suma de cotas de las listas 0..i
+        listas.sort(key=lambda lista: lista[2])
+        acumuladas = []
+        total = 0.0
+        for lista in listas:
+            total += lista[2]
+            acumuladas.append(total)
+
+        mejores = []
+        umbral = 0.0
+        primera_esencial = 0
+        while True:
+            # Las listas cuya cota acumulada no supera el umbral ya no pueden aportar documentos nuevos al top-k
+            while primera_esencial < len(listas) and len(mejores) == k and acumuladas[primera_esencial] <= umbral:
+                primera_esencial += 1
+            esenciales = listas[primera_esencial:]
+            doc_id = min((lista[0][lista[4]] for lista in esenciales if lista[4] < len(lista[0])), default=None)
+            if doc_id is None:
+                break
+            if (filtro is not None and doc_id not in filtro) or (excluidos and doc_id in excluidos):
+                for lista in esenciales:
+                    if lista[4] < len(lista[0]) and lista[0][lista[4]] == doc_id:
+                        lista[4] += 1
+                continue
+
+            puntaje = 0.0
+            for lista in esenciales:
+                posicion = lista[4]
+                if posicion < len(lista[0]) and lista[0][posicion] == doc_id:
+                    puntaje += lista[3] * lista[1][posicion]
+                    lista[4] = posicion + 1
+
+            for i in range(primera_esencial - 1, -1, -1):
+                if puntaje + acumuladas[i] <= umbral:
+                    break
+                lista = listas[i]
+                posicion = bisect_left(lista[0], doc_id, lista[4])
+                lista[4] = posicion
+                if posicion < len(lista[0]) and lista[0][posicion] == doc_id:
+                    puntaje += lista[3] * lista[1][posicion]
+
+            if len(mejores) < k:
+                heapq.heappush(mejores, (puntaje, -doc_id))
+            elif puntaje > mejores[0][0]:
+                heapq.heapreplace(mejores, (puntaje, -doc_id))
+            if len(mejores) == k:
+                umbral = mejores[0][0]
+
+        return [(-doc_id, puntaje) for puntaje, doc_id in sorted(mejores, reverse=True)]
+
+    def nombre_documento(self, doc_id):
+        """Nombre del documento con id entero `doc_id`."""
+        return self.segmento.documento(doc_id)["documento"]
+
+    def ids_de(self, nombres):
+        """Conjunto de doc_id de los documentos nombrados que están en el segmento."""
+        if self._ids_documento is None:
+            self._ids_documento = {nombre: doc_id for doc_id, nombre in enumerate(self.segmento.nombres_documentos())}
+        return {self._ids_documento[nombre] for nombre in nombres if nombre in self._ids_documento}
+
+
+class BuscadorBM25:
+    """Abre el segmento de una ruta y lo vuelve a abrir cuando el escritor lo reemplaza."""
+
+    def __init__(self, ruta_segmento: str):
+        self.ruta = ruta_segmento
+        self._motor = None
+        self._version = None
+
+    def motor(self):
+        """Motor BM25 sobre la versión vigente del segmento, o None si aún no existe."""
+        # Cada escritura crea una generación nueva del segmento: su archivo identifica la versión
+        version = ruta_vigente(self.ruta)
+        if version is None:
+            return None
+        if version != self._version:
+            # El segmento anterior se libera cuando ninguna búsqueda en curso lo usa
+            self._motor = MotorBM25(SegmentoIndice(self.ruta))
+            self._version = version
+        return self._motor
+
+    def buscar(self, terminos, k=10, pesos=None, restricciones=None, prefijos=(), documentos=None, excluidos=None):
+        """
+        Lista de (nombre de documento, puntaje) ordenada por BM25.
+        Sin `pesos`, los términos ausentes del índice se expanden a términos similares y los
+        `prefijos` a los términos que los completan, con menor peso.
+        `restricciones` (frases y proximidad, ver busqueda_posicional) limita los resultados a los
+        documentos que las cumplen; sin índice posicional se ignoran y se ordena solo por términos.
+        `documentos` (nombres, p. ej. de un filtro de metadatos) limita los candidatos antes de puntuar
+        y `excluidos` (nombres, p. ej. los documentos eliminados) los quita.
+        """
+        motor = self.motor()
+        if motor is None:
+            return []
+        if pesos is None:
+            pesos = expandir_consulta(motor.diccionario(), terminos, prefijos)
+            if not pesos:
+                return []
+        filtro = None if documentos is None else motor.ids_de(documentos)
+        if filtro is not None and not filtro:
+            return []
+        if restricciones:
+            if motor.posicional is None:
+                print("[WARN] El índice no tiene posiciones; la frase se busca como términos sueltos.")
+            else:
+                cumplen = documentos_que_cumplen(motor, restricciones)
+                filtro = cumplen if filtro is None else filtro & cumplen
+                if not filtro:
+                    return []
+        excluidos = motor.ids_de(excluidos) if excluidos else None
+        return [(motor.nombre_documento(doc_id), puntaje) for doc_id, puntaje in motor.buscar(terminos, k, pesos, filtro, excluidos)]
@@ -1,45 +1,65 @@
 import json
 import os
-import re
+import time
+from threading import Lock, Thread
 import numpy as np
-from pymongo import MongoClient
-from transformers import BertTokenizer, BertModel
-import torch
-from sklearn.feature_extraction.text import TfidfVectorizer
-from nltk.corpus import stopwords
+from almacen_embeddings import DIMENSION, AlmacenEmbeddings
+from analizador import analizar
+from motor_bm25 import BuscadorBM25
+from segmento_indice import ruta_segmento, ruta_vigente
+from matriz_tfidf import MatrizTfidf
+from modelos import obtener_codificador, verificar_modelo_almacen
+from config_db import obtener_almacen  # Postings (respaldo cuando no hay segmento local)
 
 # RUTA_EMBEDDINGS debería ser cargado una vez al inicio
 RUTA_EMBEDDINGS = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\embeddings_avanzado_test.npy'
-EMBEDDINGS_DICT = np.load(RUTA_EMBEDDINGS, allow_pickle=True).item()
-
-# Configuración de la base de datos MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['indice_invertido_decretos_munvalp_test']
-collection = db['indice_invertido_test']
-
-stop_words = set(stopwords.words('spanish'))
+ALMACEN_EMBEDDINGS = AlmacenEmbeddings(RUTA_EMBEDDINGS)
+
+# Ranking BM25 sobre el segmento binario del índice invertido
+RUTA_INDICE = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\indice_invertido_con_stopwords_normalizados_avanzado_test.json'
+BUSCADOR_BM25 = BuscadorBM25(ruta_segmento(RUTA_INDICE))
+TOP_K = 100
+
+# Codificador de consultas inyectado con configurar (None: el del modelo configurado en modelos)
+CODIFICADOR = None
+
+# Fusión de los puntajes TF-IDF y de embeddings: 'rrf' (reciprocal rank fusion) o 'suma' (ponderada)
+FUSION = 'rrf'
+PESO_SEMANTICO = 0.5
+K_RRF = 60
+
+# Matriz TF-IDF precalculada en la indexación (se carga en el primer uso). Si la guardada no
+# corresponde al segmento vigente, se sigue usando la anterior y se arma en segundo plano
+# después de ESPERA_TFIDF_SEGUNDOS (lo normal es que el escritor la extienda antes)
+ESPERA_TFIDF_SEGUNDOS = 2.0
+_matriz_tfidf = None
+_version_tfidf = None
+_version_revisada = None
+_reconstruyendo_tfidf = False
+_lock_tfidf = Lock()
+
+# Función para apuntar el módulo a otro índice y almacén de embeddings (p. ej. en benchmarks)
+def configurar(ruta_indice, ruta_embeddings, codificador=None, dimension=DIMENSION):
+    global RUTA_INDICE, RUTA_EMBEDDINGS, ALMACEN_EMBEDDINGS, BUSCADOR_BM25, CODIFICADOR, _version_revisada
+    RUTA_INDICE = ruta_indice
+    RUTA_EMBEDDINGS = ruta_embeddings
+    ALMACEN_EMBEDDINGS = AlmacenEmbeddings(ruta_embeddings, dimension)
+    BUSCADOR_BM25 = BuscadorBM25(ruta_segmento(ruta_indice))
+    CODIFICADOR = codificador
+    with _lock_tfidf:
+        _version_revisada = None  # La matriz TF-IDF se vuelve a revisar contra el segmento nuevo
 
 def preprocesar_consulta(query):
-    query = query.lower()
-    query = re.sub(r'[^\w\s]', '', query)
-    terms = query.split()
-    terms = [word for word in terms if word not in stop_words]
-    return terms
+    return analizar(query)
 
 def buscar_en_indice_invertido_multiple(terms):
-    doc_lists = []
-    for term in terms:
-        cursor = collection.find({"word": term})
-        files = set()
-        for resultado in cursor:
-            if 'documents' in resultado:
-                for doc in resultado['documents']:
-                    if isinstance(doc, dict):
-                        files.add(doc.get('documento', 'Documento desconocido'))
-                    elif isinstance(doc, str):
-                        files.add(doc)
-        if files:
-            doc_lists.append(files)
+    # Con el segmento disponible, los documentos se retornan ordenados por BM25
+    if BUSCADOR_BM25.motor() is not None:
+        return [doc_id for doc_id, _ in BUSCADOR_BM25.buscar(terms, TOP_K)]
+
+    # Todos los términos en una sola consulta al almacenamiento
+    postings = obtener_almacen().buscar_terminos(terms)
+    doc_lists = [set(documento for documento, _ in filas) for filas in postings.values() if filas]
 
     if not doc_lists:
         return []
@@ -47,33 +67,81 @@ def buscar_en_indice_invertido_multiple(terms):
     doc_intersection = set.intersection(*doc_lists) if len(doc_lists) > 1 else doc_lists[0]
     return list(doc_intersection) if doc_intersection else list(set.union(*doc_lists))
 
-def obtener_embeddings(consulta, modelo, tokenizador):
-    inputs = tokenizador(consulta, return_tensors='pt', truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = modelo(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).numpy()
-
-def calcular_tfidf(corpus, query):
-    vectorizer = TfidfVectorizer()
-    X = vectorizer.fit_transform(corpus)
-    return vectorizer, X, vectorizer.transform([query])
-
-# Función para calcular la magnitud de un vector
-def calcular_magnitud(vector):
-    return np.sqrt(np.sum(vector ** 2))
-
-# Función para calcular la similitud del coseno entre dos vectores
-def similitud_coseno(vector1, vector2):
-    producto_punto = np.dot(vector1, vector2)
-    magnitud_vector1 = calcular_magnitud(vector1)
-    magnitud_vector2 = calcular_magnitud(vector2)
-    if magnitud_vector1 == 0 or magnitud_vector2 == 0:
-        return 0  # Evitar división por cero
-    return producto_punto / (magnitud_vector1 * magnitud_vector2)
-
-# Cargar el modelo BERT y el tokenizador una sola vez
-tokenizador = BertTokenizer.from_pretrained('bert-base-uncased')
-modelo = BertModel.from_pretrained('bert-base-uncased')
+def obtener_embeddings(consulta):
+    # Mismo codificador (BETO) con que se construyeron los embeddings de los documentos
+    verificar_modelo_almacen(RUTA_EMBEDDINGS)
+    return (CODIFICADOR or obtener_codificador()).codificar(consulta)
+
+# Función para reemplazar la matriz TF-IDF en uso por una más nueva
+def _instalar_matriz_tfidf(matriz):
+    global _matriz_tfidf, _version_tfidf
+    anterior = _matriz_tfidf
+    _matriz_tfidf = matriz
+    _version_tfidf = matriz.segmento.ruta_datos
+    if anterior is not None:
+        anterior.cerrar()  # Liberar el mapeo del segmento reemplazado
+
+# Función para armar en segundo plano la matriz TF-IDF de la generación vigente del segmento
+def _reconstruir_tfidf():
+    global _reconstruyendo_tfidf, _version_revisada
+    try:
+        time.sleep(ESPERA_TFIDF_SEGUNDOS)
+        matriz = MatrizTfidf(ruta_segmento(RUTA_INDICE))  # La guardada si ya está al día; si no, en memoria
+        with _lock_tfidf:
+            _instalar_matriz_tfidf(matriz)
+    except Exception as e:
+        print(f"[ERROR] No se pudo reconstruir la matriz TF-IDF: {e}")
+    finally:
+        with _lock_tfidf:
+            _reconstruyendo_tfidf = False
+            _version_revisada = None  # Si llegó otra generación mientras tanto, la próxima consulta la revisa
+
+# Función para obtener la matriz TF-IDF vigente (se vuelve a cargar cuando cambia el segmento).
+# Nunca la reconstruye en la consulta: mientras tanto retorna la anterior (o None)
+def obtener_matriz_tfidf():
+    global _reconstruyendo_tfidf, _version_revisada
+    version = ruta_vigente(ruta_segmento(RUTA_INDICE))
+    if version is None:
+        return None
+    with _lock_tfidf:
+        if version in (_version_tfidf, _version_revisada):
+            return _matriz_tfidf
+        _version_revisada = version
+        matriz = MatrizTfidf(ruta_segmento(RUTA_INDICE), construir=False)
+        if matriz.vigente:
+            _instalar_matriz_tfidf(matriz)
+        else:
+            matriz.cerrar()
+            if not _reconstruyendo_tfidf:
+                _reconstruyendo_tfidf = True
+                Thread(target=_reconstruir_tfidf, daemon=True).start()
+        return _matriz_tfidf
+
+# Función para obtener la posición (1 = mejor) de cada puntaje
+def rangos(puntajes):
+    orden = np.argsort(-puntajes, kind='stable')
+    resultado = np.empty(len(puntajes), dtype=np.float64)
+    resultado[orden] = np.arange(1, len(puntajes) + 1)
+    return resultado
+
+# Función para escalar puntajes a [0, 1]
+def escalar(puntajes):
+    minimo, maximo = puntajes.min(), puntajes.max()
+    if maximo == minimo:
+        return np.ones(len(puntajes))
+    return (puntajes - minimo) / (maximo - minimo)
+
+# Función para fusionar los puntajes léxicos y semánticos de todos los candidatos a la vez
+def combinar_puntajes(lexicos, semanticos, metodo=FUSION, peso_semantico=PESO_SEMANTICO):
+    if metodo == 'rrf':
+        return (1 - peso_semantico) / (K_RRF + rangos(lexicos)) + peso_semantico / (K_RRF + rangos(semanticos))
+    if metodo == 'suma':
+        return (1 - peso_semantico) * escalar(lexicos) + peso_semantico * escalar(semanticos)
+    raise ValueError(f"Método de fusión desconocido: {metodo}")
+
+# Función para obtener el id del documento en el almacén de embeddings (los históricos no tienen extensión)
+def id_embedding(doc_id):
+    return doc_id if doc_id in ALMACEN_EMBEDDINGS else os.path.splitext(doc_id)[0]
 
 def run(query: str):
     """Función principal que procesa la consulta y devuelve los documentos relevantes."""
@@ -87,45 +155,39 @@ def run(query: str):
 
         # Obtener embedding de la consulta
         try:
-            embedding_consulta = obtener_embeddings(query, modelo, tokenizador)
+            embedding_consulta = obtener_embeddings(query)
         except Exception as e:
             raise RuntimeError(f"Error al obtener embeddings de la consulta: {str(e)}")
+        if not np.any(embedding_consulta):
+            return []
 
-        # Verificación del corpus
+        # Similitud semántica de todos los candidatos en un solo producto; se descartan los que no tienen embedding
         try:
-            corpus = [os.path.splitext(doc_id)[0] for doc_id in doc_ids if EMBEDDINGS_DICT.get(os.path.splitext(doc_id)[0]) is not None and EMBEDDINGS_DICT.get(os.path.splitext(doc_id)[0]).size > 0]
-            if not corpus:
+            similitudes = ALMACEN_EMBEDDINGS.similitudes([id_embedding(doc_id) for doc_id in doc_ids], embedding_consulta)
+            con_embedding = ~np.isnan(similitudes)
+            doc_ids = [doc_id for doc_id, valido in zip(doc_ids, con_embedding) if valido]
+            similitudes = similitudes[con_embedding]
+            if not doc_ids:
                 return []
         except Exception as e:
             raise RuntimeError(f"Error al procesar el corpus: {str(e)}")
 
-        # Calcular TF-IDF
+        # Puntaje TF-IDF de los candidatos desde la matriz precalculada (un solo corte de filas)
         try:
-            vectorizer, X, _ = calcular_tfidf(corpus, query)
+            matriz_tfidf = obtener_matriz_tfidf()
+            puntajes_tfidf = matriz_tfidf.puntuar(terms, doc_ids) if matriz_tfidf is not None else np.zeros(len(doc_ids), dtype=np.float32)
         except Exception as e:
             raise RuntimeError(f"Error al calcular TF-IDF: {str(e)}")
 
-        resultados = []
-        for i, doc_id in enumerate(doc_ids):
-            base_doc_id = os.path.splitext(doc_id)[0]
-            embedding_doc = EMBEDDINGS_DICT.get(base_doc_id)
-
-            if embedding_doc is not None and embedding_doc.size > 0:
-                try:
-                    if np.any(embedding_consulta) and np.any(embedding_doc):
-                        # Usar la similitud del coseno
-                        similitud = similitud_coseno(embedding_consulta, embedding_doc)
-                        tfidf_score = X[i].todense().tolist()
-                        resultados.append({
-                            '_id': doc_id,
-                            'similitud': similitud,
-                            'palabras_utilizadas': query,
-                            'tfidf_documento': tfidf_score
-                        })
-                except Exception as e:
-                    raise RuntimeError(f"Error al calcular similitud para {doc_id}: {str(e)}")
-
-        resultados_ordenados = sorted(resultados, key=lambda x: x['similitud'], reverse=True)
+        puntajes = combinar_puntajes(puntajes_tfidf, similitudes)
+        orden = np.argsort(-puntajes, kind='stable')
+        resultados_ordenados = [{
+            '_id': doc_ids[i],
+            'similitud': float(similitudes[i]),
+            'puntaje_tfidf': float(puntajes_tfidf[i]),
+            'puntaje': float(puntajes[i]),
+            'palabras_utilizadas': query
+        } for i in orden]
 
         # Imprimir los resultados para verificar antes de retornar
         print(f"Resultados ordenados: {resultados_ordenados}")
@@ -1,10 +1,22 @@
 import sys
 import json
-import numpy as np
-import math
-from collections import Counter
-import os
-from transformers import BertTokenizer, BertModel
+import queue
+import argparse
+from threading import Thread
+from almacen_embeddings import AlmacenEmbeddings
+from cache_consultas import leer_generacion
+from codificador_consultas import codificar_lote
+from modelos import CONSULTAS, obtener_modelo, verificar_modelo_almacen
+
+# Ranking de documentos por similitud de embeddings.
+# Modo de una consulta: `python ranking.py "consulta"` imprime todos los documentos
+# ordenados como un arreglo JSON.
+# Modo por lotes: `python ranking.py --lote consultas.jsonl` (o `--lote -` para stdin) lee
+# una consulta por línea ({"id": ..., "consulta": "..."} o un string JSON), codifica las
+# consultas en lotes, las puntúa contra la matriz con un solo producto matriz-matriz y
+# escribe por cada una una línea JSONL con sus `k` mejores documentos. El proceso queda
+# residente mientras haya entrada: el modelo y la matriz se cargan una sola vez (la matriz
+# se vuelve a mapear si el crawler agregó documentos).
 
 # Ruta de los archivos de documentos
 RUTA_DOCUMENTOS = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\decretos_2023_test'
@@ -12,39 +24,121 @@ RUTA_DOCUMENTOS = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzad
 # Ruta del archivo de embeddings precalculados
 RUTA_EMBEDDINGS = r'C:\Users\56974\Desktop\seminario 2024\codigos python avanzados\embeddings_avanzado_test.npy'
 
-if len(sys.argv) < 2:
-    print("Error: No se proporcionaron la consulta o la ruta de documentos.")
-    sys.exit(1)
+# Modo por lotes: tamaño del lote, resultados por consulta y espera para completar un lote
+TAMANO_LOTE = 32
+TOP_K = 10
+ESPERA_LOTE_MS = 50
+
+_FIN = object()
+
+
+# Función para leer las líneas de entrada en un hilo aparte (permite armar lotes con espera acotada)
+def leer_lineas(archivo, cola):
+    for linea in archivo:
+        if linea.strip():
+            cola.put(linea)
+    cola.put(_FIN)
+
+
+# Función para tomar un lote: espera la primera línea y completa hasta el tamaño o la espera máxima
+def tomar_lote(cola, tamano_lote):
+    lote = [cola.get()]
+    while lote[-1] is not _FIN and len(lote) < tamano_lote:
+        try:
+            lote.append(cola.get(timeout=ESPERA_LOTE_MS / 1000))
+        except queue.Empty:
+            break
+    return lote
+
+
+# Función para interpretar una línea de entrada como (id, consulta)
+def interpretar_linea(linea, numero):
+    dato = json.loads(linea)
+    if isinstance(dato, str):
+        return numero, dato
+    return dato.get("id", numero), dato["consulta"]
+
+
+class Ranking:
+    """Modelo de consultas y matriz de embeddings residentes para puntuar consultas en lote."""
+
+    def __init__(self, ruta_embeddings: str):
+        verificar_modelo_almacen(ruta_embeddings)
+        self.ruta_embeddings = ruta_embeddings
+        self.tokenizador, self.modelo = obtener_modelo(CONSULTAS)
+        self.almacen = AlmacenEmbeddings(ruta_embeddings)
+        self.generacion = leer_generacion(self.almacen.ruta_matriz)
+
+    def _almacen_vigente(self):
+        generacion = leer_generacion(self.almacen.ruta_matriz)
+        if generacion != self.generacion:
+            self.almacen = AlmacenEmbeddings(self.ruta_embeddings)
+            self.generacion = generacion
+        return self.almacen
+
+    def puntuar(self, consultas, k):
+        """Los `k` mejores (doc_id, similitud) de cada consulta."""
+        embeddings = codificar_lote(self.modelo, self.tokenizador, consultas)
+        return self._almacen_vigente().buscar_lote(embeddings, k)
 
-query = sys.argv[1]
 
-# Función para obtener embeddings de BERT
-def obtener_embeddings(texto, modelo, tokenizador):
-    inputs = tokenizador(texto, return_tensors='pt', truncation=True, padding=True)
-    outputs = modelo(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).detach().numpy()
+# Función para procesar consultas en lote y escribir los resultados en JSONL a medida que se obtienen
+def procesar_lotes(ranking, entrada, salida, k=TOP_K, tamano_lote=TAMANO_LOTE):
+    cola = queue.Queue(maxsize=tamano_lote * 4)
+    Thread(target=leer_lineas, args=(entrada, cola), daemon=True).start()
+    numero = 0
+    while True:
+        lote = tomar_lote(cola, tamano_lote)
+        terminado = lote[-1] is _FIN
+        consultas = []
+        for linea in lote:
+            if linea is _FIN:
+                continue
+            try:
+                consultas.append(interpretar_linea(linea, numero))
+            except (ValueError, KeyError, AttributeError) as e:
+                salida.write(json.dumps({"id": numero, "error": f"Línea inválida: {e}"}, ensure_ascii=False) + "\n")
+            numero += 1
+        if consultas:
+            resultados = ranking.puntuar([consulta for _, consulta in consultas], k)
+            for (id_consulta, consulta), mejores in zip(consultas, resultados):
+                salida.write(json.dumps({
+                    "id": id_consulta,
+                    "consulta": consulta,
+                    "resultados": [{'_id': doc_id, 'similitud': similitud} for doc_id, similitud in mejores]
+                }, ensure_ascii=False) + "\n")
+        salida.flush()
+        if terminado:
+            return
 
-# Inicializar BERT
-tokenizador = BertTokenizer.from_pretrained('bert-base-uncased')
-modelo = BertModel.from_pretrained('bert-base-uncased')
 
-try:
-    # Cargar los embeddings precalculados
-    embeddings_dict = np.load(RUTA_EMBEDDINGS, allow_pickle=True).item()
+def main():
+    parser = argparse.ArgumentParser(description="Ranking de documentos por similitud de embeddings.")
+    parser.add_argument("consulta", nargs="?", help="Consulta única (imprime todos los documentos ordenados)")
+    parser.add_argument("--lote", metavar="ARCHIVO", help="Archivo JSONL con una consulta por línea, o '-' para stdin")
+    parser.add_argument("--k", type=int, default=TOP_K, help="Resultados por consulta en el modo por lotes")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE, help="Consultas codificadas por pasada")
+    args = parser.parse_args()
 
-    # Obtener embedding de la consulta
-    embedding_consulta = obtener_embeddings(query, modelo, tokenizador)
+    if args.consulta is None and args.lote is None:
+        print("Error: No se proporcionaron la consulta o la ruta de documentos.")
+        sys.exit(1)
 
-    # Calcular similitudes
-    resultados = []
-    for doc_id, embedding_doc in embeddings_dict.items():
-        similitud = (embedding_consulta @ embedding_doc.T).flatten()[0]
-        resultados.append({'_id': doc_id, 'similitud': float(similitud)})
+    try:
+        ranking = Ranking(RUTA_EMBEDDINGS)
+        if args.lote is None:
+            # Calcular similitudes con un solo producto matriz-vector, ordenadas de mayor a menor
+            mejores = ranking.puntuar([args.consulta], len(ranking.almacen))[0]
+            print(json.dumps([{'_id': doc_id, 'similitud': similitud} for doc_id, similitud in mejores]))
+        elif args.lote == '-':
+            procesar_lotes(ranking, sys.stdin, sys.stdout, args.k, args.tamano_lote)
+        else:
+            with open(args.lote, 'r', encoding='utf-8') as entrada:
+                procesar_lotes(ranking, entrada, sys.stdout, args.k, args.tamano_lote)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
 
-    # Ordenar por similitud
-    resultados_ordenados = sorted(resultados, key=lambda x: x['similitud'], reverse=True)
-    print(json.dumps(resultados_ordenados))
 
-except Exception as e:
-    print(f"Error: {e}", file=sys.stderr)
-    sys.exit(1)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,572 @@
+import mmap
+import os
+import re
+import struct
+import time
+
+# Formato binario del segmento del índice invertido:
+#
+#   cabecera | registros de términos | cadenas de términos | postings | registros de documentos | cadenas de documentos
+#
+# Los términos se guardan ordenados por sus bytes UTF-8, de modo que la búsqueda de un
+# término es una búsqueda binaria sobre el archivo mapeado en memoria y solo toca las
+# páginas que necesita. Cada lista de postings es una secuencia de pares varint
+# (delta del id entero del documento, tf cuantizado). Los metadatos de cada documento
+# (nombre, número de norma, fecha, estado y longitud) se guardan una sola vez en la
+# tabla de documentos en lugar de repetirse en cada posting.
+#
+# Índice posicional opcional, en un archivo `.pos` alineado con el segmento (el registro i
+# corresponde al término i del diccionario):
+#
+#   cabecera | desplazamiento de cada bloque (n_terminos + 1) | bloques
+#
+# El bloque de un término tiene df + 1 desplazamientos uint32 seguidos de las listas de
+# posiciones de cada posting, en el mismo orden que sus postings, con deltas varint. Los
+# desplazamientos permiten leer solo las posiciones de los documentos que interesan. Las
+# posiciones cuentan los términos del documento después del analizador (sin palabras vacías).
+#
+# Generaciones: cada escritura crea archivos nuevos `<base>.<n>.seg` y `<base>.<n>.pos` y luego
+# apunta a ellos con un archivo de texto pequeño (`<base>.seg.actual`) que los lectores solo
+# abren para leerlo. Así nunca se reemplaza un archivo que otro lector tiene mapeado (en
+# Windows os.replace falla sobre un archivo abierto o mapeado). Las generaciones anteriores
+# a la previa se eliminan en cada escritura; las que siguen mapeadas se reintentan en la próxima.
+
+MAGIA = b'BSEG'
+VERSION = 1
+CABECERA = struct.Struct('<4sHHIIQQQQQ')
+REGISTRO_TERMINO = struct.Struct('<IHQII')  # off. cadena, largo cadena, off. postings, df, último doc
+REGISTRO_DOCUMENTO = struct.Struct('<QII')  # off. cadena, largo cadena, longitud del documento
+SEPARADOR = '\x1f'
+MAGIA_POSICIONES = b'BPOS'
+CABECERA_POSICIONES = struct.Struct('<4sHHII')  # magia, versión, reservado, n_terminos, n_documentos
+TF_ESCALA = 65535  # El tf (fracción entre 0 y 1) se cuantiza a 16 bits
+_GENERACION = re.compile(r'\.(\d{6})\.(seg|pos)$')
+INTENTOS_REEMPLAZO = 20
+ESPERA_REEMPLAZO = 0.05
+
+
+def ruta_segmento(ruta_indice):
+    """Ruta del segmento binario asociado a la ruta del índice (.json histórico)."""
+    return os.path.splitext(ruta_indice)[0] + '.seg'
+
+
+def ruta_posiciones(ruta_segmento):
+    """Ruta del índice posicional asociado a (el archivo de datos de) un segmento."""
+    return os.path.splitext(ruta_segmento)[0] + '.pos'
+
+
+def ruta_puntero(ruta):
+    """Ruta del archivo que indica la generación vigente del segmento."""
+    return ruta + '.actual'
+
+
+def ruta_generacion(ruta, generacion):
+    """Archivo de datos de la generación `generacion` del segmento."""
+    return f"{os.path.splitext(ruta)[0]}.{generacion:06d}.seg"
+
+
+def ruta_vigente(ruta):
+    """
+    Archivo de datos de la generación vigente del segmento, `ruta` si es un segmento anterior a
+    las generaciones, o None si no existe. Cambia con cada escritura: sirve como versión.
+    """
+    try:
+        with open(ruta_puntero(ruta), 'r', encoding='utf-8') as archivo:
+            return os.path.join(os.path.dirname(ruta), archivo.read().strip())
+    except FileNotFoundError:
+        return ruta if os.path.exists(ruta) else None
+
+
+def existe_segmento(ruta):
+    """Indica si el segmento tiene alguna generación escrita."""
+    return ruta_vigente(ruta) is not None
+
+
+def _numero_generacion(ruta_datos):
+    coincidencia = _GENERACION.search(ruta_datos or '')
+    return int(coincidencia.group(1)) if coincidencia else 0
+
+
+def _reemplazar(origen, destino):
+    """os.replace con reintentos breves (en Windows falla mientras un lector tiene abierto el destino)."""
+    for intento in range(INTENTOS_REEMPLAZO):
+        try:
+            os.replace(origen, destino)
+            return
+        except PermissionError:
+            if intento == INTENTOS_REEMPLAZO - 1:
+                raise
+            time.sleep(ESPERA_REEMPLAZO)
+
+
+def _limpiar_generaciones(ruta, generacion):
+    """Eliminar las generaciones anteriores a la previa (las que un lector tiene mapeadas quedan para la próxima vez)."""
+    directorio = os.path.dirname(ruta) or '.'
+    base = os.path.basename(os.path.splitext(ruta)[0])
+    candidatas = []
+    for nombre in os.listdir(directorio):
+        coincidencia = _GENERACION.search(nombre)
+        if coincidencia and nombre[:coincidencia.start()] == base and int(coincidencia.group(1)) < generacion - 1:
+            candidatas.append(os.path.join(directorio, nombre))
+    if generacion > 1:
+        # Segmento anterior a las generaciones
+        candidatas.extend(candidata for candidata in (ruta, ruta_posiciones(ruta)) if os.path.exists(candidata))
+    for candidata in candidatas:
+        try:
+            os.remove(candidata)
+        except OSError:
+            pass
+
+
+def cuantizar_tf(tf):
+    """Cuantizar un tf en [0, 1] a un entero de 16 bits (nunca 0 si el término aparece)."""
+    return min(TF_ESCALA, max(1, int(round(tf * TF_ESCALA))))
+
+
+def codificar_varint(valor, salida):
+    """Agregar un entero no negativo codificado como varint a un bytearray."""
+    while valor >= 0x80:
+        salida.append((valor & 0x7F) | 0x80)
+        valor >>= 7
+    salida.append(valor)
+
+
+def codificar_postings(postings, base=0):
+    """Codificar pares (doc_id, tf cuantizado) ordenados por doc_id con deltas varint."""
+    salida = bytearray()
+    anterior = base
+    for doc_id, tf_q in postings:
+        codificar_varint(doc_id - anterior, salida)
+        codificar_varint(tf_q, salida)
+        anterior = doc_id
+    return salida
+
+
+def decodificar_postings(datos, cantidad):
+    """Decodificar `cantidad` pares (doc_id, tf cuantizado) desde bytes."""
+    resultado = []
+    pos = 0
+    doc_id = 0
+    for _ in range(cantidad):
+        delta = 0
+        desplazamiento = 0
+        while True:
+            byte = datos[pos]
+            pos += 1
+            delta |= (byte & 0x7F) << desplazamiento
+            if byte < 0x80:
+                break
+            desplazamiento += 7
+        tf_q = 0
+        desplazamiento = 0
+        while True:
+            byte = datos[pos]
+            pos += 1
+            tf_q |= (byte & 0x7F) << desplazamiento
+            if byte < 0x80:
+                break
+            desplazamiento += 7
+        doc_id += delta
+        resultado.append((doc_id, tf_q))
+    return resultado
+
+
+def decodificar_varints(datos):
+    """Decodificar todos los varints de `datos` como una lista de enteros."""
+    resultado = []
+    valor = 0
+    desplazamiento = 0
+    for byte in datos:
+        valor |= (byte & 0x7F) << desplazamiento
+        if byte < 0x80:
+            resultado.append(valor)
+            valor = 0
+            desplazamiento = 0
+        else:
+            desplazamiento += 7
+    return resultado
+
+
+def _listas_posiciones(listas):
+    """Desplazamientos relativos (df + 1) y bytes de las listas de posiciones con deltas varint."""
+    datos = bytearray()
+    desplazamientos = [0]
+    for posiciones in listas:
+        anterior = 0
+        for posicion in posiciones:
+            codificar_varint(posicion - anterior, datos)
+            anterior = posicion
+        desplazamientos.append(len(datos))
+    return desplazamientos, bytes(datos)
+
+
+def _armar_bloque(desplazamientos, datos):
+    """Bloque con los desplazamientos medidos desde el inicio del bloque, seguidos de los datos."""
+    cabecera = 4 * len(desplazamientos)
+    return struct.pack(f'<{len(desplazamientos)}I', *(cabecera + d for d in desplazamientos)) + datos
+
+
+def codificar_bloque_posiciones(listas):
+    """Bloque de posiciones de un término: df + 1 desplazamientos uint32 y las listas con deltas varint."""
+    return _armar_bloque(*_listas_posiciones(listas))
+
+
+def _extender_bloque_posiciones(bloque, df, listas):
+    """Agregar listas de posiciones al final del bloque existente de un término con `df` postings."""
+    cabecera = 4 * (df + 1)
+    desplazamientos = [d - cabecera for d in struct.unpack_from(f'<{df + 1}I', bloque, 0)] if bloque else [0]
+    nuevos, datos = _listas_posiciones(listas)
+    total = desplazamientos[-1]
+    desplazamientos.extend(total + d for d in nuevos[1:])
+    return _armar_bloque(desplazamientos, bytes(bloque[cabecera:]) + datos)
+
+
+def _escribir_posiciones(ruta, bloques, n_documentos):
+    """Escribir el índice posicional (un bloque por término, en el orden del segmento) de forma atómica."""
+    ruta_temporal = ruta + '.tmp'
+    with open(ruta_temporal, 'wb') as archivo:
+        archivo.write(CABECERA_POSICIONES.pack(MAGIA_POSICIONES, VERSION, 0, len(bloques), n_documentos))
+        desplazamiento = CABECERA_POSICIONES.size + 8 * (len(bloques) + 1)
+        for bloque in bloques:
+            archivo.write(struct.pack('<Q', desplazamiento))
+            desplazamiento += len(bloque)
+        archivo.write(struct.pack('<Q', desplazamiento))
+        for bloque in bloques:
+            archivo.write(bloque)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(ruta_temporal, ruta)
+
+
+def _codificar_documento(metadatos):
+    """Serializar los metadatos de un documento como una cadena UTF-8."""
+    campos = [metadatos.get('documento'), metadatos.get('numero_norma'), metadatos.get('fecha'), metadatos.get('estado')]
+    return SEPARADOR.join('' if campo is None else str(campo) for campo in campos).encode('utf-8')
+
+
+def _escribir(ruta, terminos, documentos, bloques_posiciones=None):
+    """
+    Escribir un segmento completo como una generación nueva.
+    `terminos` es una lista ordenada de (término en bytes, postings codificados, df, último doc_id)
+    y `documentos` una lista de (cadena de metadatos en bytes, longitud) indexada por doc_id.
+    `bloques_posiciones`, si se indica, tiene el bloque de posiciones de cada término; si no,
+    la generación nueva no tiene índice posicional.
+    Los archivos de la generación se escriben completos antes de apuntar a ellos, así un lector
+    nunca ve un segmento a medio escribir ni uno que no corresponda a sus posiciones.
+    """
+    generacion = _numero_generacion(ruta_vigente(ruta)) + 1
+    ruta_datos = ruta_generacion(ruta, generacion)
+    if bloques_posiciones is not None:
+        _escribir_posiciones(ruta_posiciones(ruta_datos), bloques_posiciones, len(documentos))
+
+    n_terminos = len(terminos)
+    n_docs = len(documentos)
+    off_reg_terminos = CABECERA.size
+    off_cad_terminos = off_reg_terminos + n_terminos * REGISTRO_TERMINO.size
+    off_postings = off_cad_terminos + sum(len(t[0]) for t in terminos)
+    off_reg_docs = off_postings + sum(len(t[1]) for t in terminos)
+    off_cad_docs = off_reg_docs + n_docs * REGISTRO_DOCUMENTO.size
+
+    ruta_temporal = ruta_datos + '.tmp'
+    with open(ruta_temporal, 'wb') as archivo:
+        archivo.write(CABECERA.pack(MAGIA, VERSION, 0, n_terminos, n_docs, off_reg_terminos,
+                                    off_cad_terminos, off_postings, off_reg_docs, off_cad_docs))
+        off_cadena = 0
+        off_posting = off_postings
+        for termino, postings, df, ultimo in terminos:
+            archivo.write(REGISTRO_TERMINO.pack(off_cadena, len(termino), off_posting, df, ultimo))
+            off_cadena += len(termino)
+            off_posting += len(postings)
+        for termino, _, _, _ in terminos:
+            archivo.write(termino)
+        for _, postings, _, _ in terminos:
+            archivo.write(postings)
+        off_cadena = 0
+        for cadena, longitud in documentos:
+            archivo.write(REGISTRO_DOCUMENTO.pack(off_cadena, len(cadena), longitud))
+            off_cadena += len(cadena)
+        for cadena, _ in documentos:
+            archivo.write(cadena)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(ruta_temporal, ruta_datos)
+
+    ruta_temporal = ruta_puntero(ruta) + '.tmp'
+    with open(ruta_temporal, 'w', encoding='utf-8') as archivo:
+        archivo.write(os.path.basename(ruta_datos))
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    _reemplazar(ruta_temporal, ruta_puntero(ruta))
+    _limpiar_generaciones(ruta, generacion)
+
+
+def escribir_segmento(ruta, indice_invertido, longitudes=None, posiciones=None):
+    """
+    Escribir un índice invertido en memoria (término -> lista de postings) como segmento binario.
+    `posiciones` ({documento: {término: [posiciones]}}) genera además el índice posicional.
+    """
+    longitudes = longitudes or {}
+    metadatos = {}
+    for entradas in indice_invertido.values():
+        for entrada in entradas:
+            metadatos.setdefault(entrada['documento'], entrada)
+
+    nombres = sorted(metadatos)
+    ids = {nombre: doc_id for doc_id, nombre in enumerate(nombres)}
+    documentos = [(_codificar_documento(metadatos[nombre]), longitudes.get(nombre, 0)) for nombre in nombres]
+
+    terminos = []
+    for termino, entradas in indice_invertido.items():
+        if not entradas:
+            continue
+        postings = sorted((ids[e['documento']], cuantizar_tf(e['tf'])) for e in entradas)
+        bloque = None
+        if posiciones is not None:
+            bloque = codificar_bloque_posiciones([posiciones.get(nombres[doc_id], {}).get(termino, []) for doc_id, _ in postings])
+        terminos.append((termino.encode('utf-8'), codificar_postings(postings), len(postings), postings[-1][0], bloque))
+    terminos.sort(key=lambda t: t[0])
+
+    bloques = [t[4] for t in terminos] if posiciones is not None else None
+    _escribir(ruta, [t[:4] for t in terminos], documentos, bloques)
+
+
+def fusionar_segmento(ruta, documentos_nuevos, postings_nuevos, posiciones_nuevas=None):
+    """
+    Agregar un lote de documentos a un segmento existente (o crearlo) con una sola escritura.
+    `documentos_nuevos` es una lista de (metadatos, longitud); sus doc_id son consecutivos a los
+    del segmento base. `postings_nuevos` asocia cada término a su lista de (doc_id, tf) ordenada.
+    `posiciones_nuevas` asocia cada término a las listas de posiciones de esos mismos postings;
+    el índice posicional se mantiene solo si el segmento base también lo tiene (o no existe).
+    Las listas de postings y los bloques de posiciones del segmento base se copian sin decodificar.
+    """
+    terminos_base = []
+    bloques_base = None
+    documentos = []
+    if existe_segmento(ruta):
+        with SegmentoIndice(ruta) as base:
+            terminos_base = [base.entrada_cruda(i) for i in range(base.n_terminos)]
+            documentos = [base.documento_crudo(doc_id) for doc_id in range(base.n_documentos)]
+            posicional = PosicionesSegmento.abrir(base) if posiciones_nuevas is not None else None
+            if posicional is not None:
+                with posicional:
+                    bloques_base = [posicional.bloque_crudo(i) for i in range(base.n_terminos)]
+            elif base.n_documentos:
+                posiciones_nuevas = None
+    documentos.extend((_codificar_documento(metadatos), longitud) for metadatos, longitud in documentos_nuevos)
+    if posiciones_nuevas is not None and bloques_base is None:
+        bloques_base = [b''] * len(terminos_base)
+
+    nuevos = sorted((termino.encode('utf-8'), [(doc_id, cuantizar_tf(tf)) for doc_id, tf in postings], termino)
+                    for termino, postings in postings_nuevos.items() if postings)
+    terminos = []
+    bloques = [] if posiciones_nuevas is not None else None
+    i = j = 0
+    while i < len(terminos_base) or j < len(nuevos):
+        if j == len(nuevos) or (i < len(terminos_base) and terminos_base[i][0] < nuevos[j][0]):
+            terminos.append(terminos_base[i])
+            if bloques is not None:
+                bloques.append(bloques_base[i])
+            i += 1
+        elif i == len(terminos_base) or nuevos[j][0] < terminos_base[i][0]:
+            termino, postings, texto = nuevos[j]
+            terminos.append((termino, codificar_postings(postings), len(postings), postings[-1][0]))
+            if bloques is not None:
+                bloques.append(codificar_bloque_posiciones(posiciones_nuevas[texto]))
+            j += 1
+        else:
+            termino, crudos, df, ultimo = terminos_base[i]
+            postings, texto = nuevos[j][1], nuevos[j][2]
+            terminos.append((termino, bytes(crudos) + codificar_postings(postings, base=ultimo), df + len(postings), postings[-1][0]))
+            if bloques is not None:
+                bloques.append(_extender_bloque_posiciones(bloques_base[i], df, posiciones_nuevas[texto]))
+            i += 1
+            j += 1
+
+    _escribir(ruta, terminos, documentos, bloques)
+
+
+class SegmentoIndice:
+    """Lector de la generación vigente de un segmento binario del índice invertido, abierta con mmap."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.ruta_datos = ruta_vigente(ruta) or ruta
+        self._archivo = open(self.ruta_datos, 'rb')
+        self._mm = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        (magia, version, _, self.n_terminos, self.n_documentos, self._off_reg_terminos,
+         self._off_cad_terminos, self._off_postings, self._off_reg_docs, self._off_cad_docs) = CABECERA.unpack_from(self._mm, 0)
+        if magia != MAGIA or version != VERSION:
+            self.cerrar()
+            raise ValueError(f"El archivo {ruta} no es un segmento de índice válido (versión {VERSION}).")
+
+    def __len__(self):
+        return self.n_terminos
+
+    def __contains__(self, termino):
+        return self.buscar(termino) >= 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+
+    def cerrar(self):
+        """Liberar el mapeo y el archivo."""
+        self._mm.close()
+        self._archivo.close()
+
+    def _registro(self, i):
+        return REGISTRO_TERMINO.unpack_from(self._mm, self._off_reg_terminos + i * REGISTRO_TERMINO.size)
+
+    def _termino_bytes(self, i):
+        off_cadena, largo, _, _, _ = self._registro(i)
+        inicio = self._off_cad_terminos + off_cadena
+        return self._mm[inicio:inicio + largo]
+
+    def termino(self, i):
+        """Término en la posición `i` del diccionario ordenado."""
+        return self._termino_bytes(i).decode('utf-8')
+
+    def buscar(self, termino):
+        """Posición del término en el diccionario o -1 si no existe (búsqueda binaria)."""
+        clave = termino.encode('utf-8')
+        bajo, alto = 0, self.n_terminos
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._termino_bytes(medio) < clave:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < self.n_terminos and self._termino_bytes(bajo) == clave:
+            return bajo
+        return -1
+
+    def _postings_crudos(self, i):
+        """Bytes codificados de la lista de postings del término `i`."""
+        _, _, inicio, _, _ = self._registro(i)
+        fin = self._registro(i + 1)[2] if i + 1 < self.n_terminos else self._off_reg_docs
+        return self._mm[inicio:fin]
+
+    def entrada_cruda(self, i):
+        """Tupla (término en bytes, postings codificados, df, último doc_id) del término `i`."""
+        _, _, _, df, ultimo = self._registro(i)
+        return self._termino_bytes(i), self._postings_crudos(i), df, ultimo
+
+    def df(self, termino):
+        """Cantidad de documentos que contienen el término."""
+        i = self.buscar(termino)
+        return self.df_por_posicion(i) if i >= 0 else 0
+
+    def df_por_posicion(self, i):
+        """Cantidad de documentos que contienen el término en la posición `i`."""
+        return self._registro(i)[3]
+
+    def postings_por_posicion(self, i):
+        """Lista de (doc_id, tf) del término en la posición `i`."""
+        df = self._registro(i)[3]
+        return [(doc_id, tf_q / TF_ESCALA) for doc_id, tf_q in decodificar_postings(self._postings_crudos(i), df)]
+
+    def postings(self, termino):
+        """Lista de (doc_id, tf) del término, vacía si no existe."""
+        i = self.buscar(termino)
+        return self.postings_por_posicion(i) if i >= 0 else []
+
+    def documento_crudo(self, doc_id):
+        """Tupla (metadatos serializados, longitud) del documento `doc_id`."""
+        off_cadena, largo, longitud = REGISTRO_DOCUMENTO.unpack_from(self._mm, self._off_reg_docs + doc_id * REGISTRO_DOCUMENTO.size)
+        inicio = self._off_cad_docs + off_cadena
+        return self._mm[inicio:inicio + largo], longitud
+
+    def documento(self, doc_id):
+        """Metadatos del documento con id entero `doc_id`."""
+        cadena, longitud = self.documento_crudo(doc_id)
+        documento, numero_norma, fecha, estado = cadena.decode('utf-8').split(SEPARADOR)
+        return {
+            "documento": documento,
+            "numero_norma": numero_norma or None,
+            "fecha": fecha or None,
+            "estado": estado or None,
+            "longitud": longitud
+        }
+
+    def nombres_documentos(self):
+        """Lista de nombres de documento indexada por doc_id."""
+        return [bytes(self.documento_crudo(doc_id)[0]).split(SEPARADOR.encode('utf-8'), 1)[0].decode('utf-8')
+                for doc_id in range(self.n_documentos)]
+
+    def terminos(self):
+        """Iterar los términos en orden."""
+        for i in range(self.n_terminos):
+            yield self.termino(i)
+
+    def como_diccionario(self):
+        """Reconstruir el índice en el formato histórico de diccionario (término -> postings)."""
+        documentos = [self.documento(doc_id) for doc_id in range(self.n_documentos)]
+        indice_invertido = {}
+        for i in range(self.n_terminos):
+            entradas = []
+            for doc_id, tf in self.postings_por_posicion(i):
+                meta = documentos[doc_id]
+                entradas.append({
+                    "documento": meta["documento"],
+                    "numero_norma": meta["numero_norma"],
+                    "tf": tf,
+                    "fecha": meta["fecha"],
+                    "estado": meta["estado"]
+                })
+            indice_invertido[self.termino(i)] = entradas
+        return indice_invertido
+
+
+class PosicionesSegmento:
+    """Lector del índice posicional de un segmento, abierto con mmap."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._archivo = open(ruta, 'rb')
+        self._mm = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, version, _, self.n_terminos, self.n_documentos = CABECERA_POSICIONES.unpack_from(self._mm, 0)
+        if magia != MAGIA_POSICIONES or version != VERSION:
+            self.cerrar()
+            raise ValueError(f"El archivo {ruta} no es un índice posicional válido (versión {VERSION}).")
+
+    @classmethod
+    def abrir(cls, segmento):
+        """Índice posicional alineado con el segmento, o None si no existe o corresponde a otra versión."""
+        ruta = ruta_posiciones(segmento.ruta_datos)
+        if not os.path.exists(ruta):
+            return None
+        posicional = cls(ruta)
+        if (posicional.n_terminos, posicional.n_documentos) != (segmento.n_terminos, segmento.n_documentos):
+            posicional.cerrar()
+            return None
+        return posicional
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+
+    def cerrar(self):
+        """Liberar el mapeo y el archivo."""
+        self._mm.close()
+        self._archivo.close()
+
+    def _limites(self, i):
+        return struct.unpack_from('<QQ', self._mm, CABECERA_POSICIONES.size + 8 * i)
+
+    def bloque_crudo(self, i):
+        """Bytes del bloque de posiciones del término `i`."""
+        inicio, fin = self._limites(i)
+        return self._mm[inicio:fin]
+
+    def posiciones(self, i, j):
+        """Posiciones (ordenadas) del término `i` en su posting número `j`."""
+        inicio = self._limites(i)[0]
+        desde, hasta = struct.unpack_from('<II', self._mm, inicio + 4 * j)
+        resultado = decodificar_varints(self._mm[inicio + desde:inicio + hasta])
+        for k in range(1, len(resultado)):
+            resultado[k] += resultado[k - 1]
+        return resultado